@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# Copyright (C) 2013  Jamie Duncan (jduncan@redhat.com)
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# File Name : bench_suite.py
+# Purpose : time soscleaner runs on synthetic sosreports at several scales
+#
+# Each point of a sweep generates a report with gen_sosreport.py, cleans it
+# with scripts/soscleaner --profile and reads the stage times back from the
+# -profile.json report. Results are appended to a JSON file under a label,
+# so runs from before and after a change can be printed side by side:
+#
+#   bench_suite.py -L before --sweep keywords=10,100,1000
+#   (apply the change)
+#   bench_suite.py -L after --sweep keywords=10,100,1000
+#   bench_suite.py --compare
+#
+# soscleaner has to run as root, and so does this.
+
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from gen_sosreport import DEFAULTS, generate, make_tarball
+
+SCRIPT = os.path.join(HERE, '..', 'scripts', 'soscleaner')
+MODULE_DIR = os.path.join(HERE, '..', 'soscleaner')
+
+# the sweeps run when none is given on the command line
+SWEEPS = {
+    'files': [10, 50, 200],
+    'keywords': [10, 100, 1000],
+    'users': [10, 100, 1000],
+    'ips': [100, 1000, 10000],
+}
+
+
+def parse_settings(text):
+    """Parses 'key=value,key=value' into a dict of DEFAULTS settings"""
+    settings = dict()
+    for item in filter(None, text.split(',')):
+        key, value = item.split('=')
+        if key not in DEFAULTS:
+            raise ValueError("unknown setting %s" % key)
+        settings[key] = int(value)
+    return settings
+
+
+def run_point(settings, workers, extra_args):
+    """Generates one report, cleans it and returns the result record"""
+    work = tempfile.mkdtemp(prefix='soscleaner-bench-')
+    try:
+        report = os.path.join(work, 'sosreport-bench')
+        keywords_file = generate(report, **settings)
+        tarball = make_tarball(report)
+        out = os.path.join(work, 'out')
+        os.makedirs(out)
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [MODULE_DIR, env.get('PYTHONPATH')]))
+        cmd = [sys.executable, SCRIPT, '-q', '--profile', '-o', out, '-K', keywords_file,
+               '-w', str(workers)] + extra_args + [tarball]
+        start = time.time()
+        subprocess.check_call(cmd, env=env, stdout=open(os.devnull, 'w'))
+        wall = time.time() - start
+        profile = json.load(open(glob.glob(os.path.join(out, '*', '*-profile.json'))[0]))
+        size = 0
+        for root, dirs, files in os.walk(report):
+            size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        return {
+            'settings': settings,
+            'workers': workers,
+            'bytes': size,
+            'lines': profile['lines'],
+            'wall': wall,
+            'stages': dict((s['stage'], s['wall']) for s in profile['stages']),
+            'cpu': sum(s['cpu'] for s in profile['stages']),
+            'passes': dict((name, p['wall']) for name, p in profile['passes'].items()),
+        }
+    finally:
+        shutil.rmtree(work)
+
+
+def print_results(results, sweep=None):
+    """Prints one row per result: the swept setting, total time, the main
+    stages and the cleaning cost per line"""
+    print("%-10s %-22s %8s %8s %8s %8s %8s %8s %10s" % (
+        'label', 'point', 'MiB', 'total s', 'extract', 'clean', 'archive', 'cpu s', 'clean us/ln'))
+    for r in results:
+        point = ','.join('%s=%s' % (k, r['settings'][k]) for k in sorted(r['settings'])
+                         if sweep is None or k == sweep) or 'base'
+        lines = max(r['lines'], 1)
+        print("%-10s %-22s %8.1f %8.2f %8.2f %8.2f %8.2f %8.2f %10.1f" % (
+            r.get('label', ''), point, r['bytes'] / 1048576.0, r['wall'],
+            r['stages'].get('extract', 0) + r['stages'].get('copy', 0), r['stages'].get('clean', 0),
+            r['stages'].get('archive', 0), r['cpu'], r['stages'].get('clean', 0) / lines * 1e6))
+
+
+def main():
+    parser = OptionParser(usage="%prog <OPTIONS>")
+    parser.add_option("-s", "--sweep", action="append", default=[], dest="sweeps",
+                      help="setting to vary and its values, e.g. keywords=10,100,1000. "
+                           "use multiple times for multiple sweeps (default = %s)" % ', '.join(sorted(SWEEPS)),
+                      metavar="SETTING=VALUES")
+    parser.add_option("-b", "--base", action="store", default="", dest="base",
+                      help="settings of every report, e.g. files=20,size=65536 (see gen_sosreport.py)",
+                      metavar="SETTINGS")
+    parser.add_option("-w", "--workers", action="store", type="int", default=1, dest="workers",
+                      help="soscleaner --workers (default = 1)", metavar="WORKERS")
+    parser.add_option("-a", "--args", action="store", default="", dest="args",
+                      help="more soscleaner options, e.g. '-z xz'", metavar="ARGS")
+    parser.add_option("-L", "--label", action="store", default="current", dest="label",
+                      help="name the results are stored under (default = current)", metavar="LABEL")
+    parser.add_option("-r", "--results", action="store", default=os.path.join(HERE, 'results.json'),
+                      dest="results", help="results file (default = benchmarks/results.json)",
+                      metavar="FILE")
+    parser.add_option("-c", "--compare", action="store_true", default=False, dest="compare",
+                      help="only print the stored results, grouped by sweep")
+    (options, args) = parser.parse_args()
+
+    stored = list()
+    if os.path.exists(options.results):
+        stored = json.load(open(options.results))
+
+    if not options.compare:
+        base = parse_settings(options.base)
+        sweeps = list()
+        for sweep in options.sweeps:
+            key, values = sweep.split('=')
+            sweeps.append((key, [int(v) for v in values.split(',')]))
+        if not sweeps:
+            sweeps = sorted(SWEEPS.items())
+        for key, values in sweeps:
+            for value in values:
+                settings = dict(base)
+                settings[key] = value
+                result = run_point(settings, options.workers, options.args.split())
+                result['label'] = options.label
+                result['sweep'] = key
+                stored = [r for r in stored if not (
+                    r.get('label') == options.label and r['settings'] == settings and
+                    r['workers'] == options.workers)]
+                stored.append(result)
+                print_results([result], key)
+                with open(options.results, 'w') as fh:
+                    json.dump(stored, fh, indent=2)
+
+    print('')
+    for key in sorted(set(r.get('sweep') for r in stored)):
+        print("*** %s ***" % key)
+        rows = [r for r in stored if r.get('sweep') == key]
+        rows.sort(key=lambda r: (r['settings'][key], r['workers'], r.get('label')))
+        print_results(rows, key)
+
+
+if __name__ == '__main__':
+    main()
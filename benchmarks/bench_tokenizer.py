@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# Copyright (C) 2013  Jamie Duncan (jduncan@redhat.com)
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# File Name : bench_tokenizer.py
+# Purpose : time _clean_line with the single-pass tokenizer against the _sub_* chain
+
+import os
+import random
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'soscleaner'))
+from soscleaner import SOSCleaner
+
+TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'testdata', 'sosreport_dir')
+
+
+def make_cleaner(tokenizer, macs):
+    cleaner = SOSCleaner(quiet=True)
+    cleaner._start_logging(os.devnull)
+    cleaner.tokenizer = tokenizer
+    cleaner.obfuscate_macs = macs
+    cleaner.hostname = 'myhost'
+    cleaner.domains.extend(['myserver.com', 'example.com'])
+    cleaner._add_loopback_network()
+    cleaner._ip4_add_network('10.0.0.0/8')
+    cleaner._ip4_add_network('192.168.0.0/16')
+    cleaner._domains2db()
+    return cleaner
+
+
+def make_lines(count):
+    lines = []
+    for i in range(count):
+        lines.append("Jun 24 21:06:%02d myhost sshd[%s]: Accepted publickey for root from 10.0.%s.%s port 22\n" % (
+            i % 60, 1000 + i, i % 4, i % 250))
+        lines.append("Jun 24 21:06:%02d myhost kernel: nfs: server nas%s.myserver.com not responding\n" % (
+            i % 60, i % 16))
+        lines.append("Jun 24 21:06:%02d myhost systemd[1]: Started Session %s of user root.\n" % (i % 60, i))
+    return lines
+
+
+def read_lines(paths):
+    lines = []
+    for path in paths:
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                fh = open(os.path.join(root, name), 'r', errors='replace')
+                lines.extend(fh.readlines())
+                fh.close()
+    return lines
+
+
+def run(cleaner, lines):
+    random.seed(0)  # MAC addresses are obfuscated with random values
+    start = time.time()
+    policy = cleaner._file_policy('messages')
+    cleaned = [cleaner._clean_line(line, 'messages', policy) for line in lines]
+    return time.time() - start, cleaned
+
+
+def main():
+    parser = OptionParser(usage="%prog <OPTIONS> [DIRECTORY ...]")
+    parser.add_option("-l", "--lines", action="store", type="int", default=2000, dest="lines",
+                      help="number of synthetic log records when no directory is given (default = 2000)",
+                      metavar="LINES")
+    parser.add_option("-m", "--macs", action="store_true", default=False, dest="macs",
+                      help="obfuscate MAC addresses as well")
+    (options, args) = parser.parse_args()
+    lines = read_lines(args or [TESTDATA]) + make_lines(options.lines)
+
+    chain_time, chain = run(make_cleaner(False, options.macs), lines)
+    cleaner = make_cleaner(True, options.macs)
+    token_time, tokenized = run(cleaner, lines)
+    fallback = sum(cleaner._tokenize_line(line) is None for line in lines)
+
+    print("%8s %14s %14s %10s %8s" % ('lines', 'chain us/ln', 'single us/ln', 'fallback', 'same'))
+    print("%8s %14.1f %14.1f %9.1f%% %8s" % (
+        len(lines), chain_time / len(lines) * 1e6, token_time / len(lines) * 1e6,
+        100.0 * fallback / len(lines), chain == tokenized))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Copyright (C) 2013  Jamie Duncan (jduncan@redhat.com)
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# File Name : bench_usernames.py
+# Purpose : time _sub_username as the number of obfuscated users grows
+
+import os
+import re
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'soscleaner'))
+from soscleaner import SOSCleaner
+
+
+def legacy_sub_username(cleaner, line):
+    """The per-user substitution loop _sub_username used before the
+    lookup tables, kept here for comparison"""
+    for user, o_user in list(cleaner.user_db.items()):
+        line = re.sub(r'(?i)\b%s\b' % user, o_user, line)
+    return line
+
+
+def make_lines(users, count):
+    lines = []
+    for i in range(count):
+        lines.append("Jun 24 21:06:%02d myhost sshd[%s]: Accepted publickey for %s from 10.0.0.%s port 22\n" % (
+            i % 60, 1000 + i, users[i % len(users)], i % 250))
+    return lines
+
+
+def run(func, cleaner, lines):
+    start = time.time()
+    for line in lines:
+        func(cleaner, line)
+    return time.time() - start
+
+
+def main():
+    parser = OptionParser(usage="%prog <OPTIONS>")
+    parser.add_option("-n", "--users", action="append", type="int", default=[], dest="users",
+                      help="number of users in user_db. use multiple times for multiple runs",
+                      metavar="USERS")
+    parser.add_option("-l", "--lines", action="store", type="int", default=2000, dest="lines",
+                      help="number of lines to substitute per run (default = 2000)",
+                      metavar="LINES")
+    parser.add_option("--legacy", action="store_true", default=False, dest="legacy",
+                      help="also time the old per-user re.sub loop")
+    (options, args) = parser.parse_args()
+    sizes = options.users or [10, 100, 1000, 5000]
+
+    print("%8s %14s %14s" % ('users', 'lookup us/ln', 'legacy us/ln'))
+    for size in sizes:
+        cleaner = SOSCleaner(quiet=True)
+        cleaner._start_logging(os.devnull)
+        users = ['ldapuser%s' % i for i in range(size)]
+        for user in users:
+            cleaner._user2db(user)
+        lines = make_lines(users, options.lines)
+
+        cleaner._sub_username(lines[0])    # build the lookup tables outside the timing
+        lookup = run(lambda c, l: c._sub_username(l), cleaner, lines)
+        legacy = '-'
+        if options.legacy:
+            legacy = '%14.1f' % (run(legacy_sub_username, cleaner, lines) / len(lines) * 1e6)
+        print("%8s %14.1f %14s" % (size, lookup / len(lines) * 1e6, legacy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# Copyright (C) 2013  Jamie Duncan (jduncan@redhat.com)
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# File Name : gen_sosreport.py
+# Purpose : build synthetic sosreports of a chosen size and make-up for benchmarks
+
+import os
+import random
+import shutil
+import sys
+import tarfile
+from optparse import OptionParser
+
+# settings of a generated report, see generate
+DEFAULTS = {
+    'files': 50,            # number of log and command output files
+    'size': 256 * 1024,     # bytes per file
+    'line_length': 100,     # average bytes per line
+    'ips': 200,             # unique IPv4 addresses
+    'hosts': 100,           # unique hostnames on the report's domain
+    'macs': 50,             # unique MAC addresses
+    'users': 20,            # users in the lastlog output
+    'keywords': 20,         # keywords, written to a keywords file
+    'seed': 0,
+}
+
+WORDS = ('the', 'service', 'started', 'stopped', 'connection', 'from', 'to', 'port', 'pid',
+         'kernel', 'error', 'warning', 'request', 'completed', 'in', 'ms', 'status', 'ok',
+         'retrying', 'timeout', 'session', 'opened', 'closed', 'for', 'user', 'device')
+PROGRAMS = ('sshd', 'systemd', 'kernel', 'NetworkManager', 'crond', 'httpd', 'chronyd', 'auditd')
+
+
+class ReportData(object):
+    """The hosts, addresses, users and keywords a report is made of"""
+
+    def __init__(self, settings):
+        rng = random.Random(settings['seed'])
+        self.rng = rng
+        self.domain = 'example.com'
+        self.hostname = 'node0'
+        self.hosts = ['%s%s.%s' % (rng.choice(('web', 'db', 'app', 'nas', 'lb')), i, self.domain)
+                      for i in range(settings['hosts'])]
+        self.ips = ['10.%s.%s.%s' % (rng.randint(0, 255), rng.randint(0, 255), rng.randint(1, 254))
+                    for i in range(settings['ips'] // 2)]
+        self.ips += ['192.168.%s.%s' % (rng.randint(0, 255), rng.randint(1, 254))
+                     for i in range(settings['ips'] - len(self.ips))]
+        self.macs = [':'.join('%02x' % rng.randint(0, 255) for n in range(6))
+                     for i in range(settings['macs'])]
+        self.users = ['user%s' % i for i in range(settings['users'])]
+        self.keywords = ['secret%s' % i for i in range(settings['keywords'])]
+
+    def line(self, length):
+        """Returns a log line of about length bytes. Half the lines carry
+        something to obfuscate."""
+        rng = self.rng
+        words = ['Jun %2d %02d:%02d:%02d' % (rng.randint(1, 30), rng.randint(0, 23),
+                                              rng.randint(0, 59), rng.randint(0, 59)),
+                 self.hostname, '%s[%s]:' % (rng.choice(PROGRAMS), rng.randint(1, 65535))]
+        sensitive = rng.random() < 0.5
+        size = sum(len(w) + 1 for w in words)
+        while size < length:
+            if sensitive and rng.random() < 0.3:
+                pool = rng.choice((self.ips, self.hosts, self.macs, self.users, self.keywords))
+                word = rng.choice(pool) if pool else rng.choice(WORDS)
+            else:
+                word = rng.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        return ' '.join(words) + '\n'
+
+
+def _write(path, lines):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as fh:
+        fh.writelines(lines)
+
+
+def generate(path, **settings):
+    """Writes a synthetic sosreport directory at path, and a keywords file
+    next to it. Any key of DEFAULTS can be overridden. Returns the path of
+    the keywords file."""
+    for key, value in DEFAULTS.items():
+        settings.setdefault(key, value)
+    data = ReportData(settings)
+    rng = data.rng
+
+    _write(os.path.join(path, 'hostname'), ['%s.%s\n' % (data.hostname, data.domain)])
+    _write(os.path.join(path, 'route'), [
+        'Kernel IP routing table\n',
+        'Destination     Gateway         Genmask         Flags Metric Ref    Use Iface\n',
+        '0.0.0.0         10.0.0.1        0.0.0.0         UG    100    0        0 eth0\n',
+        '10.0.0.0        0.0.0.0         255.0.0.0       U     100    0        0 eth0\n',
+        '192.168.0.0     0.0.0.0         255.255.0.0     U     100    0        0 eth1\n'])
+    _write(os.path.join(path, 'sos_commands', 'last', 'lastlog_-u_1000-60000'),
+           ['Username         Port     From             Latest\n'] +
+           ['%-16s pts/0    %-16s Mon Jun 24 10:00:00 +0000 2019\n' % (user, rng.choice(data.ips))
+            for user in data.users])
+    _write(os.path.join(path, 'etc', 'hosts'),
+           ['127.0.0.1   localhost localhost.localdomain\n'] +
+           ['%s %s %s\n' % (ip, host, host.split('.')[0]) for ip, host in zip(data.ips, data.hosts)])
+    _write(os.path.join(path, 'sos_commands', 'networking', 'ip_-o_link'),
+           ['%s: eth%s: <BROADCAST,MULTICAST,UP> mtu 1500 link/ether %s brd ff:ff:ff:ff:ff:ff\n' % (
+               i + 2, i, mac) for i, mac in enumerate(data.macs)])
+    _write(os.path.join(path, 'installed-rpms'),
+           ['package%s-1.%s.%s-1.el7.x86_64    Mon Jun 24 10:00:00 2019\n' % (i, i % 10, i % 7)
+            for i in range(2000)])
+
+    dirs = ('var/log', 'sos_commands/logs', 'sos_commands/networking', 'sos_commands/process')
+    for i in range(settings['files']):
+        lines = []
+        size = 0
+        while size < settings['size']:
+            line = data.line(rng.randint(settings['line_length'] // 2, settings['line_length'] * 3 // 2))
+            lines.append(line)
+            size += len(line)
+        _write(os.path.join(path, dirs[i % len(dirs)], 'file%s.log' % i), lines)
+
+    keywords_file = path.rstrip('/') + '-keywords.txt'
+    _write(keywords_file, ['%s\n' % keyword for keyword in data.keywords])
+    return keywords_file
+
+
+def make_tarball(path):
+    """Packs a generated report into path.tar.gz and returns its name"""
+    tarball = path.rstrip('/') + '.tar.gz'
+    with tarfile.open(tarball, 'w:gz') as t:
+        t.add(path, arcname=os.path.basename(path.rstrip('/')))
+    return tarball
+
+
+def main():
+    parser = OptionParser(usage="%prog <OPTIONS> DIRECTORY")
+    for key, value in sorted(DEFAULTS.items()):
+        parser.add_option("--%s" % key.replace('_', '-'), action="store", type="int", default=value,
+                          dest=key, help="default = %s" % value)
+    parser.add_option("-t", "--tar", action="store_true", default=False, dest="tar",
+                      help="also pack the report into DIRECTORY.tar.gz")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.print_help()
+        sys.exit(1)
+    if os.path.exists(args[0]):
+        shutil.rmtree(args[0])
+    settings = dict((key, getattr(options, key)) for key in DEFAULTS)
+    keywords_file = generate(args[0], **settings)
+    print("report: %s" % args[0])
+    print("keywords: %s" % keywords_file)
+    if options.tar:
+        print("tarball: %s" % make_tarball(args[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -32,10 +32,19 @@ setup(
     maintainer='Jamie Duncan',
     maintainer_email='jduncan@redhat.com',
     long_description='%s is an application to help obfuscate sensitive data from a standard sosreport' % name,
+    python_requires='>=3.7',
+    classifiers=[
+        'License :: OSI Approved :: GNU General Public License v2 or later (GPLv2+)',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+    ],
     install_requires=[
         'ipaddr',
-        'future',
-        'configparser>=4,<5',
     ],
     package_dir={'': 'soscleaner'},
     test_suite='test_soscleaner',
@@ -7,11 +7,10 @@ Release: 2%{dist}
 Source0: https://github.com/jduncan-rva/%{srcname}/archive/v%{version}-%{release}.tar.gz
 License: GPLv2
 BuildArch: noarch
-Requires: file
-Requires: python-ipaddr
-BuildRequires: python-setuptools
-BuildRequires: file
-BuildRequires: python-ipaddr
+Requires: python3-ipaddr
+BuildRequires: python3-devel
+BuildRequires: python3-setuptools
+BuildRequires: python3-ipaddr
 Url: https://github.com/jduncan-rva/SOSCleaner
 
 %if 0%{?srpm_build}
@@ -25,16 +24,16 @@ SOSCleaner helps filter out controlled or sensitive data from an SOSReport
 %autosetup -n %{srcname}-%{version}
 
 %check
-%{__python2} setup.py test
+%{__python3} setup.py test
 
 %build
-%{__python2} setup.py build
+%py3_build
 
 %install
-%py2_install
+%py3_install
 
 %files
-%{python2_sitelib}/%{name}*
+%{python3_sitelib}/%{name}*
 %{_bindir}/soscleaner
 
 %changelog
@@ -19,11 +19,10 @@
 # Created By : Jamie Duncan
 # Purpose : an sosreport and data set obfuscation tool
 
-from builtins import str
-from builtins import range
-from builtins import object
 import os
 import hashlib
+import socket
+import struct
 import re
 import errno
 import stat
@@ -33,11 +32,817 @@ import shutil
 import tempfile
 import logging
 import tarfile
+import codecs
+import time
+import multiprocessing
+import zlib
+import collections
+import json
+import mmap
+import itertools
+import io
+import fnmatch
+import queue
+import threading
+from multiprocessing.pool import ThreadPool
 from ipaddr import IPv4Network, IPv4Address, IPv6Network, IPv6Address
 
 from random import randint
 import configparser
-import subprocess
+try:
+    import lzma
+except ImportError:  # pragma: no cover
+    lzma = None
+
+
+# a run of regex word characters, the unit word-boundary patterns match on
+WORD_PATTERN = re.compile(r'\w+')
+WORD_SPLIT_PATTERN = re.compile(r'(\w+)')
+
+# The data types _clean_line looks for. _sub_mac, _sub_hostname and _sub_ip
+# each scan for one of them, SOSCleaner._tokenize_line for all at once.
+MAC_PATTERN = re.compile(r'(?:[0-9a-fA-F]:?){12}')
+# a cheaper superset of MAC_PATTERN, for lines that can't hold a MAC address
+MAC_CANDIDATE_PATTERN = re.compile(r'[0-9a-fA-F][0-9a-fA-F:]{11}')
+HOST_PATTERN = re.compile(r'\b[a-zA-Z0-9-\.]{1,200}\.[a-zA-Z]{1,63}\b')
+IP4_PATTERN = re.compile(
+    r"(?:(?:\b25[0-5]|\b2[0-4][0-9]|\b1[0-9][0-9]|\b[1-9][0-9]|\b[1-9])"
+    r"(?:\.(?:\b25[0-5]|\b2[0-4][0-9]|\b1[0-9][0-9]|\b[1-9][0-9]|\b[0-9])){3})")
+# the short names _tokenize_line can substitute: words, or words joined by
+# dashes, that aren't only digits
+SHORT_NAME_PATTERN = re.compile(r'\w+(?:-\w+)*')
+# the values _hn2db and _dn2db make up for hostnames and domains, filled in
+# with a count (and for a host on an obfuscated domain, that domain)
+OBFUSCATED_HOST = 'obfuscatedhost%s'
+OBFUSCATED_DOMAIN_HOST = 'host%s.%s'
+OBFUSCATED_DOMAIN = 'ofuscateddomain%s.com'
+# bytes supersets of IP4_PATTERN and of MAC_CANDIDATE_PATTERN on lowercased
+# text, and any byte of a non-ASCII character, for SOSCleaner._mapped_gates
+IP4_GATE = re.compile(br'[0-9]\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]')
+MAC_GATE = re.compile(br'[0-9a-f][0-9a-f:]{11}')
+NON_ASCII_GATE = re.compile(br'[\x80-\xff]')
+
+# Files are cleaned as UTF-8 whatever the locale. Bytes that aren't valid
+# UTF-8 are decoded to lone surrogates, which no pattern matches, and are
+# written back as the same bytes, so text in other encodings passes through
+# unchanged. Lines end at '\n' only and line endings aren't translated.
+FILE_ENCODING = 'utf-8'
+FILE_ERRORS = 'surrogateescape'
+
+# Bytes that never appear in a text file, as in file(1)'s encoding checks:
+# NUL and the other C0 control characters except BEL, BS, HT, LF, VT, FF, CR
+# and ESC, plus DEL. TEXT_BYTES is everything else.
+TEXT_BYTES = bytes(bytearray(
+    set(range(256)) - set(range(0x00, 0x07)) - set(range(0x0e, 0x1b)) -
+    set(range(0x1c, 0x20)) - set([0x7f])))
+
+# (offset, magic number, description) of the binary formats commonly found
+# in or around an sosreport, checked by SOSCleaner._file_type
+MAGIC_SIGNATURES = (
+    (0, b'\x1f\x8b', 'gzip compressed data'),
+    (0, b'BZh', 'bzip2 compressed data'),
+    (0, b'\xfd7zXZ\x00', 'xz compressed data'),
+    (0, b'\x28\xb5\x2f\xfd', 'zstandard compressed data'),
+    (0, b'\x04\x22\x4d\x18', 'lz4 compressed data'),
+    (0, b'PK\x03\x04', 'zip archive data'),
+    (0, b'\x7fELF', 'elf'),
+    (0, b'\x89PNG', 'png image data'),
+    (0, b'\xff\xd8\xff', 'jpeg image data'),
+    (0, b'GIF8', 'gif image data'),
+    (0, b'%PDF-', 'pdf document'),
+    (0, b'SQLite format 3\x00', 'sqlite 3.x database'),
+    (257, b'ustar', 'posix tar archive'),
+)
+
+# State for the worker processes of the multiprocess cleaning engine
+# (SOSCleaner._clean_files_parallel). Each pool process receives its own copy
+# of the SOSCleaner instance when the pool forks, so the obfuscation databases
+# a worker sees are a snapshot of the parent's at that moment.
+_pool_cleaner = None
+
+
+def _pool_init(cleaner):
+    """Pool initializer. Keeps the forked SOSCleaner instance around for the
+    worker functions and silences console output, which is the parent's job.
+    """
+    global _pool_cleaner
+    _pool_cleaner = cleaner
+    for handler in list(cleaner.logger.handlers):
+        cleaner.logger.removeHandler(handler)
+
+
+def _pool_discover(batch):
+    """Worker function for the discovery phase of a parallel run. Takes a
+    batch of (index, file, span) tasks from SOSCleaner._schedule and returns
+    the index and allocation journal of each."""
+    return [(index, _pool_cleaner._discover_file(f, span)) for index, f, span in batch]
+
+
+def _pool_discover_macs(batch):
+    """Worker function for the MAC address scan that comes before the
+    discovery phase of a parallel run. Like _pool_discover, but files only
+    get keywords and MAC addresses obfuscated."""
+    _pool_cleaner.macs_only = True
+    return _pool_discover(batch)
+
+
+def _pool_clean(batch):
+    """Worker function for the rewrite phase of a parallel run. Takes a batch
+    of (index, file, span) tasks and returns for each the file, its span, the
+    cleaned piece when it's a span of the file, the number of keyword matches
+    made while cleaning it, what it added to each of the SOSCleaner.COUNTERS,
+    and its profile when profiling.
+    """
+    results = list()
+    for index, f, span in batch:
+        kw_matches = _pool_cleaner.kw_match_count
+        counters = _pool_cleaner._counters()
+        profiled = len(_pool_cleaner.profile_files)
+        piece = None
+        if span is None:
+            _pool_cleaner._clean_file(f)
+        else:
+            cpu = time.process_time()
+            wall = time.perf_counter()
+            piece = _pool_cleaner._clean_piece(f, *span)
+            if _pool_cleaner.profile:
+                _pool_cleaner.profile_files.append(
+                    (time.perf_counter() - wall, time.process_time() - cpu, span[1] - span[0],
+                     os.path.relpath(f, _pool_cleaner.dir_path)))
+        results.append((f, span, piece, _pool_cleaner.kw_match_count - kw_matches,
+                        _pool_cleaner._counters(counters), _pool_cleaner.profile_files[profiled:]))
+    return results
+
+
+class KeywordAutomaton(object):
+    """An Aho-Corasick automaton over a set of keywords. It finds every
+    keyword on a line in a single pass, no matter how many keywords there are,
+    and keeps the word-boundary semantics keyword substitution has always had.
+    """
+
+    def __init__(self, keywords):
+        self.goto = [dict()]    # state -> {character: next state}
+        self.fail = [0]         # state -> failure state
+        self.out = [()]         # state -> keywords ending in this state
+        for keyword in keywords:
+            state = 0
+            for ch in keyword:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][ch] = next_state
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.out.append(())
+                state = next_state
+            self.out[state] = (keyword,)
+
+        # breadth-first pass to wire up the failure links, merging the
+        # outputs of each failure state into the state that falls back to it
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                f = self.goto[f].get(ch, 0)
+                self.fail[next_state] = f
+                self.out[next_state] = self.out[next_state] + self.out[f]
+
+    def __len__(self):
+        return len(self.goto)
+
+    @staticmethod
+    def _is_word(line, i):
+        """True if line[i] is a regex word character"""
+        if 0 <= i < len(line):
+            ch = line[i]
+            return ch.isalnum() or ch == '_'
+        return False
+
+    def _boundary(self, line, i):
+        """True if there is a regex word boundary before line[i]"""
+        return self._is_word(line, i - 1) != self._is_word(line, i)
+
+    def find(self, line):
+        """Returns (start, end, keyword) for every keyword on the line that
+        sits on word boundaries, leftmost first and longest first on ties,
+        with overlapping matches removed.
+        """
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        found = list()
+        state = 0
+        for i, ch in enumerate(line):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword in out[state]:
+                start = i + 1 - len(keyword)
+                if self._boundary(line, start) and self._boundary(line, i + 1):
+                    found.append((start, i + 1, keyword))
+
+        found.sort(key=lambda m: (m[0], -m[1]))
+        matches = list()
+        end = 0
+        for m in found:
+            if m[0] >= end:
+                matches.append(m)
+                end = m[1]
+
+        return matches
+
+    def sub(self, line, replacements):
+        """Replaces every keyword found on the line with its value from the
+        replacements dictionary. Returns the new line and the number of
+        replacements made.
+        """
+        matches = self.find(line)
+        if not matches:
+            return line, 0
+
+        parts = list()
+        pos = 0
+        for start, end, keyword in matches:
+            parts.append(line[pos:start])
+            parts.append(replacements[keyword])
+            pos = end
+        parts.append(line[pos:])
+
+        return ''.join(parts), len(matches)
+
+
+def _prefix_pattern(words):
+    """Returns a regex that finds any of words, with common prefixes
+    factored out: 'db1|db2|dbx' becomes 'db(?:1|2|x)'. Python's re tries
+    the alternatives of a flat alternation one by one at every position,
+    which doesn't scale to thousands of words. As only finding one of
+    them matters, a word that starts another ends the branch.
+    """
+    trie = dict()
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c, dict())
+        node[None] = True
+
+    def _pattern(node):
+        if None in node:
+            return ''
+        alternatives = [re.escape(c) + _pattern(child) for c, child in sorted(node.items())]
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:%s)' % '|'.join(alternatives)
+
+    return _pattern(trie) if trie else None
+
+
+def _obfuscated_patterns():
+    """Returns patterns matching, whatever the counts, any dot-separated
+    label of an obfuscated hostname or domain, and any of them or what is
+    left of them after dropping leading labels"""
+    values = (OBFUSCATED_HOST, OBFUSCATED_DOMAIN, OBFUSCATED_DOMAIN_HOST % ('%s', OBFUSCATED_DOMAIN))
+    labels = set()
+    suffixes = set()
+    for value in values:
+        parts = value.split('.')
+        labels.update(parts)
+        suffixes.update('.'.join(parts[i:]) for i in range(len(parts)))
+
+    def _alternation(formats):
+        return re.compile(r'(?i)(?:%s)' % '|'.join(
+            re.escape(f).replace('%s', r'\d+') for f in sorted(formats)))
+
+    return _alternation(labels), _alternation(suffixes)
+
+
+def _find_all(text, sub):
+    """Returns where sub starts in text, without overlaps, as str.replace
+    finds it"""
+    found = list()
+    pos = text.find(sub)
+    while pos >= 0:
+        found.append(pos)
+        pos = text.find(sub, pos + len(sub))
+    return found
+
+
+def _scan_tokens(fh, tokens, buffer_size):
+    """Returns which of tokens, lowercase strings, occur case-insensitively
+    in the binary file object fh. bytes.lower only folds ASCII, so tokens
+    that aren't ASCII are returned without looking for them."""
+    found = set(t for t in tokens if not t.isascii())
+    wanted = [(t, t.encode('utf-8')) for t in tokens if t not in found]
+    if not wanted:
+        return found
+    overlap = max(len(b) for t, b in wanted) - 1
+    tail = b''
+    for chunk in iter(lambda: fh.read(buffer_size), b''):
+        text = tail + chunk.lower()
+        for t, b in wanted:
+            if b in text:
+                found.add(t)
+        wanted = [(t, b) for t, b in wanted if t not in found]
+        if not wanted:
+            break
+        tail = text[-overlap:] if overlap else b''
+    return found
+
+
+def _splice(line, subs):
+    """Returns line with each (start, end, value) in subs, which don't
+    overlap, put in place of the text from start to end"""
+    if not subs:
+        return line
+    subs.sort()
+    parts = list()
+    pos = 0
+    for start, end, value in subs:
+        parts.append(line[pos:start])
+        parts.append(value)
+        pos = end
+    parts.append(line[pos:])
+    return ''.join(parts)
+
+
+def _path_pattern(substrings, globs):
+    """Returns a pattern that finds any of substrings in a path, or any of
+    the fnmatch globs matching the path or a part of it that follows a '/',
+    or None if there are neither"""
+    parts = [re.escape(sub) for sub in substrings if sub]
+    parts.extend('(?:^|/)' + fnmatch.translate(glob) for glob in globs if glob)
+    if not parts:
+        return None
+
+    return re.compile('|'.join(parts))
+
+
+def _member_name(name):
+    """Returns a tar member name without the './' prefixes of an archive
+    made with tar -C dir ., leaving names like '.hidden' alone"""
+    while name.startswith('./'):
+        name = name[2:]
+    return '' if name == '.' else name
+
+
+def _gzip_block(args):
+    """Compresses one block into a complete gzip member"""
+    data, level = args
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _xz_block(args):
+    """Compresses one block into a complete xz stream"""
+    data, level = args
+    return lzma.compress(data, preset=level)
+
+
+def _memory_limit():
+    """Returns a quarter of the physical memory in bytes, what xz -T allows
+    its threads by default, or None if it can't be told"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 4
+    except (AttributeError, ValueError, OSError):  # pragma: no cover
+        return None
+
+
+class BlockCompressor(object):
+    """A write-only file object that compresses what is written to it in
+    fixed-size blocks on a pool of threads, the way pigz does. Each block
+    becomes a complete gzip member or xz stream, and a concatenation of those
+    is itself a valid .gz or .xz file, so the output reads back with gzip,
+    xz, tar or the tarfile module. zlib and lzma release the GIL while
+    compressing, so the threads run in parallel. Blocks are written out in
+    order, with at most two per thread held in memory. The output is hashed
+    as it is written with each hashlib algorithm named in hashes, see
+    hexdigests.
+    """
+
+    # xz preset: (dictionary size in KiB, encoder memory in MiB), from xz(1)
+    XZ_PRESETS = {0: (256, 3), 1: (1024, 9), 2: (2048, 17), 3: (4096, 32), 4: (4096, 48),
+                  5: (8192, 94), 6: (8192, 94), 7: (16384, 186), 8: (32768, 370), 9: (65536, 674)}
+    # compression name: (block function, default level, file extension)
+    FORMATS = {
+        'gz': (_gzip_block, 6, '.tar.gz'),
+        'xz': (_xz_block, 6, '.tar.xz'),
+        'none': (None, None, '.tar'),
+    }
+
+    def __init__(self, fileobj, compression='gz', level=None, threads=1, block_size=1024 * 1024,
+                 hashes=()):
+        if compression not in self.FORMATS:
+            raise ValueError("unknown compression %s" % compression)
+        if compression == 'xz' and lzma is None:  # pragma: no cover
+            raise ValueError("xz compression needs the lzma module")
+        self.fileobj = fileobj
+        self.compression = compression
+        self.compress, default_level, self.extension = self.FORMATS[compression]
+        self.level = default_level if level is None else level
+        if self.compress and not 0 <= self.level <= 9:
+            raise ValueError("compression level must be 0-9, not %s" % self.level)
+        self.threads = max(1, threads)
+        self.block_size = block_size
+        if compression == 'xz':
+            # like xz -T, blocks of three times the dictionary so it fills
+            # up, and no more threads than a quarter of the memory holds: an
+            # encoder each, and the blocks being compressed and waiting
+            dict_size, encoder_memory = self.XZ_PRESETS[self.level]
+            self.block_size = max(block_size, 3 * 1024 * dict_size)
+            limit = _memory_limit()
+            if limit is not None:
+                self.threads = max(1, min(self.threads, limit // (1024 * 1024 * encoder_memory + 3 * self.block_size)))
+        self.pool = ThreadPool(self.threads) if self.compress else None
+        self.pending = collections.deque()
+        self.buf = []
+        self.buffered = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.hashes = [(name, hashlib.new(name)) for name in hashes]
+
+    def write(self, data):
+        self.buf.append(data)
+        self.buffered += len(data)
+        self.bytes_in += len(data)
+        if self.buffered >= self.block_size:
+            self._submit()
+
+    def _submit(self):
+        data = b''.join(self.buf)
+        self.buf = []
+        self.buffered = 0
+        if self.pool is None:
+            self._emit(data)
+            return
+        self.pending.append(self.pool.apply_async(self.compress, ((data, self.level),)))
+        while len(self.pending) > 2 * self.threads:
+            self._emit(self.pending.popleft().get())
+
+    def _emit(self, data):
+        self.fileobj.write(data)
+        self.bytes_out += len(data)
+        for name, h in self.hashes:
+            h.update(data)
+
+    def hexdigests(self):
+        """Returns {algorithm: hex digest} of everything written so far"""
+        return dict((name, h.hexdigest()) for name, h in self.hashes)
+
+    def close(self):
+        if self.buffered:
+            self._submit()
+        while self.pending:
+            self._emit(self.pending.popleft().get())
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        self.fileobj.close()
+
+    def abort(self):
+        """Drops whatever hasn't been written yet, stops the threads and
+        closes the file, after an error"""
+        self.buf = []
+        self.buffered = 0
+        self.pending.clear()
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+        self.fileobj.close()
+
+
+class CleanCache(object):
+    """A directory of cleaned files, keyed by a hash of everything that went
+    into cleaning them (see SOSCleaner._cache_key). Each entry is a line of
+    JSON metadata followed by the cleaned file. The metadata lists the
+    database entries the file looked up, with the values they had, and the
+    short names and users it was cleaned with, so an entry is only reused
+    while those mappings are unchanged. Entries are
+    written under a temporary name and renamed into place, so several
+    workers can share a cache. Hits touch the entry, and evict removes the
+    least recently used entries until the cache fits in max_size bytes.
+    The metadata keeps the original hostnames, IPs, MACs and users in plain text
+    from run to run, so a new cache directory is only readable by its owner.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, 0o700, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        """Returns the metadata stored with key, or None"""
+        try:
+            with open(self._entry(key), 'rb') as fh:
+                return json.loads(fh.readline().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def open(self, key):
+        """Returns the cleaned file stored with key as a binary file object"""
+        fh = open(self._entry(key), 'rb')
+        fh.readline()
+        return fh
+
+    def copy(self, key, dst):
+        """Writes the cleaned file stored with key to the binary file object
+        dst, and marks the entry as recently used"""
+        entry = self._entry(key)
+        with open(entry, 'rb') as fh:
+            fh.readline()
+            shutil.copyfileobj(fh, dst)
+        os.utime(entry, None)
+
+    def put(self, key, path, meta):
+        """Stores the cleaned file at path and its metadata under key"""
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), 0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.soscleaner-', dir=os.path.dirname(entry))
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                dst.write(json.dumps(meta).encode('utf-8') + b'\n')
+                with open(path, 'rb') as src:
+                    shutil.copyfileobj(src, dst)
+            os.rename(tmp_path, entry)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is no
+        larger than max_size. Returns the number of entries removed."""
+        entries = list()
+        size = 0
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+                size += st.st_size
+        removed = 0
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            os.remove(path)
+            size -= entry_size
+            removed += 1
+        return removed
+
+
+class CheckpointJournal(object):
+    """An append-only file of JSON records, one per line, from which an
+    interrupted run can pick up where it stopped (see SOSCleaner._checkpoint).
+    Records are buffered and written a batch at a time, each batch flushed
+    to disk with fsync. load drops a record cut short by a crash.
+    """
+
+    def __init__(self, path, batch=100):
+        self.path = path
+        self.batch = batch
+        self.pending = list()
+
+    def append(self, record):
+        self.pending.append(json.dumps(record))
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered records"""
+        if self.pending:
+            with open(self.path, 'a') as fh:
+                fh.write('\n'.join(self.pending) + '\n')
+                fh.flush()
+                os.fsync(fh.fileno())
+            self.pending = list()
+
+    def load(self):
+        """Returns the records in the file. A partly written last record is
+        cut off the file, so the journal can be appended to again."""
+        records = list()
+        if not os.path.exists(self.path):
+            return records
+        end = 0
+        with open(self.path, 'rb') as fh:
+            for line in fh:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete record")
+                    records.append(json.loads(line.decode('utf-8')))
+                except ValueError:
+                    break
+                end += len(line)
+        if end < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as fh:
+                fh.truncate(end)
+        return records
+
+
+class _PipelineOutput(io.RawIOBase):
+    """The raw file FilePipeline.open returns, buffered. Writes go to the
+    pipeline's writer thread, at most block_size bytes at a time."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        chunk = bytes(data[:self.pipeline.block_size])
+        self.pipeline._put_write(('data', chunk))
+        return len(chunk)
+
+
+class FilePipeline(object):
+    """Overlaps the reading, cleaning and writing of a list of files. A
+    reader thread reads files ahead of the cleaning, which runs in the
+    calling thread, and a writer thread writes out what has been cleaned.
+    The stages are connected by queues of at most depth items, so a stage
+    that gets ahead waits for the next one: at most depth files of less
+    than prefetch_size bytes are held in memory, and depth blocks of
+    block_size bytes waiting to be written. Bigger files are left to the
+    cleaning to read, after asking the kernel to start reading them.
+    The threads spend their time in system calls, which release the GIL.
+
+    Iterating over the pipeline yields (file, data) in order, data being
+    the content of the file or None when it wasn't read ahead. The cleaned
+    file is written to open(file), and put in place with commit(file),
+    which renames it over the original, or dropped with abort(file).
+    call(func, *args) runs func on the writer thread once everything
+    before it is written. An error in the writer thread is raised in the
+    calling thread by the next write, commit or close, and the file being
+    written is kept in failed.
+
+    stats() returns the time each stage spent waiting on the others and
+    the queue depths seen, for tuning depth to the storage.
+    """
+
+    def __init__(self, files, depth=8, prefetch_size=4 * 1024 * 1024, block_size=1024 * 1024):
+        self.files = files
+        self.depth = max(1, depth)
+        self.prefetch_size = prefetch_size
+        self.block_size = block_size
+        self.read_queue = queue.Queue(self.depth)
+        self.write_queue = queue.Queue(self.depth)
+        self.stalls = collections.Counter()
+        self.busy = collections.Counter()
+        self.depths = collections.Counter()
+        self.error = None
+        self.failed = None
+        self.raised = False
+        self.stopped = False
+        self.reader = threading.Thread(target=self._read, name='soscleaner-reader')
+        self.writer = threading.Thread(target=self._write, name='soscleaner-writer')
+        self.reader.daemon = self.writer.daemon = True
+        self.reader.start()
+        self.writer.start()
+
+    def _put(self, q, name, item):
+        start = time.perf_counter()
+        q.put(item)
+        self.stalls[name] += time.perf_counter() - start
+        depth = q.qsize()
+        self.depths[(name, 'total')] += depth
+        self.depths[(name, 'count')] += 1
+        self.depths[(name, 'max')] = max(self.depths[(name, 'max')], depth)
+
+    def _get(self, q, name):
+        start = time.perf_counter()
+        item = q.get()
+        self.stalls[name] += time.perf_counter() - start
+        return item
+
+    def _read(self):
+        for f in self.files:
+            if self.stopped:
+                break
+            start = time.perf_counter()
+            data = None
+            try:
+                if os.path.isfile(f) and not os.path.islink(f):
+                    if os.path.getsize(f) < self.prefetch_size:
+                        with open(f, 'rb') as fh:
+                            data = fh.read()
+                    elif hasattr(os, 'posix_fadvise'):
+                        fd = os.open(f, os.O_RDONLY)
+                        try:
+                            os.posix_fadvise(fd, 0, self.prefetch_size, os.POSIX_FADV_WILLNEED)
+                        finally:
+                            os.close(fd)
+            except (IOError, OSError):
+                # left for the cleaning to read, and to report
+                data = None
+            self.busy['read'] += time.perf_counter() - start
+            self._put(self.read_queue, 'reader', (f, data))
+        self.read_queue.put(None)
+
+    def _write(self):
+        fd = tmp_path = self.current = None
+        while True:
+            item = self._get(self.write_queue, 'writer')
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            start = time.perf_counter()
+            try:
+                if item[0] == 'open':
+                    self.current = item[1]
+                    fd, tmp_path = tempfile.mkstemp(
+                        prefix='.soscleaner-', dir=os.path.dirname(item[1]))
+                elif item[0] == 'data':
+                    view = memoryview(item[1])
+                    while view:
+                        view = view[os.write(fd, view):]
+                elif item[0] == 'commit':
+                    os.close(fd)
+                    fd = None
+                    shutil.copymode(item[1], tmp_path)
+                    os.rename(tmp_path, item[1])
+                    tmp_path = None
+                elif item[0] == 'abort':
+                    if fd is not None:
+                        os.close(fd)
+                        fd = None
+                    if tmp_path is not None:
+                        os.remove(tmp_path)
+                        tmp_path = None
+                elif item[0] == 'call':
+                    item[1](*item[2])
+            except Exception as e:
+                self.error = e
+                self.failed = self.current
+                if fd is not None:
+                    os.close(fd)
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                fd = tmp_path = None
+            self.busy['write'] += time.perf_counter() - start
+
+    def _put_write(self, item, check=True):
+        if check and self.error is not None:
+            self.raised = True
+            raise self.error
+        self._put(self.write_queue, 'clean output', item)
+
+    def __iter__(self):
+        while True:
+            item = self._get(self.read_queue, 'clean input')
+            if item is None:
+                return
+            yield item
+
+    def open(self, f):
+        """Returns a buffered binary file the cleaned f is written to"""
+        self._put_write(('open', f))
+        return io.BufferedWriter(_PipelineOutput(self), self.block_size)
+
+    def commit(self, f):
+        self._put_write(('commit', f))
+
+    def abort(self, f):
+        self._put_write(('abort', f), check=False)
+
+    def call(self, func, *args):
+        self._put_write(('call', func, args))
+
+    def close(self):
+        """Stops the reader, waits for everything to be written and raises
+        the writer's error, if any"""
+        self.stopped = True
+        while self.reader.is_alive():
+            try:
+                self.read_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.reader.join()
+        self.write_queue.put(None)
+        self.writer.join()
+        if self.error is not None and not self.raised:
+            self.raised = True
+            raise self.error
+
+    def stats(self):
+        """Returns the seconds each stage waited and spent on I/O, and the
+        largest and mean depth of each queue when something was put in it"""
+        depths = dict()
+        for name, queue_name in (('reader', 'read'), ('clean output', 'write')):
+            count = self.depths[(name, 'count')]
+            depths[queue_name] = {
+                'max': self.depths[(name, 'max')],
+                'mean': self.depths[(name, 'total')] / float(count) if count else 0.0,
+            }
+        return {
+            'depth': self.depth,
+            'queues': depths,
+            'stalls': dict(self.stalls),
+            'busy': dict(self.busy),
+        }
 
 
 class SOSCleaner(object):
@@ -46,6 +851,16 @@ class SOSCleaner(object):
     cleaning and obfuscation process required in many industries.
     """
 
+    # the collections.Counter attributes a worker process reports back to
+    # the parent for each file it cleans, see _pool_clean
+    COUNTERS = ('prefilter_counts', 'cache_counts', 'profile_passes', 'sub_counts')
+    # what a checkpoint records, see _checkpoint: the obfuscation databases,
+    # which only ever have entries added, and the counters that go with them
+    CHECKPOINT_DBS = ('hn_db', 'dn_db', 'ip_db', 'mac_db', 'user_db', 'kw_db')
+    CHECKPOINT_VALUES = ('hostname_count', 'domain_count', 'user_count', 'kw_count',
+                         'kw_match_count')
+    CHECKPOINT_COUNTERS = ('prefilter_counts', 'cache_counts', 'sub_counts')
+
     def __init__(self, quiet=False):
 
         self.name = 'soscleaner'
@@ -64,9 +879,25 @@ class SOSCleaner(object):
             'sos_commands/snappy/snap_list_--all',
             'sos_commands/snappy/snap_--version'
         ]
+        # fnmatch globs of files that only get keywords obfuscated, like the
+        # false_positives, and of files that get everything obfuscated even
+        # when they match one of those. See _file_policy.
+        self.policy_excludes = list()
+        self.policy_includes = list()
+        self.policy_key = None
+        self.policy_exclude = None  # compiled rules, see _path_pattern
+        self.policy_include = None
+        self.policy_cache = dict()  # filename > result of _file_policy
+        # set in the workers of the MAC address scan of a parallel run, see
+        # _clean_files_parallel
+        self.macs_only = False
         self.loglevel = 'INFO'
         self.net_db = list()  # Network Information database
-        self.ip_db = list()
+        # longest-prefix-match index over net_db, see _ip4_index_network
+        self.net_index = dict()  # prefixlen > {network as int: obfuscated network}
+        self.net_prefixes = list()  # (prefixlen, netmask as int), longest first
+        self.net_keys = set()  # (network as int, prefixlen) of every network in net_db
+        self.ip_db = dict()  # IP database, int(original IP) > obfuscated IP
         self.default_net = IPv4Network('128.0.0.0/8')
         self.default_netmask = self.default_net.prefixlen
         # we'll have to keep track of how many networks we have so we don't have to count them each time we need to create a new one.
@@ -80,12 +911,25 @@ class SOSCleaner(object):
         self.hn_db = dict()  # hostname database
         self.hostname_count = 0
         self.hostname = None
+        # the short hostnames of every report in a batch run (see clean_batch)
+        self.hostnames = list()
+        self.batch_reports = list()
+        self.batch_sources = list()
+        # state of the single-pass tokenizer, see _build_tokenizer. Setting
+        # tokenizer to False runs every line through the _sub_* chain.
+        self.tokenizer = True
+        self.token_key = None
+        self.token_pattern = None
+        self.short_pattern = None
+        self.token_lookup = None
 
         self.mac_db = dict()  # mac address database
         self.mac_count = 0
 
         # Domainname obfuscation information
         self.dn_db = dict()  # domainname database
+        # reversed-label suffix trie over dn_db, see _dn_trie_add
+        self.dn_trie = dict()
         # right now this needs to be a 2nd level domain
         # examples: foo.com, example.com, domain.org
         self.root_domain = 'obfuscateddomain.com'
@@ -95,15 +939,90 @@ class SOSCleaner(object):
         self.keywords = list()
         self.kw_db = dict()  # keyword database
         self.kw_count = 0
+        self.kw_automaton = None  # built from kw_db by _build_keyword_automaton
+        self.kw_match_count = 0
+        # lines cleaned, the passes the prefilter in _clean_line skipped, and
+        # the lines _clean_mapped didn't need to clean
+        self.prefilter_counts = collections.Counter()
+        # substitutions made, by type: keyword, mac, hostname, ip, username
+        self.sub_counts = collections.Counter()
+        # set by _start_logging. Debug records on the per-line path are only
+        # built when it's True.
+        self.debug = False
 
         # obfuscating users from the last command, per rfe #79
         self.users_file = 'sos_commands/last/lastlog_-u_1000-60000'
         self.user_db = dict()
         self.user_count = 0
+        self.user_values = set()  # obfuscated usernames already handed out
+        # lowercase username lookup and matcher for usernames that aren't a
+        # single word, see _build_user_pattern
+        self.user_lookup = None
+        self.user_pattern = None
         self.config_file = '/etc/soscleaner.conf'
         self._read_early_config_options()
         self.obfuscate_macs = True  # issue #98
 
+        # number of bytes _file_type reads to tell text from binary files
+        self.sniff_size = 1024 * 1024
+        # read/write buffer size used when streaming files through _clean_file
+        self.buffer_size = 1024 * 1024
+        # files of at least this many bytes are mapped into memory and
+        # searched whole before any line is cleaned, see _clean_mapped.
+        # None turns that off.
+        self.mmap_threshold = 4 * 1024 * 1024
+        self.mmap_key = None
+        self.mmap_gates = None  # built by _mapped_gates
+        # in-memory limit of the buffers used for each member when streaming
+        # an archive (see _stream_archive) before they spill to disk
+        self.spool_size = 64 * 1024 * 1024
+        self.stream = False
+        # output archive format, see BlockCompressor.FORMATS. A level of None
+        # uses the format's default.
+        self.compression = 'gz'
+        self.compression_level = None
+        self.compression_threads = multiprocessing.cpu_count()
+        # digests of the output archive, each written to a side file named
+        # after the algorithm
+        self.checksums = ['md5', 'sha256']
+        self.archive_writer = None
+        # number of processes used to clean files. 1 keeps the serial path.
+        self.workers = 1
+        # parallel runs clean files bigger than this many bytes in pieces of
+        # about this size, see _split_file. None turns that off.
+        self.split_size = 64 * 1024 * 1024
+        # size of each file found by _file_list, used to schedule the largest first
+        self.file_sizes = dict()
+        # files read ahead and blocks waiting to be written by the FilePipeline
+        # of a serial run. 0 turns the pipeline off.
+        self.pipeline_depth = 8
+        self.pipeline_stats = None
+        # when not None, the database allocations made while cleaning are
+        # recorded here so they can be replayed in another process
+        self._alloc_journal = None
+        self._alloc_seen = set()
+        # cache of cleaned files, see CleanCache. None disables it.
+        self.cache_dir = None
+        self.cache_size = 1024 * 1024 * 1024
+        self.clean_cache = None
+        self.cache_counts = collections.Counter()
+        self.cache_state = None
+        self.cache_fingerprint = None
+        # run profile, see _start_profiling. Stages are always timed, the
+        # passes and files only when profile is set.
+        self.profile = False
+        self.profile_top = 20
+        self.profile_stages = collections.OrderedDict()
+        self.profile_passes = collections.Counter()
+        self.profile_files = list()
+        self.profile_mark = (time.time(), self._cpu_time())
+        # checkpoint journal of a clean_report run, see _start_checkpoints.
+        # resume is the session directory of an interrupted run to finish.
+        self.resume = None
+        self.checkpoints = None
+        self.checkpoint_batch = 100
+        self.checkpoint_marks = dict()
+
     def _check_uid(self):
         """Ensures soscleaner is running as root. This isn't required for soscleaner,
         but sosreports are run as root and root tends to own the files inside the
@@ -213,6 +1132,18 @@ class SOSCleaner(object):
                         self.logger.con_out(
                             "No config found - NetworkConfig.networks")
 
+                if config.has_section('FileConfig'):
+                    if config.has_option('FileConfig', 'exclude'):
+                        for glob in config.get('FileConfig', 'exclude').split(','):
+                            self.policy_excludes.append(glob.strip())
+                            self.logger.con_out(
+                                "Obfuscating only keywords in files from config file - %s", glob.strip())
+                    if config.has_option('FileConfig', 'include'):
+                        for glob in config.get('FileConfig', 'include').split(','):
+                            self.policy_includes.append(glob.strip())
+                            self.logger.con_out(
+                                "Obfuscating everything in files from config file - %s", glob.strip())
+
                 if config.has_section('MacConfig'):
                     if config.has_option('MacConfig', 'obfuscate_macs'):
                         self.obfuscate_macs = bool(
@@ -236,6 +1167,65 @@ class SOSCleaner(object):
             self.logger.exception(e)
             raise Exception("FILE_OPEN_ERROR - unable to open %s", filename)
 
+    def _file_type(self, filename):
+        """Returns a short, lowercase description of a file's type in the
+        spirit of the file(1) command, which soscleaner used to shell out to:
+        'empty', a compression or binary format from MAGIC_SIGNATURES, 'data'
+        for other binaries, or one of the '... text' types. Only the first
+        self.sniff_size bytes are read. Like file(1), anything containing bytes
+        that never appear in text (NUL and most other control characters) is
+        binary; otherwise the block is checked for ASCII and UTF-8.
+        """
+        try:
+            start = time.time()
+            with open(filename, 'rb') as fh:
+                block = fh.read(self.sniff_size)
+            filetype = self._block_type(block)
+            self.logger.debug("Classified %s as %s in %.6f seconds",
+                              filename, filetype, time.time() - start)
+
+            return filetype
+
+        except IOError as e:   # unreadable files are never text
+            self.logger.debug("Unable to read %s - %s", filename, e)
+            return 'unreadable'
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                "FILE_TYPE_ERROR - Cannot determine file type - %s", filename)
+
+    def _block_type(self, block):
+        """Returns the _file_type description for the first self.sniff_size
+        bytes of a file"""
+        if len(block) == 0:
+            filetype = 'empty'
+        else:
+            filetype = None
+            for offset, magic, description in MAGIC_SIGNATURES:
+                if block.startswith(magic, offset):
+                    filetype = description
+                    break
+            if filetype is None:
+                if block.startswith(b'\xff\xfe') or block.startswith(b'\xfe\xff'):
+                    filetype = 'utf-16 unicode text'
+                elif len(block.translate(None, TEXT_BYTES)) > 0:
+                    filetype = 'data'
+                elif max(bytearray(block)) < 0x80:
+                    filetype = 'ascii text'
+                else:
+                    try:
+                        block.decode('utf-8')
+                        filetype = 'utf-8 unicode text'
+                    except UnicodeDecodeError as e:
+                        # a multi-byte character cut off by the end of the block
+                        if e.start >= len(block) - 3 and len(block) == self.sniff_size:
+                            filetype = 'utf-8 unicode text'
+                        else:
+                            filetype = 'iso-8859 text'
+
+        return filetype
+
     def _skip_file(self, d, files):
         """The function passed into shutil.copytree to ignore certain
         patterns and filetypes
@@ -244,36 +1234,19 @@ class SOSCleaner(object):
         2) Symlinks - handled by copytree
         3) Write-only files (stuff in /proc)
         Binaries (can't scan them)
-        Sockets and FIFO files. Scanning them locks up the copying.
+        Sockets, FIFO files and devices. Scanning them locks up the copying.
         """
-        def confirm_text_file(filename):
-            """I know this is an epic hack, but I've seen a _ton_
-            of inconsistency around different distribution's builds
-            of python-magic. Until it stabilizes, I'm just going to
-            hack around it.
-            """
-            try:
-                command = "file %s" % filename
-                filetype = os.popen(command).read().strip(
-                    '\n').split(':')[1].strip().lower()
-                if 'text' in filetype:
-                    return True
-                else:
-                    return False
-            except Exception as e:  # pragma: no cover
-                self.logger.exception(e)
-                raise Exception(
-                    "CONFIRM_TEXT_FILE_ERROR - Cannot confirm file type - %s", filename)
-
         skip_list = []
         for f in files:
             f_full = os.path.join(d, f)
             if not os.path.isdir(f_full):
                 if not os.path.islink(f_full):
                     mode = os.stat(f_full).st_mode
-                    if stat.S_ISSOCK(mode) or stat.S_ISFIFO(mode):
+                    if not stat.S_ISREG(mode):
+                        # sockets, FIFOs and device nodes. Reading them can
+                        # block the copy, and they never hold text anyway.
                         skip_list.append(f)
-                    if not confirm_text_file(f_full):  # if it's not a text file
+                    elif 'text' not in self._file_type(f_full):  # if it's not a text file
                         skip_list.append(f)
 
         return skip_list
@@ -308,6 +1281,7 @@ class SOSCleaner(object):
         self.logger = logging.getLogger(__name__)
         if not self.quiet:
             self.logger.addHandler(console)  # pragma: no cover
+        self.debug = self.logger.isEnabledFor(logging.DEBUG)
 
         self.logger.con_out("Log File Created at %s" % filename)
 
@@ -323,11 +1297,16 @@ class SOSCleaner(object):
         """
 
         # we set up our various needed directory structures, etc.
-        # 16 digit random string
-        ran_uuid = str(uuid.uuid4().int)[:16]
-        # Gather data into its own soscleaner session directory
-        self.report_dir += '/' + 'soscleaner-' + ran_uuid
-        os.makedirs( self.report_dir, 0o700 )
+        if self.resume:
+            # the session directory of the run being resumed
+            self.report_dir = os.path.abspath(self.resume.rstrip('/'))
+            ran_uuid = os.path.basename(self.report_dir).replace('soscleaner-', '', 1)
+        else:
+            # 16 digit random string
+            ran_uuid = str(uuid.uuid4().int)[:16]
+            # Gather data into its own soscleaner session directory
+            self.report_dir += '/' + 'soscleaner-' + ran_uuid
+            os.makedirs( self.report_dir, 0o700 )
         # the origin dir we'll copy the files from
         origin_path = os.path.join(
             self.report_dir, "soscleaner-origin-%s" % ran_uuid)
@@ -346,13 +1325,8 @@ class SOSCleaner(object):
         """
         def get_compression_sig(filename):
             try:
-                """I know this is an epic hack, but I've seen a _ton_ of inconsistency around different
-                distribution's builds of python-magic. Until it stabilizes, I'm just going to hack around it.
-                """
                 self.sosreport_filename = filename
-                command = "file %s" % filename
-                compression_type = os.popen(command).read().strip(
-                    '\n').split(':')[1].strip().lower()
+                compression_type = self._file_type(filename)
                 return compression_type
 
             except Exception as e:  # pragma: no cover
@@ -371,38 +1345,13 @@ class SOSCleaner(object):
             else:
                 try:
                     compression_sig = get_compression_sig(path)
-                    if compression_sig == 'xz compressed data':
-                        try:
-                            self.logger.info(
-                                'Data Source Appears To Be LZMA Encrypted Data - decompressing into %s', self.origin_path)
-                            self.logger.info(
-                                'LZMA Hack - Creating %s', self.origin_path)
-                            os.makedirs( self.origin_path, 0o755 )
-                            subprocess.Popen(
-                                ["tar", "-xJf", path, "-C", self.origin_path]).wait()
-
-                            return_path = os.path.join(
-                                self.origin_path, os.listdir(self.origin_path)[0])
-
-                            return return_path
-
-                        except Exception as e:  # pragma: no cover
-                            self.logger.exception(e)
-                            raise Exception(
-                                'DecompressionError, Unable to decrypt LZMA compressed file %s', path)
-
-                    # the tarfile module handles other compression types.
-                    # so we can just use that
-                    else:
-                        p = tarfile.open(path, 'r')
-                        self.logger.info(
-                            'Data Source Appears To Be %s - decompressing into %s', compression_sig, self.origin_path)
+                    # tarfile reads gzip, bzip2 and xz (through lzma) itself,
+                    # so every format takes the same streaming path
+                    self.logger.info(
+                        'Data Source Appears To Be %s - decompressing into %s', compression_sig, self.origin_path)
+                    top = self._extract_archive(path, self.origin_path)
 
-                        p.extractall(self.origin_path)
-                        return_path = os.path.join(
-                            self.origin_path, os.path.commonprefix(p.getnames()))
-
-                        return return_path
+                    return os.path.join(self.origin_path, top)
 
                 except Exception as e:    # pragma: no cover
                     self.logger.exception(e)
@@ -414,6 +1363,33 @@ class SOSCleaner(object):
             raise Exception(
                 'CompressionError: Unable To Determine Compression Type')
 
+    def _extract_archive(self, path, dest):
+        """Extracts the tarball at path into dest, reading it front to back in
+        a single pass. Members with absolute paths or that climb out of dest
+        are skipped. Returns the top-level directory of the archive.
+        """
+        top = None
+        count = 0
+        with tarfile.open(path, 'r|*') as tar:
+            for member in tar:
+                parts = member.name.split('/')
+                if member.name.startswith('/') or '..' in parts:
+                    self.logger.info('Skipping unsafe archive member - %s', member.name)
+                    continue
+                name = _member_name(member.name)
+                if not name:
+                    pass
+                elif top is None:
+                    top = name.split('/')[0]
+                elif name != top and not name.startswith(top + '/'):
+                    top = ''
+                self.logger.debug('Extracting %s', member.name)
+                tar.extract(member, dest)
+                count += 1
+        self.logger.info('Extracted %s members from %s', count, path)
+
+        return top or ''
+
     ################################
     #  User Functions  #
     ################################
@@ -432,18 +1408,70 @@ class SOSCleaner(object):
             raise Exception(
                 "PROCESS_USER_OPTION_ERROR: unable to add user to user database")
 
+    def _build_user_pattern(self):
+        """Builds the lookup tables _sub_username uses from user_db. Most
+        usernames are a single word, and a word-boundary match on a username
+        is exactly a word on the line equal to it, so those are resolved with a
+        dictionary lookup per word. The few usernames containing other
+        characters (john.doe, svc-backup) are compiled into one
+        case-insensitive pattern, longest first. _user2db resets the tables
+        when it adds a user so they are rebuilt on the next _sub_username call.
+        """
+        try:
+            self.user_lookup = dict()
+            specials = list()
+            for user, o_user in list(self.user_db.items()):
+                self.user_lookup.setdefault(user.lower(), o_user)
+                if WORD_PATTERN.fullmatch(user) is None:
+                    specials.append(user)
+
+            self.user_pattern = None
+            if len(specials) > 0:
+                specials.sort(key=len, reverse=True)
+                self.user_pattern = re.compile(
+                    r'\b(?:%s)\b' % '|'.join(re.escape(u) for u in specials), re.I)
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                "BUILD_USER_PATTERN_ERROR: Unable to compile username pattern")
+
     def _sub_username(self, line):
         """Accepts a line from a file as input and replaces all occurrences of the users in the
         user_db with the obfuscated values.
         Returns the obfuscated line.
         """
 
+        def _lookup(match):
+            word = match.group(0).lower()
+            o_user = self.user_lookup.get(word)
+            if o_user is None:
+                return match.group(0)
+            self._journal_alloc('user', word)
+            return o_user
+
         try:
             if self.user_count > 0:    # we have obfuscated keywords to work with
-                for user, o_user in list(self.user_db.items()):
-                    line = re.sub(r'\b%s\b(?i)' % user, o_user, line)
-                    self.logger.debug(
-                            "Obfuscating User - %s > %s", user, o_user)
+                if self.user_lookup is None:
+                    self._build_user_pattern()
+                if self.user_pattern is not None:
+                    line, count = self.user_pattern.subn(_lookup, line)
+                    if count:
+                        self.sub_counts['username'] += count
+                # split into alternating non-word and word pieces, and only
+                # rebuild the line if one of the words is a known user
+                parts = WORD_SPLIT_PATTERN.split(line)
+                words = parts[1::2]
+                if not self.user_lookup.keys().isdisjoint(map(str.lower, words)):
+                    new_words = [self.user_lookup.get(w.lower(), w) for w in words]
+                    if self._alloc_journal is not None:
+                        for w, new_w in zip(words, new_words):
+                            if w is not new_w:
+                                self._journal_alloc('user', w.lower())
+                    self.sub_counts['username'] += sum(
+                        1 for w, new_w in zip(words, new_words) if w is not new_w)
+                    parts[1::2] = new_words
+                    line = ''.join(parts)
 
             return line
 
@@ -459,14 +1487,11 @@ class SOSCleaner(object):
             return "obfuscateduser%s" % randint(1,1000000)
 
         test_user = _randomizer()
-        if test_user in list(self.user_db.values()):
-            while test_user in list(self.user_db.values()):
-                self.logger.debug("Duplicate Obfuscated Hostname. Retrying - %s", test_user)
-                test_user = _randomizer()
-                if test_user not in list(self.user_db.values()):
-                    return test_user
-        else:
-            return test_user
+        while test_user in self.user_values:
+            self.logger.debug("Duplicate Obfuscated Hostname. Retrying - %s", test_user)
+            test_user = _randomizer()
+
+        return test_user
 
     def _user2db(self, username):
         """Takes a username and adds it to the user_db with an obfuscated partner.
@@ -483,6 +1508,8 @@ class SOSCleaner(object):
                 self.logger.info(
                     "Adding new obfuscated user: %s > %s", username, o_user)
                 self.user_db[username] = o_user
+                self.user_values.add(o_user)
+                self.user_lookup = None
 
             return o_user
 
@@ -491,7 +1518,7 @@ class SOSCleaner(object):
             raise Exception(
                 "USER_TO_DB_ERROR: unable to add user %s to database", username)
 
-    def _process_users_file(self):
+    def _process_users_file(self, root=None):
         """Uses the 'last' output from an sosreport and generate a list of usernames to obfuscate in log files, etc.
         By default it looks for the last file from an sosreport. But it can process any line-delimited list of users
         From RFE #79
@@ -505,7 +1532,7 @@ class SOSCleaner(object):
         # we're not calling this function from an option on the cli, we're just running it as part of __init__
 
         try:
-            users_file = os.path.join(self.dir_path, self.users_file)
+            users_file = os.path.join(root or self.dir_path, self.users_file)
             # check to make sure users_file is there and we can access it
             if os.path.exists(users_file):
                 self.logger.con_out(
@@ -550,12 +1577,11 @@ class SOSCleaner(object):
         line
         """
         try:
-            pattern = r"(((\b25[0-5]|\b2[0-4][0-9]|\b1[0-9][0-9]|\b[1-9][0-9]|\b[1-9]))(\.(\b25[0-5]|\b2[0-4][0-9]|\b1[0-9][0-9]|\b[1-9][0-9]|\b[0-9])){3})"
-            ips = [each[0] for each in re.findall(pattern, line)]
+            ips = IP4_PATTERN.findall(line)
             if len(ips) > 0:
+                self.sub_counts['ip'] += len(ips)
                 for ip in ips:
                     new_ip = self._ip4_2_db(ip)
-                    self.logger.debug("Obfuscating IP - %s > %s", ip, new_ip)
                     line = line.replace(ip, new_ip)
             return line
 
@@ -712,8 +1738,8 @@ class SOSCleaner(object):
             self.logger.con_out('Creating IP Report - %s', ip_report_name)
             ip_report = open(ip_report_name, 'w')
             ip_report.write('Original IP,Obfuscated IP\n')
-            for i in self.ip_db:
-                ip_report.write('%s,%s\n' % (i[0], i[1]))
+            for ip, o_ip in list(self.ip_db.items()):
+                ip_report.write('%s,%s\n' % (IPv4Address(ip), o_ip))
             ip_report.close()
             os.chmod(ip_report_name, 0o600)
             self.logger.info('Completed IP Report')
@@ -733,7 +1759,12 @@ class SOSCleaner(object):
             self.logger.con_out('Creating sosreport Report - %s', sos_report_name)
             sos_report = open(sos_report_name, 'w')
             sos_report.write('Original Sosreport,Obfuscated Sosreport\n')
-            sos_report.write('%s,%s.tar.gz\n' % (self.sosreport_filename, self.session))
+            extension = BlockCompressor.FORMATS[self.compression][2]
+            if self.batch_reports:
+                for name, source in zip(self.batch_reports, self.batch_sources):
+                    sos_report.write('%s,%s-%s%s\n' % (source, self.session, name, extension))
+            else:
+                sos_report.write('%s,%s%s\n' % (self.sosreport_filename, self.session, extension))
             sos_report.close()
             os.chmod(sos_report_name, 0o600)
             self.logger.info('Completed Sosreport Report')
@@ -764,13 +1795,11 @@ class SOSCleaner(object):
     def _sub_mac(self, line):
         """Finds potential MAC addresses and obfuscates them in a single line."""
         try:
-            pattern = re.compile(r'(?:[0-9a-fA-F]:?){12}')
-            macs = re.findall(pattern, line)
+            macs = MAC_PATTERN.findall(line)
             if len(macs) > 0:
+                self.sub_counts['mac'] += len(macs)
                 for mac in macs:
                     new_mac = self._mac2db(mac)
-                    self.logger.debug(
-                        "Obfuscating MAC address - %s > %s", mac, new_mac)
                     line = line.replace(mac, new_mac)
             return line
 
@@ -783,6 +1812,7 @@ class SOSCleaner(object):
         entry, or returns the existing obfuscated MAC entry.
         """
         try:
+            self._journal_alloc('mac', mac)
             o_mac = self.mac_db.get(mac)
             if o_mac is None:  # no match: we have to add it to the db
                 # using this lambda to create a valid randomized mac address is
@@ -811,18 +1841,19 @@ class SOSCleaner(object):
         """
         try:
             o_host = self.hn_db.get(host)
+            self._journal_alloc('hn', host, new=o_host is None)
             if o_host is None:  # no database match
                 split_host = host.split('.')
                 self.hostname_count += 1  # increment the counter to get the host ID number
                 if len(split_host) == 1:  # we have a non-fqdn - typically the host short name
-                    o_host = "obfuscatedhost%s" % self.hostname_count
+                    o_host = OBFUSCATED_HOST % self.hostname_count
                     self.hn_db[host] = o_host
                 elif len(split_host) == 2:  # we have a root domain, a la example.com
                     o_host = self._dn2db(host)
                 else:  # a 3rd level domain or higher
                     domain = '.'.join(split_host[1:])
                     o_domain = self._dn2db(domain)
-                    o_host = "host%s.%s" % (self.hostname_count, o_domain)
+                    o_host = OBFUSCATED_DOMAIN_HOST % (self.hostname_count, o_domain)
                     self.hn_db[host] = o_host
 
             if o_host is not None:
@@ -833,13 +1864,13 @@ class SOSCleaner(object):
             raise Exception(
                 "HN2DB_ERROR: Unable to add hostname to database - %s", host)
 
-    def _get_hostname(self, hostname='hostname'):
+    def _get_hostname(self, hostname='hostname', root=None):
         """Gets the hostname from an sosreport. Used at the beginning of an
         SOSCleaner run to set self.hostname and self.domainname
         """
 
         try:
-            hostfile = os.path.join(self.dir_path, hostname)
+            hostfile = os.path.join(root or self.dir_path, hostname)
             fh = open(hostfile, 'r')
             name_list = fh.readline().rstrip().split('.')
             hostname = name_list[0]
@@ -896,17 +1927,19 @@ class SOSCleaner(object):
             no match is found. This is used to determine if we should add a new
             subdomain to self.dn_db.
             """
-            for known_domain in list(self.dn_db.keys()):
-                if known_domain in root_domain:
+            known_domain = self._dn_trie_find(root_domain)
+            if known_domain is not None:
+                if self.debug:
                     self.logger.debug(
                         "evaluated domain found in database %s > %s", root_domain, known_domain)
-                    return True
+                return True
             return False
 
         domainname = hostname.split('.')
         domain_depth = len(domainname)
-        self.logger.debug("validating domain %s - depth: %s",
-                          hostname, domain_depth)
+        if self.debug:
+            self.logger.debug("validating domain %s - depth: %s",
+                              hostname, domain_depth)
         # The first clause checks for potential domains that are 3rd level
         # domains or higher. If the base domain (everything except the
         # first octet) is already in the database, it adds the host. If
@@ -917,7 +1950,8 @@ class SOSCleaner(object):
         if domain_depth > 2:
             # everything after the hostname is the domain we need to check
             root_domain = '.'.join(domainname[1:domain_depth])
-            self.logger.debug("validating domain - %s", root_domain)
+            if self.debug:
+                self.logger.debug("validating domain - %s", root_domain)
             # We try a straigh match first
             o_domain = self._dn2db(root_domain)
             if o_domain is not None:  # we got a straight match
@@ -927,49 +1961,61 @@ class SOSCleaner(object):
             else:
                 add_domain = _eval_domains(root_domain)
                 if add_domain:
-                    self.logger.debug(
-                        "Found new subdomain of %s - %s", root_domain, domainname)
+                    if self.debug:
+                        self.logger.debug(
+                            "Found new subdomain of %s - %s", root_domain, domainname)
                     found_domain = True
                     o_domain = self._dn2db(root_domain, add_domain=True)
 
         elif domain_depth == 2:
             o_domain = self.dn_db.get(hostname)
             if o_domain:
-                self.logger.debug(
-                    "Domain found in domain database - %s", domainname)
+                if self.debug:
+                    self.logger.debug(
+                        "Domain found in domain database - %s", domainname)
                 found_domain = True
 
         return found_domain
 
-    def _sub_hostname(self, line):
+    def _short_names(self):
+        """Returns the single-word names _sub_hostname looks for on every
+        line: the hostnames of the report, then the short domains"""
+        names = [h for h in (self.hostnames or [self.hostname]) if h is not None]
+        names.extend(self.short_domains)
+        return names
+
+    def _sub_hostname(self, line, dotted=True):
         """Replaces the exact hostname and all instances of the domain name with
         their obfuscated alternatives. Also handles auto-creation of subdomains
         for known domains. Example: if redhat.com is in the domain database,
         access.redhat.com and registry.redhat.com will both be obfuscated as
-        unique domain entries.
+        unique domain entries. When dotted is False the line is known to have
+        no dot, and only the short names are looked for.
         """
-        self.logger.debug("Processing Line - %s", line)
-        potential_hostnames = re.findall(
-            r'\b[a-zA-Z0-9-\.]{1,200}\.[a-zA-Z]{1,63}\b', line)
+        potential_hostnames = list()
+        if dotted:
+            potential_hostnames = HOST_PATTERN.findall(line)
         try:
+            count = 0
             for hostname in potential_hostnames:
                 hostname = hostname.lower()
-                self.logger.debug(
-                    "Verifying potential hostname - %s", hostname)
                 domain_found = self._validate_domainname(hostname)
 
                 # If we have a potential match that is a host on a domain that
                 # we care about, we regex it out of the line.
                 if domain_found:
                     o_hostname = self._hn2db(hostname)
-                    line = re.sub(r'\b%s\b(?i)' % hostname, o_hostname, line)
+                    line, n = re.subn(r'(?i)\b%s\b' % hostname, o_hostname, line)
+                    count += n
 
             # Now that the hard work is done, we account for the handful of
             # single-word "short domains" that we care about. We start with
             # the hostname.
-            if self.hostname is not None:
-                o_host = self._hn2db(self.hostname)
-                line = re.sub(r'\b%s\b(?i)' % self.hostname, o_host, line)
+            for hostname in self.hostnames or [self.hostname]:
+                if hostname is not None:
+                    o_host = self._hn2db(hostname)
+                    line, n = re.subn(r'(?i)\b%s\b' % hostname, o_host, line)
+                    count += n
 
             # There are a handful of short domains that we want to obfuscate
             # Things like 'localhost' and 'localdomain'
@@ -978,7 +2024,10 @@ class SOSCleaner(object):
             # they're only 1 word, so we handle them here.
             for domain in self.short_domains:
                 o_host = self._hn2db(domain)
-                line = re.sub(r'\b%s\b(?i)' % domain, o_host, line)
+                line, n = re.subn(r'(?i)\b%s\b' % domain, o_host, line)
+                count += n
+            if count:
+                self.sub_counts['hostname'] += count
 
             return line
 
@@ -987,36 +2036,209 @@ class SOSCleaner(object):
             raise Exception(
                 "SUB_HOSTNAME_ERROR: Unable to obfuscate hostnames on line - %s", line)
 
+    ###########################
+    #   Tokenizer functions   #
+    ###########################
+
+    def _build_tokenizer(self, names, key):
+        """Compiles the master pattern _tokenize_line scans lines with. Its
+        named groups are, in the order _clean_line has always applied them,
+        hostname candidates, IPv4 addresses and the short names (hostnames
+        and short_domains) in names. MAC addresses aren't part of it, as they
+        can start inside a word and trying them at every character doubles
+        the cost of the scan; _tokenize_line checks for them separately.
+        Keywords are matched before it by the keyword automaton and usernames
+        after it by dictionary lookup, as both scale to thousands of entries
+        where an alternation doesn't.
+        The tokenizer is switched off, leaving _clean_line on the _sub_*
+        chain, for short names and domains it can't keep in the chain's
+        order: names that aren't dashed words, names of only digits, names
+        that match inside one another, and names or domains that look like
+        the obfuscated values, which the chain would rewrite a second time.
+        """
+        self.token_key = key
+        self.token_pattern = None
+        self.short_pattern = None
+        self.token_lookup = None
+        self.token_dashes = False
+        obfuscated, obfuscated_domain = _obfuscated_patterns()
+        for name in names:
+            if SHORT_NAME_PATTERN.fullmatch(name) is None or re.search(r'[^\W\d]', name) is None \
+                    or obfuscated.fullmatch(name):
+                self.logger.debug("Single-pass tokenizer disabled by short name - %s", name)
+                return
+            self.token_dashes = self.token_dashes or '-' in name
+            for other in names:
+                if other.lower() != name.lower() and re.search(
+                        r'(?i)\b%s\b' % re.escape(name), other):
+                    self.logger.debug("Single-pass tokenizer disabled by short name - %s", name)
+                    return
+        for domain in self.dn_db:
+            if obfuscated_domain.fullmatch(domain):
+                self.logger.debug("Single-pass tokenizer disabled by domain - %s", domain)
+                return
+
+        # every token starts on a word boundary, so test it once and pick the
+        # alternative by what follows: hostnames have a dot, IPs a digit
+        groups = list()
+        groups.append(r'(?=[a-zA-Z0-9-]*\.)(?P<host>%s)' % HOST_PATTERN.pattern)
+        groups.append(r'(?=[0-9])(?P<ip>%s)' % IP4_PATTERN.pattern)
+        if names:
+            alternation = '|'.join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+            self.short_pattern = re.compile(r'(?i)\b(?:%s)\b' % alternation)
+            groups.append(r'(?P<short>(?i:%s)\b)' % alternation)
+        self.token_pattern = re.compile(r'\b(?:%s)' % '|'.join(groups))
+
+    def _tokenize_line(self, line, macs=True, dotted=True):
+        """Obfuscates the hostnames and IP addresses on a line
+        in one scan with the master pattern from _build_tokenizer, and builds
+        the new line with a single join. The obfuscation databases are
+        queried in the same order as the _sub_mac, _sub_hostname and _sub_ip
+        chain, so the results and the numbering of new entries are the same.
+        The chain rewrites the whole line once per stage, so a substitution
+        can land on text the scan sees as part of another token (a validated
+        hostname inside a longer one, a short name running into an IP, any
+        MAC address). Those lines are rare and are detected before
+        anything is added to the databases; None is returned for them and
+        _clean_line falls back to the chain. macs and dotted are the results
+        of _clean_line's prefilter; a line without a dot is only searched for
+        short names.
+        """
+        names = self._short_names()
+        key = (self.obfuscate_macs, self.domain_count, tuple(names))
+        if key != self.token_key:
+            self._build_tokenizer(names, key)
+        if self.token_pattern is None:
+            return None
+
+        # _sub_mac can rewrite part of a hostname or IP, so lines with a MAC
+        # address are left to the chain
+        if self.obfuscate_macs and macs and MAC_PATTERN.search(line) is not None:
+            return None
+
+        hosts = list()
+        shorts = list()
+        ips = list()
+        pattern = self.token_pattern if dotted else self.short_pattern
+        for m in (pattern.finditer(line) if pattern is not None else ()):
+            kind = m.lastgroup
+            if kind == 'host':
+                end = m.end()
+                if self.token_dashes and line[end:end + 1] == '-':
+                    return None
+                hosts.append(m.span())
+            elif kind == 'ip':
+                ips.append(m.span())
+            else:
+                shorts.append(m.span())
+
+        # hostname candidates on a domain we obfuscate are replaced whole, the
+        # others are searched for short names and IPs like the rest of the line
+        validated = list()
+        for start, end in hosts:
+            hostname = line[start:end].lower()
+            if self._validate_domainname(hostname):
+                validated.append((start, end, hostname))
+            else:
+                if self.short_pattern is not None:
+                    shorts.extend(m.span() for m in self.short_pattern.finditer(line, start, end))
+                ips.extend(m.span() for m in IP4_PATTERN.finditer(line, start, end))
+        for hostname in set(h for start, end, h in validated):
+            spans = [m.span() for m in re.finditer(r'(?i)\b%s\b' % hostname, line)]
+            if spans != [(start, end) for start, end, h in validated if h == hostname]:
+                return None
+        ips.sort()
+        tokens = sorted(shorts + ips)
+        for (start, end), (next_start, next_end) in zip(tokens, tokens[1:]):
+            if next_start < end:
+                return None
+        # str.replace, which _sub_ip uses, finds an address as text, which
+        # can also be outside a token or run into it (110.0.0.110 starts
+        # inside db110.0.0.110.0.0.1), and then one replacement can make or
+        # break the next
+        found = [line[start:end] for start, end in ips]
+        for ip in set(found):
+            if _find_all(line, ip) != [start for (start, end), f in zip(ips, found) if f == ip]:
+                return None
+
+        subs = [(start, end, self._hn2db(hostname)) for start, end, hostname in validated]
+        # short names are looked up every line, as _sub_hostname does. Once
+        # they're all in hn_db that only matters to the allocation journal
+        lookup = self.token_lookup
+        if lookup is None or self._alloc_journal is not None:
+            lookup = dict()
+            for name in names:
+                lookup.setdefault(name.lower(), self._hn2db(name))
+            if all(name in self.hn_db for name in names):
+                self.token_lookup = lookup
+        for start, end in shorts:
+            subs.append((start, end, lookup[line[start:end].lower()]))
+        new_ips = [self._ip4_2_db(ip) for ip in found]
+        if subs:
+            self.sub_counts['hostname'] += len(subs)
+        if found:
+            self.sub_counts['ip'] += len(found)
+
+        # _sub_ip replaces every occurrence of each address in turn. Splice
+        # the addresses in with the rest unless that would come out different:
+        # when an address is part of a new one, or a replacement runs into
+        # the text around it to make one of the addresses again
+        replace = any(ip in new_ip for ip in found for new_ip in new_ips)
+        if not replace and found:
+            spliced = _splice(line, subs + [(start, end, new_ip) for (start, end), new_ip in zip(ips, new_ips)])
+            replace = any(ip in spliced for ip in found)
+            if not replace:
+                return spliced
+        line = _splice(line, subs)
+        if replace:
+            for ip, new_ip in zip(found, new_ips):
+                line = line.replace(ip, new_ip)
+
+        return line
+
     ############################
     #   Filesystem functions   #
     ############################
 
-    def _clean_line(self, line, filename):
+    def _clean_line(self, line, filename, process_obfuscation=None):
         """Returns a line with obfuscations for all covered data types:
         hostname, ip, user, keyword, and MAC address. The filename is passed in
         so we can know whether or not to obfuscate IP addresses. IP obfuscation
         is excluding in a few files where RPM version numbers cause false
         positives and are known to not contain IP address information.
+        Callers cleaning a whole file pass process_obfuscation, the file's
+        _file_policy, so it isn't looked up for every line.
         """
 
         try:
-            process_obfuscation = True
-            # We want to skip the files in self.false_positives for all
-            # obfuscation but keywords because they don't have any sensible
-            # info in them and they generate a lot of false positives that
-            # much up the obfuscation and confuse people when they're working
-            # with the files
-            # Issues #60 & #101
-            for false_positive in self.false_positives:
-                if false_positive in filename:
-                    process_obfuscation = False
+            if process_obfuscation is None:
+                process_obfuscation = self._file_policy(filename)
             new_line = self._sub_keywords(line)  # Keyword Substitution
+            # Prefilter: a MAC address needs a run of hex digits, hostnames
+            # and IP addresses need a dot. Passes that can't match are skipped
+            counts = self.prefilter_counts
+            counts['lines'] += 1
+            macs = False
             if self.obfuscate_macs is True:
+                macs = MAC_CANDIDATE_PATTERN.search(new_line) is not None
+                if not macs:
+                    counts['mac'] += 1
+            dotted = '.' in new_line
+            if process_obfuscation and not dotted:
+                counts['hostname'] += 1
+                counts['ip'] += 1
+            if process_obfuscation and self.tokenizer:
+                # MAC, hostname and IP substitution in a single pass
+                tokenized = self._tokenize_line(new_line, macs, dotted)
+                if tokenized is not None:
+                    return self._sub_username(tokenized)
+            if macs:
                 new_line = self._sub_mac(new_line)  # MAC address obfuscation
             if process_obfuscation:
                 new_line = self._sub_hostname(
-                    new_line)  # Hostname substitution
-                new_line = self._sub_ip(new_line)  # IP substitution
+                    new_line, dotted)  # Hostname substitution
+                if dotted:
+                    new_line = self._sub_ip(new_line)  # IP substitution
                 new_line = self._sub_username(
                     new_line)  # Username substitution
 
@@ -1026,53 +2248,1061 @@ class SOSCleaner(object):
             self.logger.exception(e)
             raise Exception("CLEAN_LINE_ERROR: Cannot Clean Line - %s" % line)
 
-    def _clean_file(self, f):
+    def _file_policy(self, filename):
+        """Returns True if every obfuscation pass applies to a file, or False
+        if only keywords, and MAC addresses, are obfuscated in it.
+        We want to skip the files in self.false_positives for all
+        obfuscation but keywords because they don't have any sensible
+        info in them and they generate a lot of false positives that
+        much up the obfuscation and confuse people when they're working
+        with the files. Issues #60 & #101
+        A false positive is part of the file's path. The policy_excludes
+        globs add to them, and a file matching one of the policy_includes
+        globs gets every pass regardless. A glob matches the path or any part
+        of it after a '/', e.g. var/log/audit/* or *.rpmnew. The rules are
+        compiled when they change, and the policy of each file is kept.
+        With macs_only set every file is treated as a false positive.
+        """
+        if self.macs_only:
+            return False
+        key = (tuple(self.false_positives), tuple(self.policy_excludes),
+               tuple(self.policy_includes))
+        if key != self.policy_key:
+            self.policy_key = key
+            self.policy_cache = dict()
+            self.policy_exclude = _path_pattern(self.false_positives, self.policy_excludes)
+            self.policy_include = _path_pattern((), self.policy_includes)
+        policy = self.policy_cache.get(filename)
+        if policy is None:
+            policy = self.policy_exclude is None or self.policy_exclude.search(filename) is None
+            if not policy and self.policy_include is not None:
+                policy = self.policy_include.search(filename) is not None
+            self.policy_cache[filename] = policy
+
+        return policy
+
+    def _log_substitutions(self, filename, counts):
+        """Logs the number of substitutions of each type made in a file, in
+        place of a record per line"""
+        if counts:
+            self.logger.info(
+                "Obfuscated %s - %s", filename,
+                ', '.join('%s %s' % (kind, counts[kind]) for kind in sorted(counts)))
+
+    def _clean_stream(self, src, dst, filename):
+        """Reads lines from the open file object src, obfuscates them and
+        writes them to dst. Only the current line is held in memory.
+        """
+        process_obfuscation = self._file_policy(filename)
+        for l in src:
+            dst.write(self._clean_line(l, filename, process_obfuscation))
+
+    def _clean_into(self, f, dst, data=None):
+        """Cleans the file f into dst, a binary file object, and closes it.
+        data is the content of f when it has been read already, see
+        FilePipeline, which is cleaned line by line. Otherwise f goes
+        through _clean_mapped if _map_file allows it and line by line if not.
+        """
+        mm, gates = self._map_file(f) if data is None else (None, None)
+        if mm is None:
+            with io.TextIOWrapper(dst, FILE_ENCODING, FILE_ERRORS, newline='\n') as dst:
+                if data is None:
+                    src = open(f, 'rb', self.buffer_size)
+                else:
+                    src = io.BytesIO(data)
+                with io.TextIOWrapper(src, FILE_ENCODING, FILE_ERRORS, newline='\n') as src:
+                    self._clean_stream(src, dst, f)
+            return
+        try:
+            with dst:
+                self._clean_mapped(mm, gates, f, dst.write)
+        finally:
+            mm.close()
+
+    def _mapped_gates(self, process_obfuscation):
+        """Returns the bytes patterns _mapped_lines searches a file for: between
+        them a superset of everything _clean_line can change, on a lowercased
+        copy of the text. That is the keywords, and with process_obfuscation
+        the domains, short names, usernames and anything like an IPv4
+        address, plus anything like a MAC address. Lines with non-ASCII bytes
+        always match, which covers characters that match ASCII ones
+        case-insensitively and undecodable bytes.
+        Returns None when a line without a match could still change the
+        databases. Short names are looked up on every line; _clean_mapped
+        does that once per file, which is only the same for single-word names.
+        """
+        names = self._short_names()
+        key = (process_obfuscation, self.obfuscate_macs, tuple(names),
+               len(self.dn_db), len(self.user_db), len(self.kw_db))
+        if key == self.mmap_key:
+            return self.mmap_gates
+
+        self.mmap_key = key
+        self.mmap_gates = None
+        literals = list(self.kw_db)
+        if process_obfuscation:
+            for name in names:
+                if SHORT_NAME_PATTERN.fullmatch(name) is None:
+                    return None
+            literals.extend(self.dn_db)
+            literals.extend(names)
+            literals.extend(self.user_db)
+        # Python's re tries each alternative in turn, so a few separate
+        # scans are faster than one pattern of them all
+        gates = list()
+        literals = _prefix_pattern(set(l.lower() for l in literals if l and l.isascii()))
+        if literals is not None:
+            gates.append(re.compile(literals.encode('ascii')))
+        if process_obfuscation:
+            gates.append(IP4_GATE)
+        if self.obfuscate_macs:
+            gates.append(MAC_GATE)
+        self.mmap_gates = gates
+
+        return self.mmap_gates
+
+    def _map_file(self, f):
+        """Returns a read-only mmap of f and the _mapped_gates patterns for it
+        when _clean_mapped can clean it, or (None, None) for the line by
+        line path.
+        """
+        if self.mmap_threshold is None or os.path.getsize(f) < max(self.mmap_threshold, 1):
+            return None, None
+        gates = self._mapped_gates(self._file_policy(f))
+        if gates is None:
+            return None, None
+        with open(f, 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return mm, gates
+
+    def _mapped_lines(self, mm, gates, start=0, end=None):
+        """Yields the (start, end) offsets of the lines in mm any of gates
+        match, in order, between the line-aligned offsets start and end. The
+        mapping is lowercased and searched in blocks of about buffer_size
+        bytes, cut at line ends.
+        """
+        size = len(mm) if end is None else end
+        pos = start
+        while pos < size:
+            end = size
+            if pos + self.buffer_size < size:
+                end = mm.rfind(b'\n', pos, pos + self.buffer_size) + 1
+                if end == 0:  # a line longer than the block
+                    end = mm.find(b'\n', pos + self.buffer_size, size) + 1 or size
+            block = mm[pos:end].lower()
+            starts = set()
+            for gate in gates if block.isascii() else [NON_ASCII_GATE] + gates:
+                m = gate.search(block)
+                while m is not None:
+                    start = block.rfind(b'\n', 0, m.start()) + 1
+                    starts.add(start)
+                    m = gate.search(block, block.find(b'\n', m.start()) + 1 or len(block))
+            for start in sorted(starts):
+                yield pos + start, pos + (block.find(b'\n', start) + 1 or len(block))
+            pos = end
+
+    def _clean_mapped(self, mm, gates, filename, write=None, start=0, end=None):
+        """Cleans the file mapped in mm, from _map_file, or the lines between
+        the offsets start and end. The mapping is searched with the gate patterns, and only the lines with a match
+        go through _clean_line, so a file without one is never split into
+        lines. Matching lines are cleaned whole rather than only at the
+        match, because the passes see each other's substitutions. The cleaned
+        file is passed to write, if given, with the unchanged lines between
+        matches written as slices of the mapping.
+        The short names _clean_line looks up on every line are looked up
+        before the first line that is skipped, so the databases and the
+        allocation journal come out as if every line had been cleaned.
+        """
+        counts = self.prefilter_counts
+        process_obfuscation = self._file_policy(filename)
+        touched = not process_obfuscation
+        size = len(mm) if end is None else end
+        pos = start
+        with memoryview(mm) as view:
+            for start, end in itertools.chain(self._mapped_lines(mm, gates, pos, size),
+                                              [(size, size)]):
+                if start > pos:
+                    skipped = sum(view[i:min(i + self.buffer_size, start)].tobytes().count(b'\n')
+                                  for i in range(pos, start, self.buffer_size))
+                    if start == size and mm[size - 1] != 10:
+                        skipped += 1
+                    counts['lines'] += skipped
+                    counts['mapped'] += skipped
+                    if not touched:
+                        self._sub_hostname('', False)
+                    if write is not None:
+                        write(view[pos:start])
+                if end > start:
+                    line = self._clean_line(mm[start:end].decode(FILE_ENCODING, FILE_ERRORS),
+                                            filename, process_obfuscation)
+                    if write is not None:
+                        write(line.encode(FILE_ENCODING, FILE_ERRORS))
+                touched = True
+                pos = end
+
+    def _clean_range(self, f, start, end, write=None):
+        """Cleans the lines of f between the line-aligned byte offsets start
+        and end, passing the result to write if given. This is how the
+        pieces of a file split by _split_file are scanned and cleaned.
+        """
+        mm, gates = self._map_file(f)
+        if mm is not None:
+            try:
+                self._clean_mapped(mm, gates, f, write, start, end)
+            finally:
+                mm.close()
+            return
+        process_obfuscation = self._file_policy(f)
+        with open(f, 'rb', self.buffer_size) as fh:
+            fh.seek(start)
+            pos = start
+            for l in fh:
+                if pos >= end:
+                    break
+                pos += len(l)
+                line = self._clean_line(l.decode(FILE_ENCODING, FILE_ERRORS), f,
+                                        process_obfuscation)
+                if write is not None:
+                    write(line.encode(FILE_ENCODING, FILE_ERRORS))
+
+    def _clean_file(self, f, data=None, pipeline=None):
         """Takes a given file path, scrubs it, and saves a new copy of
-         the obfuscated file in the same location
+         the obfuscated file in the same location.
+         The file is streamed through buffers of self.buffer_size bytes into a
+         temporary file in the same directory, which is then renamed over the
+         original. Peak memory use doesn't depend on the size of the file and
+         a failed run never leaves a half-written file behind. Files of
+         mmap_threshold bytes or more are searched whole first, and only
+         the lines that can change are cleaned (see _clean_mapped). Bytes
+         outside the substitutions are written back unchanged, whatever the
+         file's encoding (see FILE_ENCODING).
+         With a clean_cache, a file cleaned before against the same mappings
+         is copied from the cache instead.
+         With a pipeline, a FilePipeline, the file is written by the
+         pipeline's writer thread instead, and read from data when the
+         pipeline read it ahead.
          """
         if os.path.exists(f) and not os.path.islink(f):
-            tmp_file = tempfile.TemporaryFile()
+            tmp_path = None
+            subs = self.sub_counts.copy()
             try:
-                data = self._extract_file_data(f)
-                if len(data) > 0:  # if the file isn't empty:
-                    for l in data:
-                        self.logger.debug("Obfuscating Line - %s", l)
-                        new_l = self._clean_line(l, f)
-                        tmp_file.write(new_l)
+                if pipeline is not None:
+                    self._clean_into(f, pipeline.open(f), data)
+                    pipeline.commit(f)
+                    self._log_substitutions(f, self.sub_counts - subs)
+                    return
+                fd, tmp_path = tempfile.mkstemp(
+                    prefix='.soscleaner-', dir=os.path.dirname(f))
+                key = meta = None
+                if self.clean_cache is not None:
+                    key = self._cache_key(f)
+                    meta = self._cache_find(key, f)
+                if meta is not None:
+                    with os.fdopen(fd, 'wb') as dst:
+                        self.clean_cache.copy(key, dst)
+                    self.kw_match_count += meta['kw_matches']
+                    self.prefilter_counts.update(meta['prefilter'])
+                    self.sub_counts.update(meta.get('subs', {}))
+                    self.cache_counts['hits'] += 1
+                elif key is not None:
+                    # record the database entries the file looks up
+                    kw_matches = self.kw_match_count
+                    counts = self.prefilter_counts.copy()
+                    self._alloc_journal = list()
+                    self._alloc_seen = set()
+                    try:
+                        self._clean_into(f, os.fdopen(fd, 'wb', self.buffer_size))
+                        journal = self._alloc_journal
+                    finally:
+                        self._alloc_journal = None
+                        self._alloc_seen = set()
+                    self.cache_counts['misses'] += 1
+                    self._cache_store(key, f, tmp_path, journal, self.kw_match_count - kw_matches,
+                                      self.prefilter_counts - counts, self.sub_counts - subs)
+                else:
+                    self._clean_into(f, os.fdopen(fd, 'wb', self.buffer_size))
+                shutil.copymode(f, tmp_path)
+                os.rename(tmp_path, f)
+                self._log_substitutions(f, self.sub_counts - subs)
 
-                    tmp_file.seek(0)
+            except OSError as e:
+                if pipeline is not None:
+                    pipeline.abort(f)
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                # the pipeline's writer may have failed on an earlier file
+                if pipeline is not None and e is pipeline.error:
+                    f = pipeline.failed
+                self._write_failed(e, f)
 
             except Exception as e:  # pragma: no cover
+                if pipeline is not None:
+                    pipeline.abort(f)
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
                 self.logger.exception(e)
                 raise Exception(
                     "CLEAN_FILE_ERROR: Unable to obfuscate file - %s" % f)
 
+    def _write_failed(self, e, f):
+        """Raises the error for an OSError e while writing the cleaned f. When
+        the disk is full the report is removed, or kept for --resume when
+        there are checkpoints."""
+        # If there's an IO error (disk is full)
+        if e.errno in (errno.EIO, errno.ENOSPC):  # pragma: no cover
+            self.logger.exception(e)
+            self.logger.con_out(
+                "CLEAN_FILE_ERROR: Not enough disk space to complete report obfusation")
+            if self.checkpoints is not None:
+                # keep the working directory for --resume
+                self.logger.con_out(
+                    "CLEAN_FILE_ERROR: Please remedy the disk pressure and re-run "
+                    "soscleaner with --resume %s", self.report_dir)
+            else:
+                self.logger.con_out(
+                    "CLEAN_FILE_ERROR: Removing partially obfuscated report and other artifacts")
+                self.logger.con_out(
+                    "CLEAN_FILE_ERROR: Please remedy the disk pressure and re-run soscleaner")
+                self._clean_up()
+        raise Exception(
+            "CLEAN_FILE_ERROR: Unable to write obfuscated file - %s" % f)
+
+    def _clean_piece(self, f, start, end):
+        """Cleans the bytes start to end of f, a span from _split_file, into
+        a temporary file next to it and returns its path. _join_pieces puts
+        the pieces of a file back together.
+        """
+        fd, piece = tempfile.mkstemp(prefix='.soscleaner-', dir=os.path.dirname(f))
+        try:
+            with os.fdopen(fd, 'wb', self.buffer_size) as dst:
+                self._clean_range(f, start, end, dst.write)
+
+            return piece
+
+        except Exception as e:  # pragma: no cover
+            if os.path.exists(piece):
+                os.remove(piece)
+            self.logger.exception(e)
+            raise Exception(
+                "CLEAN_PIECE_ERROR: Unable to obfuscate bytes %s-%s of file - %s" % (start, end, f))
+
+    def _join_pieces(self, f, pieces):
+        """Writes the pieces from _clean_piece, in order, over f"""
+        try:
+            with open(pieces[0], 'ab') as dst:
+                for piece in pieces[1:]:
+                    with open(piece, 'rb') as src:
+                        shutil.copyfileobj(src, dst, self.buffer_size)
+                    os.remove(piece)
+            shutil.copymode(f, pieces[0])
+            os.rename(pieces[0], f)
+
+        except Exception as e:  # pragma: no cover
+            for piece in pieces:
+                if os.path.exists(piece):
+                    os.remove(piece)
+            self.logger.exception(e)
+            raise Exception(
+                "JOIN_PIECES_ERROR: Unable to write obfuscated file - %s" % f)
+
+    def _journal_alloc(self, kind, value, new=False):
+        """Records a call into one of the obfuscation databases while an
+        allocation journal is active (see _discover_file). Lookups are recorded
+        the first time they are seen in a file, and every time they change the
+        database state (new=True), so replaying the journal in file order
+        reproduces exactly what a serial run would have allocated.
+        """
+        if self._alloc_journal is not None:
+            entry = (kind, value)
+            if new or entry not in self._alloc_seen:
+                self._alloc_seen.add(entry)
+                self._alloc_journal.append(entry)
+
+    def _discover_file(self, f, span=None):
+        """Runs a file, or the (start, end) byte span of it from _split_file,
+        through _clean_line without writing anything back and returns the
+        ordered list of database calls it made. This is the first phase of
+        _clean_files_parallel.
+        """
+        self._alloc_journal = list()
+        self._alloc_seen = set()
+        try:
+            if span is not None:
+                self._clean_range(f, *span)
+                return self._alloc_journal
+            if self.clean_cache is not None and os.path.exists(f) and not os.path.islink(f) \
+                    and self._cache_find(self._cache_key(f), f) is not None:
+                # everything the file needs is already in the databases
+                return list()
+            if os.path.exists(f) and not os.path.islink(f):
+                mm, gates = self._map_file(f)
+                if mm is not None:
+                    try:
+                        self._clean_mapped(mm, gates, f)
+                    finally:
+                        mm.close()
+                else:
+                    with open(f, 'r', self.buffer_size, encoding=FILE_ENCODING,
+                              errors=FILE_ERRORS, newline='\n') as fh:
+                        process_obfuscation = self._file_policy(f)
+                        for l in fh:
+                            self._clean_line(l, f, process_obfuscation)
+
+            return self._alloc_journal
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                "DISCOVER_FILE_ERROR: Unable to scan file - %s" % f)
+
+        finally:
+            self._alloc_journal = None
+            self._alloc_seen = set()
+
+    def _replay_allocations(self, journal):
+        """Applies a journal returned by _discover_file to this instance's
+        obfuscation databases"""
+        try:
+            for kind, value in journal:
+                if kind == 'dn':
+                    self._dn2db(value, add_domain=True)
+                elif kind == 'hn':
+                    self._hn2db(value)
+                elif kind == 'ip':
+                    self._ip4_2_db(value)
+                elif kind == 'mac':
+                    self._mac2db(value)
+                # users are all in user_db before cleaning starts, their
+                # entries are only kept for _cache_store
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                "REPLAY_ALLOCATIONS_ERROR: Unable to apply allocation - %s %s" % (kind, value))
+
+    def _counters(self, since=None):
+        """Returns a copy of each of the COUNTERS, less since when given"""
+        counters = dict()
+        for name in self.COUNTERS:
+            counters[name] = getattr(self, name).copy()
+            if since is not None:
+                counters[name] -= since[name]
+        return counters
+
+    def _cache_key(self, f):
+        """Returns the CleanCache key for a file: a hash of its content, its
+        _file_policy, and a fingerprint of the settings every file is cleaned
+        against, which are the same from run to run and from host to host.
+        The obfuscated values are random or depend on the order things are
+        found in, so the mappings a file uses, and the short names and users
+        it was cleaned with, are checked per entry instead, see _cache_find.
+        """
+        state = (self.version, self.obfuscate_macs, len(self.dn_db), len(self.kw_db))
+        if state != self.cache_state:
+            # subdomains are added to dn_db as they are found, so only the
+            # domains they were found under go into the fingerprint
+            roots = list()
+            for domain in self.dn_db:
+                labels = domain.split('.')
+                if not any('.'.join(labels[i:]) in self.dn_db for i in range(1, len(labels))):
+                    roots.append(domain)
+            fingerprint = hashlib.sha256(repr(state[:2]).encode('utf-8'))
+            fingerprint.update(repr(sorted(roots)).encode('utf-8'))
+            fingerprint.update(repr(sorted(self.kw_db.items())).encode('utf-8'))
+            self.cache_state = state
+            self.cache_fingerprint = fingerprint.hexdigest()
+        key = hashlib.sha256(self.cache_fingerprint.encode('utf-8'))
+        key.update(b'0' if self._file_policy(f) else b'1')
+        with open(f, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(self.buffer_size), b''):
+                key.update(chunk)
+        return key.hexdigest()
+
+    def _cache_users(self):
+        """Returns the lowercase usernames _sub_username looks for"""
+        if self.user_lookup is None:
+            self._build_user_pattern()
+        return self.user_lookup
+
+    def _cache_lookup(self, kind, value):
+        """Returns the current database value for a journal entry, without
+        adding anything to the databases"""
+        if kind == 'hn':
+            return self.hn_db.get(value)
+        elif kind == 'ip':
+            return self.ip_db.get(self._ip4_to_int(value))
+        elif kind == 'dn':
+            return self.dn_db.get(value)
+        elif kind == 'mac':
+            return self.mac_db.get(value)
+        elif kind == 'name':
+            if value in self._short_names():
+                return self.hn_db.get(value)
+        elif kind == 'user':
+            return self._cache_users().get(value)
+
+    def _cache_scan(self, tokens, f, open_cleaned):
+        """Returns which of tokens occur in f or in its cleaned copy, which
+        open_cleaned returns as a binary file object"""
+        with open(f, 'rb') as fh:
+            found = _scan_tokens(fh, tokens, self.buffer_size)
+        if tokens - found:
+            with open_cleaned() as fh:
+                found |= _scan_tokens(fh, tokens - found, self.buffer_size)
+        return found
+
+    def _cache_find(self, key, f):
+        """Returns the metadata of the cache entry for key if it can be used
+        to clean f with the current databases, or None. A short name or user
+        the entry wasn't cleaned with must not occur in f, or in the cleaned
+        copy where the other substitutions could have put it."""
+        meta = self.clean_cache.get(key)
+        if meta is None:
+            return None
+        for kind, value, mapped in meta['deps']:
+            if self._cache_lookup(kind, value) != mapped:
+                return None
+        if meta.get('names') is not None:
+            new = set(n.lower() for n in self._short_names()) - set(meta['names'])
+            new.update(set(self._cache_users()) - set(meta['users']))
+            if new and self._cache_scan(new, f, lambda: self.clean_cache.open(key)):
+                return None
+        return meta
+
+    def _cache_store(self, key, f, path, journal, kw_matches, counts, subs):
+        """Adds f, cleaned into path, to the cache with the database entries
+        it looked up, from the allocation journal kept while cleaning it.
+        Short names are looked up on every line, so they are only kept as
+        entries when they occur in the file, and the names and users it was
+        cleaned with are stored for _cache_find. Files that depend on
+        something that isn't in the databases, like the hostname_count bump
+        of a two-level hostname, aren't cacheable.
+        """
+        names = users = None
+        if self._file_policy(f):
+            names = self._short_names()
+            users = sorted(self._cache_users())
+            found = set()
+            if names:
+                found = self._cache_scan(set(n.lower() for n in names), f, lambda: open(path, 'rb'))
+        deps = list()
+        for kind, value in journal:
+            if names and kind == 'hn' and value in names:
+                if value.lower() not in found:
+                    continue
+                kind = 'name'
+            mapped = self._cache_lookup(kind, value)
+            if mapped is None:
+                self.cache_counts['uncacheable'] += 1
+                return
+            deps.append((kind, value, mapped))
+        if names is not None:
+            names = sorted(set(n.lower() for n in names))
+        meta = {'deps': deps, 'kw_matches': kw_matches, 'prefilter': dict(counts),
+                'subs': dict(subs), 'names': names, 'users': users}
+        self.clean_cache.put(key, path, meta)
+        self.cache_counts['stored'] += 1
+
+    ###########################
+    #   Profiling functions   #
+    ###########################
+
+    @staticmethod
+    def _cpu_time():
+        """CPU time used by this process and its finished children, so the
+        stages run on a worker pool are counted in full"""
+        t = os.times()
+        return time.process_time() + t[2] + t[3]
+
+    def _profile_mark(self, stage):
+        """Ends a stage of the run. The wall and CPU time since the last
+        mark are added to the stage in profile_stages."""
+        wall, cpu = time.time(), self._cpu_time()
+        last_wall, last_cpu = self.profile_mark
+        entry = self.profile_stages.setdefault(stage, [0.0, 0.0])
+        entry[0] += wall - last_wall
+        entry[1] += cpu - last_cpu
+        self.profile_mark = (wall, cpu)
+
+    def _profile_pass(self, name, func):
+        """Returns func wrapped to add its calls, wall and CPU time to
+        profile_passes under name"""
+        passes = self.profile_passes
+        perf_counter = time.perf_counter
+        process_time = time.process_time
+
+        def timed(*args):
+            cpu = process_time()
+            wall = perf_counter()
             try:
-                if len(data) > 0:
-                    new_fh = open(f, 'w')
-                    for line in tmp_file:
-                        new_fh.write(line)
-                    new_fh.close()
-            except OSError as e:
-                # If there's an IO error (disk is full)
-                if e.errno == errno.EIO:  # pragma: no cover
+                return func(*args)
+            finally:
+                passes[(name, 'wall')] += perf_counter() - wall
+                passes[(name, 'cpu')] += process_time() - cpu
+                passes[(name, 'calls')] += 1
+
+        return timed
+
+    def _profile_file(self, func):
+        """Returns _clean_file wrapped to record the wall and CPU time spent
+        on each file in profile_files"""
+        files = self.profile_files
+
+        def timed(f, *args):
+            cpu = time.process_time()
+            wall = time.perf_counter()
+            try:
+                return func(f, *args)
+            finally:
+                size = os.path.getsize(f) if os.path.isfile(f) else 0
+                files.append((time.perf_counter() - wall, time.process_time() - cpu, size,
+                              os.path.relpath(f, self.dir_path)))
+
+        return timed
+
+    def _start_profiling(self):
+        """Times the _sub_* passes and each file from here on, by shadowing
+        the methods with timed wrappers on this instance. Nothing on the per
+        line path changes when profiling is off."""
+        self.profile = True
+        for name, method in (('keywords', '_sub_keywords'), ('tokenizer', '_tokenize_line'),
+                             ('mac', '_sub_mac'), ('hostname', '_sub_hostname'),
+                             ('ip', '_sub_ip'), ('username', '_sub_username')):
+            setattr(self, method, self._profile_pass(name, getattr(self, method)))
+        self._clean_file = self._profile_file(self._clean_file)
+
+    def _create_profile_report(self):
+        """Writes the run profile to <session>-profile.json next to the
+        other reports: wall and CPU seconds per stage and per _sub_* pass,
+        and the profile_top slowest files"""
+        try:
+            profile_report_name = os.path.join(
+                self.report_dir, "%s-profile.json" % self.session)
+            self.logger.con_out('Creating Profile Report - %s', profile_report_name)
+            passes = dict()
+            for (name, field), value in self.profile_passes.items():
+                passes.setdefault(name, dict())[field] = value
+            profile = {
+                'version': self.version,
+                'workers': self.workers,
+                'files': len(self.profile_files),
+                'lines': self.prefilter_counts['lines'],
+                'stages': [{'stage': stage, 'wall': wall, 'cpu': cpu}
+                           for stage, (wall, cpu) in self.profile_stages.items()],
+                'passes': passes,
+                'pipeline': self.pipeline_stats,
+                'slowest_files': [{'file': f, 'size': size, 'wall': wall, 'cpu': cpu}
+                                  for wall, cpu, size, f in sorted(
+                                      self.profile_files, reverse=True)[:self.profile_top]],
+            }
+            with open(profile_report_name, 'w') as fh:
+                json.dump(profile, fh, indent=2)
+                fh.write('\n')
+            os.chmod(profile_report_name, 0o600)
+            self.logger.info('Completed Profile Report')
+
+            self.profile_report = profile_report_name
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                'CREATE_PROFILE_REPORT_ERROR: Unable to create report - %s', profile_report_name)
+
+    def _log_statistics(self, reports=None):
+        """Reports what a run obfuscated and how, and for a batch run the
+        number of sosreports in it"""
+        self.logger.con_out("*** SOSCleaner Statistics ***")
+        if reports is not None:
+            self.logger.con_out("Reports Cleaned - %s", reports)
+        self.logger.con_out("IP Addresses Obfuscated - %s", len(self.ip_db))
+        self.logger.con_out("Hostnames Obfuscated - %s", len(self.hn_db))
+        self.logger.con_out("Domains Obfuscated - %s", len(self.dn_db))
+        self.logger.con_out("Users Obfuscated - %s", self.user_count)
+        self.logger.con_out("Keywords Obfuscated - %s", self.kw_count)
+        self.logger.con_out("Keyword Matches - %s", self.kw_match_count)
+        self.logger.con_out("Lines Cleaned - %s", self.prefilter_counts['lines'])
+        self.logger.con_out("Lines Skipped by File Scan - %s", self.prefilter_counts['mapped'])
+        self.logger.con_out(
+            "Passes Skipped by Prefilter - MAC %s, Hostname %s, IP %s",
+            self.prefilter_counts['mac'], self.prefilter_counts['hostname'],
+            self.prefilter_counts['ip'])
+        self.logger.con_out(
+            "Substitutions - keyword %s, MAC %s, hostname %s, IP %s, username %s",
+            self.sub_counts['keyword'], self.sub_counts['mac'], self.sub_counts['hostname'],
+            self.sub_counts['ip'], self.sub_counts['username'])
+        self._cache_statistics()
+        self._pipeline_statistics()
+        self.logger.con_out("Total Files Analyzed - %s", self.file_count)
+
+    def _cache_statistics(self):
+        """Trims the cache to its size limit and reports how it was used"""
+        if self.clean_cache is not None:
+            evicted = self.clean_cache.evict()
+            self.logger.con_out(
+                "Cache - %s hits, %s misses, %s stored, %s uncacheable, %s evicted",
+                self.cache_counts['hits'], self.cache_counts['misses'],
+                self.cache_counts['stored'], self.cache_counts['uncacheable'], evicted)
+
+    def _pipeline_statistics(self):
+        """Reports how long each stage of the FilePipeline waited on the
+        others and how full its queues were, to tune pipeline_depth"""
+        if self.pipeline_stats is not None:
+            stats = self.pipeline_stats
+            stalls = stats['stalls']
+            self.logger.con_out(
+                "Pipeline - depth %s, read ahead max %s mean %.1f, write queue max %s mean %.1f",
+                stats['depth'], stats['queues']['read']['max'], stats['queues']['read']['mean'],
+                stats['queues']['write']['max'], stats['queues']['write']['mean'])
+            self.logger.con_out(
+                "Pipeline Stalls - reader %.2fs, cleaning on reads %.2fs, cleaning on writes %.2fs, "
+                "writer %.2fs", stalls.get('reader', 0), stalls.get('clean input', 0),
+                stalls.get('clean output', 0), stalls.get('writer', 0))
+
+    def _clean_files(self, files):
+        """Cleans files with _clean_files_parallel, or one after the other,
+        through _clean_files_pipelined unless pipeline_depth is 0 or there
+        is a clean_cache, recording each in the checkpoint journal as it is done"""
+        try:
+            if self.workers > 1:
+                self._clean_files_parallel(files)
+            elif self.pipeline_depth and self.clean_cache is None:
+                self._clean_files_pipelined(files)
+            else:
+                for f in files:
+                    self.logger.debug("Cleaning %s", f)
+                    self._clean_file(f)
+                    self._checkpoint(f)
+        finally:
+            if self.checkpoints is not None:
+                try:
+                    self.checkpoints.flush()
+                except (IOError, OSError) as e:  # pragma: no cover
                     self.logger.exception(e)
-                    self.logger.con_out(
-                        "CLEAN_FILE_ERROR: Not enough disk space to complete report obfusation")
-                    self.logger.con_out(
-                        "CLEAN_FILE_ERROR: Removing partially obfuscated report and other artifacts")
-                    self.logger.con_out(
-                        "CLEAN_FILE_ERROR: Please remedy the disk pressure and re-run soscleaner")
-                    self._clean_up()
-            except Exception as e:  # pragma: no cover
+
+    def _clean_files_pipelined(self, files):
+        """Cleans files one after the other through a FilePipeline, which
+        reads the next files and writes the cleaned ones while this thread
+        cleans. Checkpoints are added by the writer thread, once everything
+        before them is on disk. The pipeline's stats are kept in
+        pipeline_stats.
+        """
+        prefetch = self.mmap_threshold if self.mmap_threshold is not None else self.buffer_size
+        pipeline = FilePipeline(files, self.pipeline_depth, prefetch, self.buffer_size)
+        f = None
+        try:
+            for f, data in pipeline:
+                self.logger.debug("Cleaning %s", f)
+                self._clean_file(f, data, pipeline)
+                record = self._checkpoint_record(f)
+                if record is not None:
+                    pipeline.call(self.checkpoints.append, record)
+            f = None
+        finally:
+            try:
+                pipeline.close()
+            except OSError as e:
+                if f is None:
+                    self._write_failed(e, pipeline.failed)
                 self.logger.exception(e)
-                raise Exception(
-                    "CLEAN_FILE_ERROR: Unable to write obfuscated file - %s" % f)
+            finally:
+                self.pipeline_stats = pipeline.stats()
+
+    def _checkpoint(self, f=None, **extra):
+        """Adds a record to the checkpoint journal, if there is one: the file
+        f just cleaned, the entries added to each database since the last
+        record, the counters, and the host count of each obfuscated network.
+        Replaying the records in order with _apply_checkpoint restores the
+        state the run had after f.
+        """
+        record = self._checkpoint_record(f, **extra)
+        if record is not None:
+            self.checkpoints.append(record)
+
+    def _checkpoint_record(self, f=None, **extra):
+        """Returns the record _checkpoint adds to the journal, or None when
+        there is no journal"""
+        if self.checkpoints is None:
+            return None
+        record = dict(extra)
+        if f is not None:
+            record['file'] = os.path.relpath(f, self.dir_path)
+        record['db'] = dict()
+        for name in self.CHECKPOINT_DBS:
+            db = getattr(self, name)
+            added = len(db) - self.checkpoint_marks.get(name, 0)
+            if added > 0:
+                record['db'][name] = list(itertools.islice(reversed(db.items()), added))[::-1]
+            self.checkpoint_marks[name] = len(db)
+        record['values'] = dict((name, getattr(self, name)) for name in self.CHECKPOINT_VALUES)
+        record['counters'] = dict(
+            (name, dict(getattr(self, name))) for name in self.CHECKPOINT_COUNTERS)
+        record['networks'] = dict(
+            (net, meta['host_count']) for net, meta in self.net_metadata.items())
+
+        return record
+
+    def _apply_checkpoint(self, record):
+        """Brings the databases and counters to their state at a record
+        written by _checkpoint"""
+        for name, items in record['db'].items():
+            db = getattr(self, name)
+            for key, value in items:
+                db[key] = value
+        for domain, o_domain in record['db'].get('dn_db', ()):
+            self._dn_trie_add(domain)
+        for user, o_user in record['db'].get('user_db', ()):
+            self.user_values.add(o_user)
+        for name, value in record['values'].items():
+            setattr(self, name, value)
+        for name, counts in record['counters'].items():
+            setattr(self, name, collections.Counter(counts))
+        for net, count in record['networks'].items():
+            self.net_metadata.setdefault(net, dict())['host_count'] = count
+        # the tables built from the databases are rebuilt when next used
+        self.user_lookup = self.user_pattern = None
+        self.kw_automaton = None
+        self.token_key = self.token_lookup = None
+
+    def _start_checkpoints(self, extra_files=()):
+        """Starts the checkpoint journal of the session, <session>-checkpoint.json,
+        with a record of where the report came from and of the databases as
+        they were set up for cleaning"""
+        self.checkpoints = CheckpointJournal(
+            '%s-checkpoint.json' % self.session, self.checkpoint_batch)
+        self.checkpoint_marks = dict()
+        self._checkpoint(
+            report=self.report, origin=self.origin_path,
+            sosreport=getattr(self, 'sosreport_filename', None),
+            extra=dict((os.path.basename(f), os.path.abspath(f)) for f in extra_files))
+        self.checkpoints.flush()
+
+    def _load_checkpoints(self):
+        """Reads the checkpoint journal of the session being resumed. If it
+        and the working directory are there, sets report and origin_path to
+        the recorded ones, removes the temporary files of _clean_file calls
+        that were cut short, and returns the records. Otherwise whatever is
+        left of the session is removed and None is returned, to start over.
+        """
+        journal = CheckpointJournal('%s-checkpoint.json' % self.session, self.checkpoint_batch)
+        records = journal.load()
+        if records and os.path.isdir(self.dir_path) and os.path.isdir(records[0]['report']):
+            self.checkpoints = journal
+            self.report = records[0]['report']
+            self.origin_path = records[0]['origin']
+            if records[0]['sosreport'] is not None:
+                self.sosreport_filename = records[0]['sosreport']
+            for root, dirs, files in os.walk(self.dir_path):
+                for name in files:
+                    if name.startswith('.soscleaner-'):
+                        os.remove(os.path.join(root, name))
+            return records
+
+        self.logger.con_out("Nothing to resume in %s, starting over", self.report_dir)
+        for path in (self.origin_path, self.dir_path, journal.path):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        return None
+
+    def _resume_checkpoints(self, records, files):
+        """Replays the records from _load_checkpoints and returns the files
+        that are left to clean. Those may have been cleaned after the last
+        record was written, so they are copied again from the report (or the
+        extra files given with the first run) first.
+        """
+        for record in records:
+            self._apply_checkpoint(record)
+        self.checkpoint_marks = dict(
+            (name, len(getattr(self, name))) for name in self.CHECKPOINT_DBS)
+        done = set(record['file'] for record in records if 'file' in record)
+        extra = records[0]['extra']
+        left = list()
+        for f in files:
+            name = os.path.relpath(f, self.dir_path)
+            if name in done:
+                continue
+            if name in extra and os.path.isfile(extra[name]):
+                shutil.copyfile(extra[name], f)
+            elif os.path.isfile(os.path.join(self.report, name)) and not os.path.islink(f):
+                shutil.copy2(os.path.join(self.report, name), f)
+            left.append(f)
+        self.logger.con_out(
+            "Resuming session %s - %s files already cleaned, %s left",
+            self.session, len(files) - len(left), len(left))
+
+        return left
+
+    def _end_checkpoints(self):
+        """Removes the checkpoint journal once the run is complete"""
+        if self.checkpoints is not None:
+            if os.path.exists(self.checkpoints.path):
+                os.remove(self.checkpoints.path)
+            self.checkpoints = None
+
+    def _split_file(self, f, size):
+        """Returns the spans, (start, end) byte offsets cut at line ends, a
+        file of size bytes is cleaned in by a parallel run, or None to clean
+        it whole. Files are split when they are bigger than split_size, into
+        pieces of about that size. Files that go through the clean_cache are
+        kept whole, as the cache holds whole files.
+        """
+        if self.split_size is None or size <= self.split_size or self.clean_cache is not None \
+                or os.path.islink(f):
+            return None
+        spans = list()
+        with open(f, 'rb') as fh:
+            start = 0
+            while start < size:
+                fh.seek(start + self.split_size)
+                fh.readline()
+                end = min(fh.tell(), size)
+                spans.append((start, end))
+                start = end
+
+        return spans if len(spans) > 1 else None
+
+    def _schedule(self, files):
+        """Returns the work of a parallel run as batches of (index, file, span)
+        tasks, span being one from _split_file or None for the whole file.
+        Tasks are numbered in file order, which is the order their results
+        are applied in, and handed out largest first using the sizes from
+        _file_list, so a big file doesn't start last and hold up the run.
+        Small files are batched together to save on round trips to the
+        workers; big ones get a batch each.
+        """
+        tasks = list()
+        split = 0
+        for f in files:
+            size = self.file_sizes.get(f)
+            if size is None:
+                size = os.lstat(f).st_size if os.path.lexists(f) else 0
+            spans = self._split_file(f, size)
+            if spans is None:
+                tasks.append((size, len(tasks), f, None))
+            else:
+                split += 1
+                for span in spans:
+                    tasks.append((span[1] - span[0], len(tasks), f, span))
+        if split:
+            self.logger.con_out("Splitting %s large files into %s pieces", split,
+                                sum(1 for task in tasks if task[3] is not None))
+        tasks.sort(key=lambda task: (-task[0], task[1]))
+
+        batch_size = sum(task[0] for task in tasks) / (self.workers * 8.0)
+        batch_count = max(1, len(tasks) // (self.workers * 8))
+        batches = list()
+        batch = list()
+        size = 0
+        for task in tasks:
+            batch.append(task[1:])
+            size += task[0]
+            if size >= batch_size or len(batch) >= batch_count:
+                batches.append(batch)
+                batch = list()
+                size = 0
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _discover_parallel(self, ctx, discover, batches):
+        """Runs the batches of tasks from _schedule through the worker
+        function discover on a pool forked from this instance, and replays
+        the allocation journals it returns in file order"""
+        pool = ctx.Pool(self.workers, _pool_init, (self,))
+        try:
+            journals = dict()
+            next_index = 0
+            for results in pool.imap_unordered(discover, batches):
+                journals.update(results)
+                while next_index in journals:
+                    self._replay_allocations(journals.pop(next_index))
+                    next_index += 1
+        finally:
+            pool.close()
+            pool.join()
+
+    def _clean_files_parallel(self, files):
+        """Cleans files with a pool of self.workers processes while keeping a
+        single authoritative copy of the obfuscation databases in this process.
+        The work is handed out largest first, with big files split into
+        pieces, see _schedule.
+        Phase 1: workers scan files against a snapshot of the databases and
+        return the database calls each file made. They are replayed here in
+        file order, which gives the same mappings as a serial run. MAC
+        addresses are substituted before hostnames and IPs are looked for,
+        and their obfuscated values are random, so a worker making up its
+        own could find different hostnames and IPs in what it made. When
+        they're obfuscated, the files are first scanned for MAC addresses
+        alone, so the databases phase 1 is forked from already have them.
+        Phase 2: a new pool, forked from the now complete databases, rewrites
+        the files. Every value a worker needs is already known at that point.
+        The pieces of a split file are put back together once all are done.
+        """
+        try:
+            ctx = multiprocessing.get_context('fork')
+            batches = self._schedule(files)
+            if self.obfuscate_macs:
+                self.logger.con_out(
+                    "Scanning %s files for MAC addresses with %s workers", len(files), self.workers)
+                self._discover_parallel(ctx, _pool_discover_macs, batches)
+            self.logger.con_out(
+                "Scanning %s files with %s workers", len(files), self.workers)
+            self._discover_parallel(ctx, _pool_discover, batches)
+            self._checkpoint()
 
+            self.logger.con_out(
+                "Rewriting %s files with %s workers", len(files), self.workers)
+            spans = collections.defaultdict(list)
+            for index, f, span in itertools.chain(*batches):
+                if span is not None:
+                    spans[f].append(span)
+            pieces = collections.defaultdict(dict)
+            subs = collections.defaultdict(collections.Counter)
+            pool = ctx.Pool(self.workers, _pool_init, (self,))
+            try:
+                for results in pool.imap_unordered(_pool_clean, batches):
+                    for f, span, piece, kw_matches, counters, profiled in results:
+                        self.kw_match_count += kw_matches
+                        for name, counter in counters.items():
+                            getattr(self, name).update(counter)
+                        if span is None:
+                            self.profile_files.extend(profiled)
+                            self.logger.debug("Cleaned %s", f)
+                            self._checkpoint(f)
+                            continue
+                        # a piece of a split file
+                        done = pieces[f]
+                        done[span] = (piece, profiled)
+                        subs[f].update(counters['sub_counts'])
+                        if len(done) == len(spans[f]):
+                            done = [done[span] for span in sorted(spans[f])]
+                            self._join_pieces(f, [p for p, profile in done])
+                            if self.profile:
+                                profiles = [t for p, profile in done for t in profile]
+                                self.profile_files.append((
+                                    sum(t[0] for t in profiles), sum(t[1] for t in profiles),
+                                    sum(t[2] for t in profiles), profiles[0][3]))
+                            self._log_substitutions(f, subs.pop(f))
+                            del pieces[f]
+                            self.logger.debug("Cleaned %s", f)
+                            self._checkpoint(f)
             finally:
-                tmp_file.close()
+                pool.close()
+                pool.join()
+                for done in pieces.values():
+                    for piece, profile in done.values():
+                        if os.path.exists(piece):
+                            os.remove(piece)
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                "CLEAN_FILES_PARALLEL_ERROR: Unable to clean files with %s workers" % self.workers)
 
-    def _add_extra_files(self, files):
+    def _add_extra_files(self, files, dest=None):
         """Incorporates extra files are to be analyzed with an sosreport by
         adding them to the origin path to be analyzed
         """
@@ -1082,7 +3312,7 @@ class SOSCleaner(object):
                 self.logger.con_out(
                     "adding additional file for analysis: %s" % f)
                 fname = os.path.basename(f)
-                f_new = os.path.join(self.dir_path, fname)
+                f_new = os.path.join(dest or self.dir_path, fname)
                 shutil.copyfile(f, f_new)
         except IOError as e:
             self.logger.con_out(
@@ -1120,6 +3350,7 @@ class SOSCleaner(object):
                 for v in val:
                     x = os.path.join(key, v)
                     rtn.append(x)
+                    self.file_sizes[x] = os.lstat(x).st_size
 
             # a count of the files we'll have in the final cleaned sosreport
             self.file_count = len(rtn)
@@ -1147,19 +3378,21 @@ class SOSCleaner(object):
     def _create_archive(self):
         """Creates a tar.gz compressed archive of the scrubbed directory"""
         try:
-            self.archive_path = os.path.join(
-                self.report_dir, "%s.tar.gz" % self.session)
+            t = self._open_archive()
             self.logger.con_out(
                 'Creating SOSCleaner Archive - %s', self.archive_path)
-            t = tarfile.open(self.archive_path, 'w:gz')
-            for dirpath, dirnames, filenames in os.walk(self.dir_path):
-                for f in filenames:
-                    f_full = os.path.join(dirpath, f)
-                    f_archive = f_full.replace(self.report_dir, '')
-                    self.logger.debug('adding %s to %s archive',
-                                      f_archive, self.archive_path)
-                    t.add(f_full, arcname=f_archive)
-            os.chmod(self.archive_path, 0o600)  # per #90
+            try:
+                for dirpath, dirnames, filenames in os.walk(self.dir_path):
+                    for f in filenames:
+                        f_full = os.path.join(dirpath, f)
+                        f_archive = f_full.replace(self.report_dir, '')
+                        self.logger.debug('adding %s to %s archive',
+                                          f_archive, self.archive_path)
+                        t.add(f_full, arcname=f_archive)
+                self._close_archive(t)
+            except Exception:
+                self._abort_archive()
+                raise
         except Exception as e:  # pragma: no cover
             self.logger.exception(e)
             raise Exception(
@@ -1167,18 +3400,222 @@ class SOSCleaner(object):
 
         self._clean_up()
         self.logger.info('Archiving Complete')
+
+    def _open_archive(self, name=None):
+        """Opens the output tarball at self.archive_path, named after name or
+        the session, writing through a BlockCompressor set up from the
+        compression options"""
+        extension = BlockCompressor.FORMATS[self.compression][2]
+        self.archive_path = os.path.join(
+            self.report_dir, "%s%s" % (name or self.session, extension))
+        fh = open(self.archive_path, 'wb')
+        os.chmod(self.archive_path, 0o600)  # per #90
+        self.archive_writer = BlockCompressor(
+            fh, self.compression, self.compression_level, self.compression_threads,
+            hashes=self.checksums)
+        self.archive_start = time.time()
+
+        return tarfile.open(fileobj=self.archive_writer, mode='w|')
+
+    def _close_archive(self, t):
+        """Finishes the tarball opened by _open_archive and reports how fast
+        it was compressed"""
         t.close()
+        self.archive_writer.close()
+        w = self.archive_writer
+        elapsed = max(time.time() - self.archive_start, 1e-6)
+        if w.compress:
+            method = "%s level %s, %s threads" % (w.compression, w.level, w.threads)
+        else:
+            method = "uncompressed"
+        self.logger.con_out(
+            "Archive Compression - %s - %.1f MiB in, %.1f MiB out, %.1f MiB/s", method,
+            w.bytes_in / 1048576.0, w.bytes_out / 1048576.0, w.bytes_in / 1048576.0 / elapsed)
+
+    def _abort_archive(self):
+        """Stops the compressor of a tarball opened by _open_archive after an
+        error and removes what was written of it, so no truncated archive is
+        left behind"""
+        self.archive_writer.abort()
+        if os.path.exists(self.archive_path):
+            os.remove(self.archive_path)
+
+    def _stage_archive(self, path, hostname_path):
+        """Prepares a streaming run (see _stream_archive). The hostname, route
+        and users files are needed before any cleaning starts, so they are
+        read out of the archive (following symlinks inside it) into a small
+        staging directory at self.dir_path, where _get_hostname,
+        _process_route_file and _process_users_file expect them. Nothing else
+        is extracted. Returns the top-level directory inside the archive.
+        """
+        try:
+            self.logger.con_out("Reading SOSReport metadata from %s", path)
+            self.sosreport_filename = path
+            self.origin_path = None
+            os.makedirs(self.dir_path, 0o700)
+            with tarfile.open(path, 'r:*') as tar:
+                top = self._archive_top(tar.getnames())
+                for rel in (hostname_path, 'route', self.users_file):
+                    try:
+                        member = tar.getmember(os.path.join(top, rel).lstrip('/'))
+                        fh = tar.extractfile(member)
+                    except KeyError:
+                        continue
+                    if fh is None:  # not a regular file or a link to one
+                        continue
+                    staged = os.path.join(self.dir_path, rel)
+                    if not os.path.isdir(os.path.dirname(staged)):
+                        os.makedirs(os.path.dirname(staged))
+                    with open(staged, 'wb') as out:
+                        shutil.copyfileobj(fh, out)
+
+            return top
 
-    def soscleaner_checksum(self):
-        """check MD5 against soscleaner tarball"""
-        soscleaner_archive = self.session + ".tar.gz"
-        checksum = hashlib.md5(open(soscleaner_archive, 'rb').read()).hexdigest()
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                "STAGE_ARCHIVE_ERROR: Unable to read sosreport metadata - %s" % path)
+
+    def _archive_top(self, names):
+        """Returns the top-level directory all archive members live in, or an
+        empty string if there isn't a single one"""
+        names = [name for name in map(_member_name, names) if name]
+        top = names[0].split('/')[0] if names else ''
+        for name in names:
+            if name != top and not name.startswith(top + '/'):
+                return ''
+        return top
+
+    def _archive_rel(self, name, top):
+        """Returns an archive member name relative to top, the directory from
+        _archive_top, or the name as it is when it isn't under top"""
+        name = _member_name(name)
+        if top and (name == top or name.startswith(top + '/')):
+            return name[len(top):].lstrip('/')
+        return name
+
+    def _stream_archive(self, path, files=None, top=''):
+        """Archive-to-archive mode. Reads the members of the sosreport tarball
+        at path in order and writes them straight into the output archive, so
+        nothing is extracted to disk and every byte is decompressed, cleaned
+        and compressed once. Text files are cleaned through spooled buffers of
+        up to self.spool_size bytes; binaries, devices, FIFOs and sockets are
+        dropped, as _skip_file does for a normal run. Directories, symlinks
+        and hard links are kept along with each member's mode, owner and
+        mtime. Any extra files are cleaned and added at the top level.
+        Uses the hostname, route and users data staged by _stage_archive, and
+        top, the top-level directory it returns, which is replaced by the
+        session's.
+        """
+        try:
+            t = self._open_archive()
+            self.logger.con_out(
+                'Streaming %s into SOSCleaner Archive - %s', path, self.archive_path)
+            prefix = os.path.basename(self.session)
+            encoding = FILE_ENCODING
+            kept = set()
+            skipped = 0
+            self.file_count = 0
+
+            try:
+                with tarfile.open(path, 'r|*') as src:
+                    for member in src:
+                        rel = self._archive_rel(member.name, top)
+                        arcname = '/'.join(x for x in (prefix, rel) if x)
+
+                        info = tarfile.TarInfo(arcname)
+                        for attr in ('mode', 'uid', 'gid', 'uname', 'gname', 'mtime', 'type', 'linkname'):
+                            setattr(info, attr, getattr(member, attr))
+
+                        if member.isdir() or member.issym():
+                            t.addfile(info)
+                        elif member.islnk():
+                            target = self._archive_rel(member.linkname, top)
+                            info.linkname = '/'.join(x for x in (prefix, target) if x)
+                            if info.linkname in kept:
+                                t.addfile(info)
+                        elif member.isreg() and self._stream_member(
+                                src.extractfile(member), info, t, encoding):
+                            kept.add(arcname)
+                        else:
+                            self.logger.debug("Skipping archive member - %s", member.name)
+                            skipped += 1
+
+                for f in files or []:
+                    if not os.path.isfile(f):
+                        self.logger.con_out(
+                            "ExtraFileError: %s is not readable or does not exist. Skipping File" % f)
+                        continue
+                    self.logger.con_out(
+                        "adding additional file for analysis: %s" % f)
+                    info = t.gettarinfo(f, '%s/%s' % (prefix, os.path.basename(f)))
+                    with open(f, 'rb') as fh:
+                        self._stream_member(fh, info, t, encoding)
+
+                self._close_archive(t)
+            except Exception:
+                self._abort_archive()
+                raise
+
+            self.logger.con_out(
+                "Streamed %s text files into the archive, skipped %s other members", self.file_count, skipped)
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                'STREAM_ARCHIVE_ERROR: Unable to stream %s into archive - %s' % (path, self.archive_path))
+
+    def _stream_member(self, fh, info, t, encoding):
+        """Cleans one regular file read from fh into a spool buffer and adds
+        it to the tarfile t as info. Returns False, without adding anything,
+        if the file isn't text.
+        """
+        block = fh.read(self.sniff_size)
+        if 'text' not in self._block_type(block):
+            return False
+
+        src = tempfile.SpooledTemporaryFile(self.spool_size, dir=self.report_dir)
+        dst = tempfile.SpooledTemporaryFile(self.spool_size, dir=self.report_dir)
+        try:
+            src.write(block)
+            shutil.copyfileobj(fh, src, self.buffer_size)
+            src.seek(0)
+            subs = self.sub_counts.copy()
+            # binary lines end at b'\n' only, like the files _clean_file reads
+            lines = (l.decode(encoding, FILE_ERRORS) for l in src)
+            self._clean_stream(lines, codecs.getwriter(encoding)(dst, FILE_ERRORS), info.name)
+            self._log_substitutions(info.name, self.sub_counts - subs)
+            info.size = dst.tell()
+            dst.seek(0)
+            t.addfile(info, dst)
+            self.file_count += 1
+
+            return True
 
-        soscleaner_archive_hash = soscleaner_archive + ".md5"
-        fp = open(soscleaner_archive_hash, "w")
-        fp.write(checksum + "\n")
-        self.logger.con_out('md5 checksum is: %s' % checksum)
-        fp.close()
+        finally:
+            src.close()
+            dst.close()
+
+    def soscleaner_checksum(self):
+        """Writes the checksums of the soscleaner tarball to side files. The
+        digests are computed by the archive writer as the archive is written,
+        so the archive is only read back if it wasn't written by this run.
+        """
+        if self.archive_writer is not None:
+            digests = self.archive_writer.hexdigests()
+        else:
+            hashes = [(name, hashlib.new(name)) for name in self.checksums]
+            with open(self.archive_path, 'rb') as fh:
+                for block in iter(lambda: fh.read(self.buffer_size), b''):
+                    for name, h in hashes:
+                        h.update(block)
+            digests = dict((name, h.hexdigest()) for name, h in hashes)
+
+        for name in self.checksums:
+            fp = open("%s.%s" % (self.archive_path, name), "w")
+            fp.write(digests[name] + "\n")
+            fp.close()
+            self.logger.con_out('%s checksum is: %s' % (name, digests[name]))
 
     def finalmsg(self):
         """Final message at the end of the soscleaner run"""
@@ -1213,12 +3650,14 @@ class SOSCleaner(object):
                 # Try converting it all to lowercase
                 if add_domain:
                     self.domain_count += 1
-                    o_domain = "ofuscateddomain%s.com" % self.domain_count
+                    o_domain = OBFUSCATED_DOMAIN % self.domain_count
                     self.dn_db[domain] = o_domain
+                    self._dn_trie_add(domain)
                     self.logger.con_out(
                         "Adding new obfuscated domain - %s > %s", domain, o_domain)
 
             if o_domain:
+                self._journal_alloc('dn', domain)
                 return o_domain
             else:
                 return None
@@ -1228,6 +3667,33 @@ class SOSCleaner(object):
             raise Exception(
                 "DN2DB_ERROR: Unable to retrieve obfuscated domain - %s", domain)
 
+    def _dn_trie_add(self, domain):
+        """Adds a domain to self.dn_trie. The trie is a set of nested
+        dictionaries keyed on the domain's labels from the top-level domain
+        down, with the None key marking the end of a known domain:
+        {'com': {'redhat': {None: 'redhat.com'}}}
+        """
+        node = self.dn_trie
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, dict())
+        node[None] = domain
+
+    def _dn_trie_find(self, name):
+        """Returns the most specific domain in self.dn_db that name is, or is a
+        subdomain of, or None. Walks one trie level per label, so unlike a
+        substring test 'redhat.com.evil' and 'notredhat.com' don't match
+        redhat.com.
+        """
+        known_domain = None
+        node = self.dn_trie
+        for label in reversed(name.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            known_domain = node.get(None, known_domain)
+
+        return known_domain
+
     def _domains2db(self):
         """Adds domains to the domain database"""
         try:
@@ -1286,20 +3752,38 @@ class SOSCleaner(object):
                             "Added obfuscated keyword - %s > %s", kw, o_kw)
                         self.kw_count += 1
 
+            if self.kw_count > 0:
+                self._build_keyword_automaton()
+
         except Exception as e:  # pragma: no cover
             self.logger.exception(e)
             raise Exception(
                 "KEYWORDS2DB_ERROR: Unable to process keyword - %s", keyword)
 
+    def _build_keyword_automaton(self):
+        """Builds the KeywordAutomaton used by _sub_keywords from kw_db"""
+        try:
+            start = time.time()
+            self.kw_automaton = KeywordAutomaton(list(self.kw_db.keys()))
+            self.logger.con_out(
+                "Built keyword automaton - %s keywords, %s states in %.3f seconds",
+                len(self.kw_db), len(self.kw_automaton), time.time() - start)
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                "BUILD_KEYWORD_AUTOMATON_ERROR: Unable to build keyword automaton")
+
     def _sub_keywords(self, line):
         """Accepts a line from a file in an sosreport and obfuscates any known keyword entries on the line."""
         try:
             if self.kw_count > 0:    # we have obfuscated keywords to work with
-                for keyword, o_keyword in list(self.kw_db.items()):
-                    if keyword in line:
-                        line = re.sub(r'\b%s\b' % keyword, o_keyword, line)
-                        self.logger.debug(
-                            "Obfuscating Keyword - %s > %s", keyword, o_keyword)
+                if self.kw_automaton is None:
+                    self._build_keyword_automaton()
+                line, count = self.kw_automaton.sub(line, self.kw_db)
+                if count > 0:
+                    self.kw_match_count += count
+                    self.sub_counts['keyword'] += count
 
             return line
 
@@ -1312,12 +3796,12 @@ class SOSCleaner(object):
     #   Network Functions   #
     #########################
 
-    def _process_route_file(self):
+    def _process_route_file(self, root=None):
         """Parses the output from the route command in an sosreport to populate
         self.net_db with networks to obfuscate
         """
         try:
-            route_path = os.path.join(self.dir_path, 'route')
+            route_path = os.path.join(root or self.dir_path, 'route')
             if os.path.exists(route_path):
                 fh = open(route_path, 'r')
                 self.logger.info(
@@ -1383,9 +3867,8 @@ class SOSCleaner(object):
         self._ip4_add_network to ensure we don't get duplicate network entries
         """
         try:
-            if any(network in x for x in self.net_db):
-                return True
-            return False
+            key = (int(network.network), network.prefixlen)
+            return key in self.net_keys
 
         except Exception as e:    # pragma: no cover
             self.logger.exception(e)
@@ -1407,6 +3890,7 @@ class SOSCleaner(object):
             lb_net = IPv4Network('127.0.0.0/8')
             loopback_entry = (lb_net, lb_net)
             self.net_db.append(loopback_entry)
+            self._ip4_index_network(lb_net, lb_net)
             self.logger.con_out("Creating Loopback Network Entry")
 
         except Exception as e:    # pragma: no cover
@@ -1430,6 +3914,7 @@ class SOSCleaner(object):
                 new_entry = (net, new_net)
 
                 self.net_db.append(new_entry)
+                self._ip4_index_network(net, new_net)
                 self.logger.con_out(
                     "Created New Obfuscated Network - %s" % new_net.with_prefixlen)
 
@@ -1446,36 +3931,63 @@ class SOSCleaner(object):
             raise Exception(
                 "IP4_ADD_NETWORK_ERROR: Unable to add obfuscated network - %s", network)
 
+    def _ip4_index_network(self, net, obf_net):
+        """Adds a net_db entry to the longest-prefix-match index used by
+        _ip4_find_network. Networks are bucketed by prefix length and keyed on
+        their integer network address, so a lookup is one masked dictionary
+        probe per prefix length in use, longest first.
+        """
+        try:
+            prefixlen = net.prefixlen
+            if prefixlen not in self.net_index:
+                self.net_index[prefixlen] = dict()
+                mask = (0xffffffff << (32 - prefixlen)) & 0xffffffff
+                self.net_prefixes.append((prefixlen, mask))
+                self.net_prefixes.sort(reverse=True)
+            self.net_index[prefixlen][int(net.network)] = obf_net
+            self.net_keys.add((int(net.network), prefixlen))
+            self.net_keys.add((int(obf_net.network), obf_net.prefixlen))
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                "IP4_INDEX_NETWORK_ERROR: Unable to index network - %s", net)
+
     def _ip4_find_network(self, ip):
         """Takes an IP address and returns back the obfuscated network it belongs to
         This is called by the _ip4_2_db function
-        The value returned is a string that is the network address for the given network - IPv4Network.network.compressed
+        The value returned is the network address of the most specific
+        obfuscated network containing the IP - IPv4Network.network
         This can be used to create a new obfuscated IP address for this value
         """
         try:
-            ip = IPv4Address(ip)    # re-cast as an IPv4 object
-            network = self.default_net.network
-            for net in self.net_db:
-                if ip in net[0]:
+            ip_int = self._ip4_to_int(ip)
+            for prefixlen, mask in self.net_prefixes:
+                obf_net = self.net_index[prefixlen].get(ip_int & mask)
+                if obf_net is not None:
                     # we have a match! We'll return the proper obfuscated network
-                    network = net[1].network
+                    return obf_net.network
 
-            return network
+            return self.default_net.network
 
         except Exception as e:  # pragma: no cover
             self.logger.exception(e)
             raise Exception(
                 "IP4_FIND_NETWORK_ERROR: Unable to determin obfuscated network for IP address - %s", ip)
 
+    def _ip4_to_int(self, ip):
+        """Returns the integer value of a dotted-quad IPv4 address string.
+        This is the key used in self.ip_db.
+        """
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+
     def _ip4_in_db(self, ip):
         """Returns True if an IP is found the the obfuscation database. Returns
-        False otherwise The ip parameter is an IPv4Address object This function
+        False otherwise The ip parameter is a dotted-quad string. This function
         is called from within _ip4_2_db
         """
         try:
-            if any(ip in x for x in self.ip_db):
-                return True
-            return False
+            return self._ip4_to_int(ip) in self.ip_db
 
         except Exception as e:  # pragma: no cover
             self.logger.exception(e)
@@ -1485,26 +3997,24 @@ class SOSCleaner(object):
     def _ip4_2_db(self, orig_ip):
         """Adds an IP address to the IP database and returns the obfuscated
         entry, or returns the existing obfuscated IP entry.
+        self.ip_db maps the integer value of the original address to the
+        obfuscated address string, so both lookups and inserts are O(1). Dicts
+        keep insertion order, which _create_ip_report relies on.
         """
         try:
-            if self._ip4_in_db(orig_ip):  # the IP exists already in the database
-                # http://stackoverflow.com/a/18114565/263834
-                data = dict(self.ip_db)
-                # we'll pull the existing obfuscated IP from the database
-                obf_ip = data[orig_ip]
-
-                return obf_ip.compressed
-
-            else:   # it's a new database, so we have to create a new obfuscated IP for the proper network and a new ip_db entry
+            self._journal_alloc('ip', orig_ip)
+            key = self._ip4_to_int(orig_ip)
+            obf_ip = self.ip_db.get(key)
+            if obf_ip is None:   # it's a new IP, so we have to create a new obfuscated IP for the proper network and a new ip_db entry
                 # get the network information
                 net = self._ip4_find_network(orig_ip)
                 self.net_metadata[net.compressed]['host_count'] += 1
                 # take the network and increment the number of hosts to get to the next available IP
-                obf_ip = IPv4Address(
-                    net) + self.net_metadata[net.compressed]['host_count']
-                self.ip_db.append((orig_ip, obf_ip))
+                obf_ip = (IPv4Address(
+                    net) + self.net_metadata[net.compressed]['host_count']).compressed
+                self.ip_db[key] = obf_ip
 
-                return obf_ip.compressed
+            return obf_ip
 
         except Exception as e:    # pragma: no cover
             self.logger.exception(e)
@@ -1575,15 +4085,40 @@ class SOSCleaner(object):
             raise Exception(
                 "START_SOSCLEANER_ERROR: Unable to create needed artifacts to run soscleaner")
 
-    def clean_report(self, options, sosreport):  # pragma: no cover
-        """The primary function, to put everything together and analyze an sosreport."""
+    def _process_options(self, options):  # pragma: no cover
+        """Starts the session and loads the settings and databases shared by
+        clean_report and clean_batch from the command line options"""
+        if options.compression_level is not None and not 0 <= options.compression_level <= 9:
+            raise Exception(
+                "COMPRESSION_LEVEL_ERROR: Compression level must be 0-9 - %s" % options.compression_level)
         if options.report_dir:
             self._process_report_dir(options.report_dir)
+        if options.resume:
+            if not os.path.isdir(options.resume):
+                raise Exception("RESUME_ERROR: No soscleaner session at %s" % options.resume)
+            self.resume = options.resume
         self.loglevel = options.loglevel
         self._start_soscleaner()
         self._read_later_config_options()
         if options.obfuscate_macs:
             self.obfuscate_macs = options.obfuscate_macs
+        if options.workers:
+            self.workers = options.workers
+        if options.stream:
+            self.stream = options.stream
+        if options.compression:
+            self.compression = options.compression
+        if options.compression_level is not None:
+            self.compression_level = options.compression_level
+        if options.profile:
+            self._start_profiling()
+        if options.pipeline_depth is not None:
+            self.pipeline_depth = options.pipeline_depth
+        if options.cache_size:
+            self.cache_size = options.cache_size * 1024 * 1024
+        if options.cache_dir:
+            self.cache_dir = options.cache_dir
+            self.clean_cache = CleanCache(self.cache_dir, self.cache_size)
         self._add_loopback_network()
         if options.networks:    # we have defined networks
             self.networks = options.networks
@@ -1592,7 +4127,7 @@ class SOSCleaner(object):
         if options.domains:
             self.domains.extend(options.domains)
         if options.keywords_file:
-            self.keywords_file = options.keywords_file
+            self.keywords_file.append(options.keywords_file)
         if options.keywords:
             self.keywords = options.keywords
         self._keywords2db()
@@ -1600,7 +4135,23 @@ class SOSCleaner(object):
             self._process_user_option(options.users)
         if options.users_file:
             self.users_file = options.users_file
-        if not sosreport:
+
+    def clean_report(self, options, sosreport):  # pragma: no cover
+        """The primary function, to put everything together and analyze an sosreport."""
+        self._process_options(options)
+        self._profile_mark('setup')
+        # where the report's own hostname, route and users files are read
+        # from. A resumed run reads the originals, as its copies may be clean.
+        root = None
+        records = None
+        top = ''  # top-level directory of a streamed archive
+        if self.resume:
+            if self.stream:
+                raise Exception("RESUME_ERROR: Streamed runs can't be resumed")
+            records = self._load_checkpoints()
+            if records is None and not sosreport:
+                raise Exception("RESUME_ERROR: Nothing to resume in %s" % self.report_dir)
+        if not sosreport and records is None:
             if not options.files:
                 raise Exception(
                     "Error: You must supply either an sosreport and/or files to process")
@@ -1611,42 +4162,172 @@ class SOSCleaner(object):
                     "No sosreport supplied and no networks specified. All IP addresses will be obfuscated into the same default subnet")
             self._clean_files_only(options.files)
 
+        elif self.stream and os.path.isfile(sosreport):
+            # archive-to-archive mode, only the metadata files are staged
+            self.report = sosreport
+            top = self._stage_archive(sosreport, options.hostname_path or 'hostname')
+            self.hostname, self.domainname = self._get_hostname(
+                options.hostname_path or 'hostname')
+            self._process_route_file()
+            if self.hostname:   # if we have a hostname that's not a None type
+                self.hn_db['host0'] = self.hostname
+
         else:   # we DO have an sosreport to analyze
-            self.report = self._extract_sosreport(sosreport)
-            self._make_dest_env()   # create the working directory
+            if records is not None:
+                root = self.report
+            else:
+                self.report = self._extract_sosreport(sosreport)
+                self._profile_mark('extract')
+                self._make_dest_env()   # create the working directory
             if options.hostname_path:
                 self.hostname, self.domainname = self._get_hostname(
-                    options.hostname_path)
+                    options.hostname_path, root=root)
             else:
-                self.hostname, self.domainname = self._get_hostname()
-            self._process_route_file()
-            if options.files:
+                self.hostname, self.domainname = self._get_hostname(root=root)
+            self._process_route_file(root=root)
+            if options.files and records is None:
                 self._add_extra_files(options.files)
             if self.hostname:   # if we have a hostname that's not a None type
                 # we'll prime the hostname pump to clear out a ton of useless logic later
                 self.hn_db['host0'] = self.hostname
 
+        self._profile_mark('copy')
         self._domains2db()
-        files = self._file_list(self.dir_path)
-        self._process_users_file()
+        streaming = self.stream and sosreport and os.path.isfile(sosreport)
+        if not streaming:
+            files = self._file_list(self.dir_path)
+        self._process_users_file(root=root)
+        if records is not None:
+            files = self._resume_checkpoints(records, files)
+        elif sosreport and not streaming:
+            self._start_checkpoints(options.files)
+        self._profile_mark('file list')
         self.logger.con_out(
             "IP Obfuscation Network Created - %s", self.default_net.compressed)
         self.logger.con_out("*** SOSCleaner Processing ***")
         self.logger.info("Working Directory - %s", self.dir_path)
-        for f in files:
-            self.logger.debug("Cleaning %s", f)
-            self._clean_file(f)
-        self.logger.con_out("*** SOSCleaner Statistics ***")
-        self.logger.con_out("IP Addresses Obfuscated - %s", len(self.ip_db))
-        self.logger.con_out("Hostnames Obfuscated - %s", len(self.hn_db))
-        self.logger.con_out("Domains Obfuscated - %s", len(self.dn_db))
-        self.logger.con_out("Users Obfuscated - %s", self.user_count)
-        self.logger.con_out("Keywords Obfuscated - %s", self.kw_count)
-        self.logger.con_out("Total Files Analyzed - %s", self.file_count)
+        if streaming:
+            self._stream_archive(sosreport, options.files, top)
+        else:
+            self._clean_files(files)
+        self._profile_mark('clean')
+        self._log_statistics()
         self.logger.con_out("*** SOSCleaner Artifacts ***")
         self._create_reports()
-        self._create_archive()
+        self._profile_mark('reports')
+        if streaming:
+            self._clean_up()
+        else:
+            self._create_archive()
+            self._end_checkpoints()
+        self._profile_mark('archive')
         self.soscleaner_checksum()
+        self._profile_mark('checksum')
+        if self.profile:
+            self._create_profile_report()
+        self.finalmsg()
+
+        return True
+
+    def _batch_add_report(self, sosreport, hostname_path='hostname'):
+        """Adds one sosreport to a batch run. It is extracted under
+        self.origin_path and its text files are copied to a directory of
+        their own under self.dir_path, named report1, report2 and so on, as
+        sosreport file names carry the hostname. Only the -sosreport.csv
+        report maps the names back to the sosreports. Its hostname, domain,
+        routes and users go into the shared databases. Returns the name of
+        the report's directory.
+        """
+        try:
+            name = "report%s" % (len(self.batch_reports) + 1)
+            self.logger.con_out("Adding %s to the batch as %s", sosreport, name)
+
+            if os.path.isdir(sosreport):
+                report = sosreport
+            else:
+                origin = os.path.join(self.origin_path, name)
+                report = os.path.join(origin, self._extract_archive(sosreport, origin))
+            dest = os.path.join(self.dir_path, name)
+            shutil.copytree(report, dest, symlinks=True, ignore=self._skip_file)
+
+            hostname, domainname = self._get_hostname(hostname_path, root=dest)
+            if hostname is not None and hostname not in self.hostnames:
+                self.hostnames.append(hostname)
+            if domainname is not None and domainname not in self.domains:
+                self.domains.append(domainname)
+            self._process_route_file(root=dest)
+            self._process_users_file(root=dest)
+            self.batch_reports.append(name)
+            self.batch_sources.append(sosreport)
+
+            return name
+
+        except Exception as e:  # pragma: no cover
+            self.logger.exception(e)
+            raise Exception(
+                "BATCH_ADD_REPORT_ERROR: Unable to add sosreport to the batch - %s" % sosreport)
+
+    def _create_batch_archives(self):
+        """Creates one archive, with its checksum files, for each report in a
+        batch run, then cleans up the working directories"""
+        for name in self.batch_reports:
+            t = self._open_archive("%s-%s" % (self.session, name))
+            self.logger.con_out(
+                'Creating SOSCleaner Archive - %s', self.archive_path)
+            prefix = "%s-%s" % (os.path.basename(self.session), name)
+            root = os.path.join(self.dir_path, name)
+            try:
+                for dirpath, dirnames, filenames in os.walk(root):
+                    for f in filenames:
+                        f_full = os.path.join(dirpath, f)
+                        t.add(f_full, arcname=os.path.join(prefix, os.path.relpath(f_full, root)))
+                self._close_archive(t)
+            except Exception:
+                self._abort_archive()
+                raise
+            self.soscleaner_checksum()
+        self._clean_up()
+
+    def clean_batch(self, options, sosreports):  # pragma: no cover
+        """Cleans several sosreports, say from the nodes of one cluster, in a
+        single run. They share one set of obfuscation databases, so a host or
+        IP maps to the same value in every report. Their files are cleaned
+        together by the worker pool, one mapping report is written for the
+        batch and one archive for each sosreport.
+        """
+        if options.resume:
+            raise Exception("RESUME_ERROR: Batch runs can't be resumed")
+        self._process_options(options)
+        if not options.workers:
+            self.workers = multiprocessing.cpu_count()
+        os.makedirs(self.origin_path)
+        os.makedirs(self.dir_path)
+        self._profile_mark('setup')
+        for sosreport in sosreports:
+            self._batch_add_report(sosreport, options.hostname_path or 'hostname')
+        if options.files:
+            os.makedirs(os.path.join(self.dir_path, 'files'))
+            self._add_extra_files(options.files, os.path.join(self.dir_path, 'files'))
+            self.batch_reports.append('files')
+            self.batch_sources.append(','.join(options.files))
+        self._profile_mark('extract')
+        self._domains2db()
+        files = self._file_list(self.dir_path)
+        self._profile_mark('file list')
+        self.logger.con_out(
+            "IP Obfuscation Network Created - %s", self.default_net.compressed)
+        self.logger.con_out("*** SOSCleaner Processing ***")
+        self.logger.info("Working Directory - %s", self.dir_path)
+        self._clean_files(files)
+        self._profile_mark('clean')
+        self._log_statistics(len(sosreports))
+        self.logger.con_out("*** SOSCleaner Artifacts ***")
+        self._create_reports()
+        self._profile_mark('reports')
+        self._create_batch_archives()
+        self._profile_mark('archive')
+        if self.profile:
+            self._create_profile_report()
         self.finalmsg()
 
         return True
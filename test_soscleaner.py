@@ -23,7 +23,10 @@
 
 from ipaddr import IPv4Network, IPv4Address, IPv6Network, IPv6Address
 import shutil
+import stat
+import tarfile
 import os
+import random
 from soscleaner import SOSCleaner
 import unittest
 import sys
@@ -608,17 +611,17 @@ class SOSCleanerTests(unittest.TestCase):
         self.cleaner._create_un_report()
         self.cleaner._create_mac_report()
         self.assertTrue(
-            oct(os.stat(self.cleaner.dn_report).st_mode)[3:] == '0600')
+            stat.S_IMODE(os.stat(self.cleaner.dn_report).st_mode) == 0o600)
         self.assertTrue(
-            oct(os.stat(self.cleaner.ip_report).st_mode)[3:] == '0600')
+            stat.S_IMODE(os.stat(self.cleaner.ip_report).st_mode) == 0o600)
         self.assertTrue(
-            oct(os.stat(self.cleaner.hn_report).st_mode)[3:] == '0600')
+            stat.S_IMODE(os.stat(self.cleaner.hn_report).st_mode) == 0o600)
         self.assertTrue(
-            oct(os.stat(self.cleaner.kw_report).st_mode)[3:] == '0600')
+            stat.S_IMODE(os.stat(self.cleaner.kw_report).st_mode) == 0o600)
         self.assertTrue(
-            oct(os.stat(self.cleaner.un_report).st_mode)[3:] == '0600')
+            stat.S_IMODE(os.stat(self.cleaner.un_report).st_mode) == 0o600)
         self.assertTrue(
-            oct(os.stat(self.cleaner.mac_report).st_mode)[3:] == '0600')
+            stat.S_IMODE(os.stat(self.cleaner.mac_report).st_mode) == 0o600)
 
     def test66_add_single_keywords(self):
         """from issue #86 - add keywords from cli parameters"""
@@ -683,3 +686,956 @@ class SOSCleanerTests(unittest.TestCase):
         new_line = self.cleaner._sub_username(test_line)
         self.assertFalse('bob' in new_line)
         self.assertFalse('BOB' in new_line)
+
+    def test76_clean_files_parallel(self):
+        """Cleaning with a worker pool yields the same mappings as a serial run"""
+        serial_dir = '/tmp/soscleaner-serial-testdir'
+        parallel_dir = '/tmp/soscleaner-parallel-testdir'
+        for d in serial_dir, parallel_dir:
+            shutil.copytree(self.testdir, d, ignore=shutil.ignore_patterns('*.bin'))
+
+        cleaners = []
+        for d, workers in (serial_dir, 1), (parallel_dir, 2):
+            cleaner = SOSCleaner(quiet=True)
+            cleaner.logger = self.cleaner.logger
+            cleaner.hostname = 'myhost'
+            cleaner.domains.extend(['myserver.com', 'foo.com'])
+            cleaner._add_loopback_network()
+            cleaner._ip4_add_network('192.168.0.0/16')
+            cleaner._domains2db()
+            cleaner.workers = workers
+            files = sorted(cleaner._file_list(d))
+            if workers > 1:
+                cleaner._clean_files_parallel(files)
+            else:
+                for f in files:
+                    cleaner._clean_file(f)
+            cleaners.append(cleaner)
+
+        serial, parallel = cleaners
+        self.assertEqual(list(serial.hn_db.items()), list(parallel.hn_db.items()))
+        self.assertEqual(list(serial.dn_db.items()), list(parallel.dn_db.items()))
+        self.assertEqual(list(serial.ip_db.items()), list(parallel.ip_db.items()))
+        self.assertEqual(list(serial.mac_db.keys()), list(parallel.mac_db.keys()))
+        fh = open(os.path.join(parallel_dir, 'var/log/messages'), 'r')
+        data = fh.read()
+        fh.close()
+        self.assertFalse('foohost.foo.com' in data)
+        self.assertTrue(parallel.hn_db['foohost.foo.com'] in data)
+
+    def test77_clean_file_replaces_atomically(self):
+        """_clean_file streams into a sibling file and renames it into place"""
+        test_dir = '/tmp/soscleaner-clean-file-testdir'
+        os.makedirs(test_dir)
+        test_file = os.path.join(test_dir, 'messages')
+        shutil.copyfile('testdata/sosreport_dir/var/log/messages', test_file)
+        os.chmod(test_file, 0o640)
+        self.cleaner.domains.append('foo.com')
+        self.cleaner._domains2db()
+        self.cleaner._clean_file(test_file)
+        self.assertEqual(os.listdir(test_dir), ['messages'])
+        self.assertEqual(os.stat(test_file).st_mode & 0o777, 0o640)
+        fh = open(test_file, 'r')
+        data = fh.readlines()
+        fh.close()
+        self.assertEqual(len(data), 12)
+        self.assertFalse('foohost.foo.com' in data[0])
+
+    def test78_keyword_automaton(self):
+        """Keywords are matched in one pass on word boundaries, longest first"""
+        self.cleaner.keywords = ['foo', 'foo bar', 'bar', 'acme-corp', 'a.b']
+        self.cleaner._keywords2db()
+        self.assertTrue(len(self.cleaner.kw_automaton) > 1)
+        line = 'foo bar foobar xfoo acme-corp a.b axb bar_ bar'
+        new_line = self.cleaner._sub_keywords(line)
+        kw = self.cleaner.kw_db
+        self.assertEqual(new_line, '%s foobar xfoo %s %s axb bar_ %s' % (
+            kw['foo bar'], kw['acme-corp'], kw['a.b'], kw['bar']))
+        self.assertEqual(self.cleaner.kw_match_count, 4)
+
+    def test79_sub_username_lookup(self):
+        """Usernames are matched case-insensitively, including ones that aren't a single word"""
+        self.cleaner._user2db('bob')
+        self.cleaner._user2db('john.doe')
+        test_line = 'bob, BOB and john.doe logged in, but not bobby or john'
+        new_line = self.cleaner._sub_username(test_line)
+        self.assertEqual(new_line, '%s, %s and %s logged in, but not bobby or john' % (
+            self.cleaner.user_db['bob'], self.cleaner.user_db['bob'], self.cleaner.user_db['john.doe']))
+        self.cleaner._user2db('john')
+        new_line = self.cleaner._sub_username(new_line)
+        self.assertFalse('john' in new_line)
+
+    def test80_ip_db_int_keyed(self):
+        """ip_db is keyed on the integer value of the address and keeps report order"""
+        ips = ['192.168.122.100', '10.0.0.1', '192.168.122.5']
+        o_ips = [self.cleaner._ip4_2_db(ip) for ip in ips]
+        self.assertEqual(self.cleaner._ip4_2_db('10.0.0.1'), o_ips[1])
+        self.assertEqual(len(self.cleaner.ip_db), 3)
+        self.assertTrue(self.cleaner._ip4_in_db('192.168.122.5'))
+        self.assertFalse(self.cleaner._ip4_in_db('192.168.122.6'))
+        self.cleaner._create_ip_report()
+        fh = open(self.cleaner.ip_report, 'r')
+        x = fh.readlines()
+        fh.close()
+        self.assertEqual(x[1:], ['%s,%s\n' % pair for pair in zip(ips, o_ips)])
+
+    def test81_find_network_longest_prefix(self):
+        """The most specific network wins, whatever order networks were added in"""
+        self.cleaner._add_loopback_network()
+        self.cleaner._ip4_add_network('10.1.0.0/16')
+        self.cleaner._ip4_add_network('10.0.0.0/8')
+        self.cleaner._ip4_add_network('10.1.2.0/24')
+        self.assertEqual(self.cleaner._ip4_find_network('10.1.2.3'), IPv4Address('131.0.0.0'))
+        self.assertEqual(self.cleaner._ip4_find_network('10.1.3.3'), IPv4Address('129.0.0.0'))
+        self.assertEqual(self.cleaner._ip4_find_network('10.2.3.3'), IPv4Address('130.0.0.0'))
+        self.assertEqual(self.cleaner._ip4_find_network('127.0.0.1'), IPv4Address('127.0.0.0'))
+        self.assertEqual(self.cleaner._ip4_find_network('172.16.0.1'), self.cleaner.default_net.network)
+
+    def test82_domain_suffix_trie(self):
+        """Subdomains are matched on whole labels, not substrings"""
+        self.cleaner.domains.append('example.com')
+        self.cleaner._domains2db()
+        self.assertEqual(self.cleaner._dn_trie_find('sub.example.com'), 'example.com')
+        self.assertEqual(self.cleaner._dn_trie_find('example.com'), 'example.com')
+        self.assertTrue(self.cleaner._dn_trie_find('notexample.com') is None)
+        self.assertTrue(self.cleaner._dn_trie_find('example.com.evil') is None)
+        self.assertTrue(self.cleaner._validate_domainname('host.sub.example.com'))
+        self.assertTrue('sub.example.com' in self.cleaner.dn_db)
+        self.assertEqual(self.cleaner._dn_trie_find('a.sub.example.com'), 'sub.example.com')
+        self.assertFalse(self.cleaner._validate_domainname('host.notredhat.com.evil'))
+        self.assertFalse('notredhat.com.evil' in self.cleaner.dn_db)
+
+    def test83_file_type(self):
+        """Files are classified in-process, including names with shell metacharacters"""
+        self.assertEqual(self.cleaner._file_type('testdata/sosreport_dir/test.txt'), 'ascii text')
+        self.assertEqual(self.cleaner._file_type('testdata/sosreport_dir/test.bin'), 'data')
+        self.assertEqual(self.cleaner._file_type('testdata/sosreport1.tar.gz'), 'gzip compressed data')
+        self.assertEqual(self.cleaner._file_type('testdata/sosreport1.tar.bz'), 'bzip2 compressed data')
+        self.assertEqual(self.cleaner._file_type('testdata/sosreport1.tar.xz'), 'xz compressed data')
+        test_dir = '/tmp/soscleaner-file-type-testdir'
+        os.makedirs(test_dir)
+        odd_name = os.path.join(test_dir, 'a file; with $(odd) name')
+        fh = open(odd_name, 'wb')
+        fh.write(u'héllo wörld\n'.encode('utf-8'))
+        fh.close()
+        self.assertEqual(self.cleaner._file_type(odd_name), 'utf-8 unicode text')
+        open(os.path.join(test_dir, 'empty'), 'w').close()
+        skip_list = self.cleaner._skip_file(test_dir, ['empty', os.path.basename(odd_name)])
+        self.assertEqual(skip_list, ['empty'])
+
+    def test84_stream_archive(self):
+        """An archive is cleaned member by member into the output archive"""
+        top = self.cleaner._stage_archive('testdata/sosreport1.tar.gz', 'hostname')
+        self.assertEqual(top, 'sosreport_dir')
+        self.assertEqual(os.listdir(self.cleaner.dir_path), ['hostname'])
+        self.cleaner.hostname, self.cleaner.domainname = self.cleaner._get_hostname()
+        self.cleaner.hn_db['host0'] = self.cleaner.hostname
+        self.cleaner._add_loopback_network()
+        self.cleaner._domains2db()
+        self.cleaner._stream_archive('testdata/sosreport1.tar.gz', ['testdata/extrafile1'], top)
+        self.assertEqual(self.cleaner.file_count, 4)
+        prefix = os.path.basename(self.cleaner.session)
+        t = tarfile.open(self.cleaner.archive_path)
+        names = t.getnames()
+        self.assertTrue(prefix + '/var/log' in names)
+        self.assertTrue(prefix + '/extrafile1' in names)
+        secure = t.extractfile(prefix + '/var/log/secure').read().decode('utf-8')
+        t.close()
+        self.assertTrue('128.0.0.1' in secure)
+        self.assertFalse('192.168.1.119' in secure)
+
+    def test85_extract_archive_xz(self):
+        """xz archives are extracted in-process and unsafe members are skipped"""
+        test_dir = '/tmp/soscleaner-extract-testdir'
+        os.makedirs(test_dir)
+        archive = os.path.join(test_dir, 'report.tar.xz')
+        t = tarfile.open(archive, 'w:xz')
+        t.add('testdata/sosreport_dir/hostname', arcname='report/hostname')
+        t.add('testdata/sosreport_dir/hostname', arcname='../escaped')
+        t.close()
+        top = self.cleaner._extract_archive(archive, os.path.join(test_dir, 'out'))
+        self.assertEqual(top, 'report')
+        self.assertTrue(os.path.isfile(os.path.join(test_dir, 'out', 'report', 'hostname')))
+        self.assertFalse(os.path.exists(os.path.join(test_dir, 'escaped')))
+        # only a './' prefix is stripped, so dotfiles don't hide a top-level directory
+        archive = os.path.join(test_dir, 'dotted.tar.xz')
+        t = tarfile.open(archive, 'w:xz')
+        t.add('testdata/sosreport_dir/hostname', arcname='./hidden/hostname')
+        t.add('testdata/sosreport_dir/hostname', arcname='./.hidden')
+        t.close()
+        self.assertEqual(self.cleaner._extract_archive(archive, os.path.join(test_dir, 'dotted')), '')
+        self.assertTrue(os.path.isfile(os.path.join(test_dir, 'dotted', '.hidden')))
+
+    def test86_block_compressor(self):
+        """Blocks compressed in parallel read back as one gzip or xz file"""
+        import gzip
+        import lzma
+        from soscleaner import BlockCompressor
+        data = b''.join(b'line %d of the test data\n' % i for i in range(20000))
+        test_dir = '/tmp/soscleaner-compress-testdir'
+        os.makedirs(test_dir)
+        for compression, reader in ('gz', gzip.decompress), ('xz', lzma.decompress), ('none', bytes):
+            name = os.path.join(test_dir, 'out.' + compression)
+            w = BlockCompressor(open(name, 'wb'), compression, threads=3, block_size=4096)
+            for i in range(0, len(data), 1000):
+                w.write(data[i:i + 1000])
+            w.close()
+            self.assertEqual(w.bytes_in, len(data))
+            self.assertEqual(w.bytes_out, os.path.getsize(name))
+            self.assertEqual(reader(open(name, 'rb').read()), data)
+        with self.assertRaises(ValueError):
+            BlockCompressor(open(os.path.join(test_dir, 'bad.gz'), 'wb'), 'gz', level=12)
+
+    def test87_create_archive_xz(self):
+        """The output archive can be xz compressed and still gets its md5 file"""
+        dir_test = '/tmp/soscleaner-path-testdir'
+        shutil.copytree(self.testdir, dir_test)
+        self.cleaner.origin_path = None
+        self.cleaner.dir_path = dir_test
+        self.cleaner.compression = 'xz'
+        self.cleaner._create_archive()
+        self.assertTrue(self.cleaner.archive_path.endswith('.tar.xz'))
+        self.assertEqual(os.stat(self.cleaner.archive_path).st_mode & 0o777, 0o600)
+        t = tarfile.open(self.cleaner.archive_path)
+        self.assertTrue(len(t.getnames()) > 0)
+        t.close()
+        self.cleaner.soscleaner_checksum()
+        self.assertTrue(os.path.isfile(self.cleaner.archive_path + '.md5'))
+
+    def test88_checksum_while_writing(self):
+        """md5 and sha256 side files match the archive without re-reading it"""
+        import hashlib
+        dir_test = '/tmp/soscleaner-path-testdir'
+        shutil.copytree(self.testdir, dir_test)
+        self.cleaner.origin_path = None
+        self.cleaner.dir_path = dir_test
+        self.cleaner._create_archive()
+        self.cleaner.soscleaner_checksum()
+        data = open(self.cleaner.archive_path, 'rb').read()
+        for name in 'md5', 'sha256':
+            fh = open('%s.%s' % (self.cleaner.archive_path, name))
+            self.assertEqual(fh.read(), hashlib.new(name, data).hexdigest() + '\n')
+            fh.close()
+
+    def test89_batch_shared_mappings(self):
+        """Reports cleaned in one batch map the same host and IP the same way"""
+        test_dir = '/tmp/soscleaner-batch-testdir'
+        for n, other in (1, 2), (2, 1):
+            node = os.path.join(test_dir, 'node%s' % n)
+            os.makedirs(node)
+            fh = open(os.path.join(node, 'hostname'), 'w')
+            fh.write('node%s.myserver.com\n' % n)
+            fh.close()
+            fh = open(os.path.join(node, 'messages'), 'w')
+            fh.write('sshd: connect from node%s.myserver.com (10.0.0.%s)\n' % (other, other))
+            fh.write('kernel: up on 10.0.0.%s\n' % n)
+            fh.close()
+            t = tarfile.open(os.path.join(test_dir, 'sosreport-node%s.tar.xz' % n), 'w:xz')
+            t.add(node, arcname='node%s' % n)
+            t.close()
+        os.makedirs(self.cleaner.origin_path)
+        os.makedirs(self.cleaner.dir_path)
+        for n in 1, 2:
+            name = self.cleaner._batch_add_report(os.path.join(test_dir, 'sosreport-node%s.tar.xz' % n))
+            self.assertEqual(name, 'report%s' % n)
+        self.assertEqual(self.cleaner.hostnames, ['node1', 'node2'])
+        self.assertEqual(self.cleaner.domains.count('myserver.com'), 1)
+        self.cleaner._add_loopback_network()
+        self.cleaner._domains2db()
+        for f in self.cleaner._file_list(self.cleaner.dir_path):
+            self.cleaner._clean_file(f)
+        data = {}
+        for n in 1, 2:
+            fh = open(os.path.join(self.cleaner.dir_path, 'report%s' % n, 'messages'))
+            data[n] = fh.read()
+            fh.close()
+            self.assertFalse('node' in data[n])
+        o_node2 = self.cleaner._hn2db('node2.myserver.com')
+        self.assertTrue(o_node2 in data[1])
+        self.assertTrue(o_node2 in open(os.path.join(
+            self.cleaner.dir_path, 'report2', 'hostname')).read())
+        o_ip = self.cleaner._ip4_2_db('10.0.0.1')
+        self.assertTrue(o_ip in data[1] and o_ip in data[2])
+
+    def test90_tokenizer_matches_chain(self):
+        """The single-pass tokenizer gives the same lines and databases as the _sub_* chain"""
+        lines = [
+            "Jun 24 21:06:01 myhost sshd[1]: Accepted publickey for jdoe from 192.168.1.50 port 22\n",
+            "myhost.myserver.com,foo.com/web.foo.com=10.0.0.1:myhost\n",
+            "lookup 10.0.0.1.in-addr.arpa for MyHost and 10.0.0.12 then 10.0.0.1\n",
+            "a.sub.myserver.com sub.myserver.com -myhost x-1.2.3.4 libfoo.so.1\n",
+            "eth0 link/ether aa:bb:cc:dd:ee:ff brd ff:ff:ff:ff:ff:ff on myhost.myserver.com\n",
+            "nothing to see here\n",
+            # addresses run together, found as text by str.replace
+            "db110.0.0.110.0.0.1.in-addr.arpa x10.0.0.1.1.2.3.256 x-1.2.3.4.10.0.0.12.\n",
+        ]
+        cleaners = list()
+        for tokenizer in False, True:
+            cleaner = SOSCleaner(quiet=True)
+            cleaner.logger = self.cleaner.logger
+            cleaner.tokenizer = tokenizer
+            cleaner.hostname = 'myhost'
+            cleaner.obfuscate_macs = True
+            cleaner.domains.extend(['myserver.com', 'foo.com'])
+            cleaner._add_loopback_network()
+            cleaner._ip4_add_network('10.0.0.0/8')
+            cleaner._ip4_add_network('192.168.0.0/16')
+            cleaner._domains2db()
+            random.seed(90)  # MAC addresses are obfuscated with random values
+            cleaner.cleaned = [cleaner._clean_line(line, 'messages') for line in lines]
+            cleaners.append(cleaner)
+        chain, tokenizer = cleaners
+        self.assertTrue(tokenizer.token_pattern is not None)
+        self.assertEqual(tokenizer.cleaned, chain.cleaned)
+        self.assertEqual(tokenizer.hn_db, chain.hn_db)
+        self.assertEqual(tokenizer.dn_db, chain.dn_db)
+        self.assertEqual(list(tokenizer.ip_db.items()), list(chain.ip_db.items()))
+        self.assertEqual(tokenizer.mac_db, chain.mac_db)
+        self.assertEqual(tokenizer.hostname_count, chain.hostname_count)
+        self.assertFalse('myhost' in ''.join(tokenizer.cleaned).lower())
+
+        # short names that are part of an obfuscated value leave lines to the chain
+        tokenizer._build_tokenizer(['host'], None)
+        self.assertTrue(tokenizer.token_pattern is not None)
+        for name in 'host3', 'Obfuscatedhost12', 'ofuscateddomain1', 'com':
+            tokenizer._build_tokenizer([name], None)
+            self.assertTrue(tokenizer.token_pattern is None)
+
+    def test91_prefilter_skips(self):
+        """Lines without a dot or a hex run skip the hostname, IP and MAC passes"""
+        self.cleaner.hostname = 'myhost'
+        self.cleaner.obfuscate_macs = True
+        self.cleaner.domains = ['myserver.com']
+        self.cleaner._domains2db()
+        self.cleaner._add_loopback_network()
+        lines = [
+            "kernel: eth0 link up\n",
+            "sshd: connect from 127.0.0.1 to somehost.myserver.com\n",
+            "link/ether aa:bb:cc:dd:ee:ff on myhost\n",
+        ]
+        for tokenizer in True, False:
+            self.cleaner.tokenizer = tokenizer
+            self.cleaner.prefilter_counts.clear()
+            cleaned = [self.cleaner._clean_line(line, 'messages') for line in lines]
+            self.assertEqual(cleaned[0], lines[0])
+            self.assertFalse('myserver' in cleaned[1])
+            self.assertFalse('aa:bb:cc:dd:ee:ff' in cleaned[2] or 'myhost' in cleaned[2])
+            self.assertEqual(self.cleaner.prefilter_counts['lines'], 3)
+            self.assertEqual(self.cleaner.prefilter_counts['mac'], 2)
+            self.assertEqual(self.cleaner.prefilter_counts['hostname'], 2)
+            self.assertEqual(self.cleaner.prefilter_counts['ip'], 2)
+        self.cleaner.prefilter_counts.clear()
+        self.cleaner._clean_line(lines[0], 'sos_commands/rpm/package-data')
+        self.assertEqual(self.cleaner.prefilter_counts['hostname'], 0)
+
+    def test92_clean_cache(self):
+        """Identical files are cleaned once and then copied from the cache"""
+        from soscleaner import CleanCache
+        test_dir = '/tmp/soscleaner-cache-testdir'
+        os.makedirs(test_dir)
+        self.cleaner.hostname = 'myhost'
+        self.cleaner.domains = ['myserver.com']
+        self.cleaner._domains2db()
+        self.cleaner._add_loopback_network()
+        self.cleaner.clean_cache = CleanCache(os.path.join(test_dir, 'cache'), 1024 * 1024)
+        # entries keep the original values, so only the owner can read them
+        self.assertEqual(os.stat(os.path.join(test_dir, 'cache')).st_mode & 0o777, 0o700)
+        content = 'myhost sshd: connect from web.myserver.com (127.0.0.5)\n' * 10
+        for name in 'a', 'b', 'c':
+            fh = open(os.path.join(test_dir, name), 'w')
+            fh.write(content if name != 'c' else 'myserver.com says hi\n')
+            fh.close()
+            self.cleaner._clean_file(os.path.join(test_dir, name))
+        cleaned = [open(os.path.join(test_dir, name)).read() for name in ('a', 'b')]
+        self.assertEqual(cleaned[0], cleaned[1])
+        self.assertFalse('myserver' in cleaned[0] or 'myhost' in cleaned[0])
+        # c looks up a two-level hostname, which bumps hostname_count every time
+        self.assertEqual(dict(self.cleaner.cache_counts), {'misses': 2, 'stored': 1, 'hits': 1, 'uncacheable': 1})
+        self.assertEqual(self.cleaner.prefilter_counts['lines'], 21)
+
+        # the same file cleaned against different mappings isn't a hit
+        key = self.cleaner._cache_key(os.path.join(test_dir, 'c'))
+        self.assertTrue(self.cleaner._cache_find(key, os.path.join(test_dir, 'c')) is None)
+        other = SOSCleaner(quiet=True)
+        other.logger = self.cleaner.logger
+        other.hostname = 'myhost'
+        other.domains = ['myserver.com']
+        other._domains2db()
+        other._add_loopback_network()
+        other.clean_cache = self.cleaner.clean_cache
+        other._ip4_2_db('127.0.0.9')
+        fh = open(os.path.join(test_dir, 'd'), 'w')
+        fh.write(content)
+        fh.close()
+        other._clean_file(os.path.join(test_dir, 'd'))
+        self.assertEqual(other.cache_counts['hits'], 0)
+        self.assertNotEqual(open(os.path.join(test_dir, 'd')).read(), cleaned[0])
+
+        self.cleaner.clean_cache.max_size = 0
+        self.assertEqual(self.cleaner.clean_cache.evict(), 1)
+
+    def test93_profile_report(self):
+        """With profiling on, stages, passes and files are timed and written out as JSON"""
+        import json
+        self.cleaner._start_profiling()
+        self.cleaner._profile_mark('setup')
+        self.cleaner.hostname = 'myhost'
+        self.cleaner._add_loopback_network()
+        test_dir = '/tmp/soscleaner-profile-testdir'
+        os.makedirs(test_dir)
+        for name in 'a', 'b':
+            fh = open(os.path.join(test_dir, name), 'w')
+            fh.write('myhost: connect from 127.0.0.5\n' * (10 if name == 'a' else 1000))
+            fh.close()
+            self.cleaner._clean_file(os.path.join(test_dir, name))
+        self.cleaner._profile_mark('clean')
+        self.cleaner.profile_top = 1
+        self.cleaner._create_profile_report()
+        self.assertTrue(self.cleaner.profile_report.endswith('-profile.json'))
+        profile = json.load(open(self.cleaner.profile_report))
+        self.assertEqual([s['stage'] for s in profile['stages']], ['setup', 'clean'])
+        self.assertEqual(profile['passes']['keywords']['calls'], 1010)
+        self.assertEqual(profile['passes']['tokenizer']['calls'], 1010)
+        self.assertTrue(profile['passes']['tokenizer']['wall'] > 0)
+        self.assertFalse('hostname' in profile['passes'])
+        self.assertEqual(len(profile['slowest_files']), 1)
+        self.assertTrue(profile['slowest_files'][0]['file'].endswith('b'))
+        self.assertEqual(profile['lines'], 1010)
+
+    def test94_substitution_counts(self):
+        """Substitutions are counted by type and summarized per file"""
+        self.cleaner.hostname = 'myhost'
+        self.cleaner.domains = ['myserver.com']
+        self.cleaner._domains2db()
+        self.cleaner._add_loopback_network()
+        self.cleaner._user2db('jdoe')
+        self.cleaner.keywords = ['secret']
+        self.cleaner._keywords2db()
+        self.assertFalse(self.cleaner.debug)
+        test_dir = '/tmp/soscleaner-subs-testdir'
+        os.makedirs(test_dir)
+        fh = open(os.path.join(test_dir, 'messages'), 'w')
+        fh.write('myhost sshd: secret login for jdoe from web.myserver.com (127.0.0.5)\n')
+        fh.write('link/ether aa:bb:cc:dd:ee:ff on myhost, 127.0.0.6 and 127.0.0.5\n')
+        fh.write('nothing here\n')
+        fh.close()
+        records = list()
+        self.cleaner._log_substitutions = lambda f, counts: records.append((f, dict(counts)))
+        self.cleaner._clean_file(os.path.join(test_dir, 'messages'))
+        expected = {'keyword': 1, 'username': 1, 'hostname': 3, 'ip': 3, 'mac': 1}
+        self.assertEqual(dict(self.cleaner.sub_counts), expected)
+        self.assertEqual(records, [(os.path.join(test_dir, 'messages'), expected)])
+
+    def test95_mapped_file_matches_lines(self):
+        """Large files cleaned through mmap come out the same as line by line"""
+        test_dir = '/tmp/soscleaner-mmap-testdir'
+        os.makedirs(test_dir)
+        lines = [
+            "kernel: usb 1-1: new high-speed USB device number 2\n",
+            "Jun 24 21:06:01 myhost sshd[1]: Accepted publickey for jdoe from 10.0.0.5 port 22\n",
+            "systemd[1]: Started Session 4 of user root.\n",
+            "nfs: server nas1.myserver.com not responding, secret mount\n",
+            "eth0 link/ether aa:bb:cc:dd:ee:ff brd ff:ff:ff:ff:ff:ff\n",
+            "café LOCALHOST\n",
+        ]
+        cleaners = list()
+        for threshold in None, 1:
+            random.seed(95)  # obfuscated users and MAC addresses are random
+            cleaner = SOSCleaner(quiet=True)
+            cleaner.logger = self.cleaner.logger
+            cleaner.mmap_threshold = threshold
+            cleaner.buffer_size = 100
+            cleaner.hostname = 'myhost'
+            cleaner.domains.append('myserver.com')
+            cleaner._add_loopback_network()
+            cleaner._ip4_add_network('10.0.0.0/8')
+            cleaner._domains2db()
+            cleaner._user2db('jdoe')
+            cleaner.keywords = ['secret']
+            cleaner._keywords2db()
+            path = os.path.join(test_dir, 'messages')
+            with open(path, 'w') as fh:
+                fh.writelines(lines * 20)
+            cleaner._clean_file(path)
+            cleaner.cleaned = open(path, 'rb').read()
+            cleaners.append(cleaner)
+        lines_path, mapped = cleaners
+        self.assertEqual(mapped.cleaned, lines_path.cleaned)
+        self.assertEqual(mapped.hn_db, lines_path.hn_db)
+        self.assertEqual(list(mapped.ip_db.items()), list(lines_path.ip_db.items()))
+        self.assertEqual(mapped.hostname_count, lines_path.hostname_count)
+        self.assertEqual(mapped.sub_counts, lines_path.sub_counts)
+        self.assertEqual(mapped.prefilter_counts['lines'], 120)
+        self.assertEqual(mapped.prefilter_counts['mapped'], 40)
+        self.assertEqual(lines_path.prefilter_counts['mapped'], 0)
+        self.assertFalse(b'myhost' in mapped.cleaned or b'secret' in mapped.cleaned)
+
+    def test96_clean_file_keeps_bytes(self):
+        """Bytes that aren't UTF-8 and CRLF line ends survive cleaning unchanged"""
+        self.cleaner.hostname = 'myhost'
+        self.cleaner._add_loopback_network()
+        test_dir = '/tmp/soscleaner-bytes-testdir'
+        os.makedirs(test_dir)
+        path = os.path.join(test_dir, 'dmesg')
+        data = b'caf\xe9 \xff\xfe myhost\r\nfrom 127.0.0.5\r\n\x1b[1mbold\x1b[0m\n'
+        for threshold in None, 1:
+            self.cleaner.mmap_threshold = threshold
+            with open(path, 'wb') as fh:
+                fh.write(data)
+            self.cleaner._clean_file(path)
+            cleaned = open(path, 'rb').read()
+            self.assertEqual(cleaned, data.replace(b'myhost', self.cleaner._hn2db('myhost').encode())
+                             .replace(b'127.0.0.5', self.cleaner._ip4_2_db('127.0.0.5').encode()))
+
+    def test97_checkpoint_journal(self):
+        """Replaying the checkpoint journal restores the databases of a run, and a torn record is dropped"""
+        from soscleaner import CheckpointJournal
+        test_dir = os.path.join(self.cleaner.dir_path, 'checkpoint')
+        os.makedirs(test_dir)
+        self.cleaner.report = test_dir
+        self.cleaner.hostname = 'myhost'
+        self.cleaner.domains.append('myserver.com')
+        self.cleaner._add_loopback_network()
+        self.cleaner._domains2db()
+        self.cleaner.checkpoint_batch = 2
+        self.cleaner._start_checkpoints()
+        files = list()
+        for i, line in enumerate(["myhost on 127.0.0.5\n", "db1.myserver.com on 127.0.0.6\n",
+                                  "nas.myserver.com and myhost\n"]):
+            files.append(os.path.join(test_dir, 'file%s' % i))
+            with open(files[-1], 'w') as fh:
+                fh.write(line)
+        self.cleaner._clean_files(files)
+        path = self.cleaner.checkpoints.path
+        records = CheckpointJournal(path).load()
+        self.assertEqual([r.get('file') for r in records],
+                         [None, 'checkpoint/file0', 'checkpoint/file1', 'checkpoint/file2'])
+
+        restored = SOSCleaner(quiet=True)
+        restored._start_logging(os.devnull)
+        restored._add_loopback_network()
+        for record in records:
+            restored._apply_checkpoint(record)
+        for name in SOSCleaner.CHECKPOINT_DBS:
+            self.assertEqual(list(getattr(restored, name).items()), list(getattr(self.cleaner, name).items()))
+        self.assertEqual(restored.hostname_count, self.cleaner.hostname_count)
+        self.assertEqual(restored.domain_count, self.cleaner.domain_count)
+        self.assertEqual(restored.net_metadata, self.cleaner.net_metadata)
+        self.assertEqual(restored._sub_hostname("db1.myserver.com", False),
+                         self.cleaner._sub_hostname("db1.myserver.com", False))
+
+        with open(path, 'a') as fh:
+            fh.write('{"file": "checkpoint/file3", "db"')
+        self.assertEqual(len(CheckpointJournal(path).load()), 4)
+        self.assertTrue(open(path).read().endswith('}\n'))
+        self.cleaner._end_checkpoints()
+        self.assertFalse(os.path.exists(path))
+
+    def test98_split_files_match_serial(self):
+        """Big files are cleaned in pieces by a parallel run, largest first, with the same result as a serial run"""
+        lines = ["Jun 24 21:06:01 myhost sshd[1]: Accepted publickey from 192.168.1.%s port 22\n" % i
+                 for i in range(40)]
+        lines += ["nfs: server nas%s.myserver.com not responding\n" % i for i in range(20)]
+        lines += ["Started Session %s of user root.\n" % i for i in range(60)]
+        random.Random(98).shuffle(lines)
+        cleaners = []
+        for name, workers in ('serial', 1), ('split', 2):
+            test_dir = '/tmp/soscleaner-%s-testdir' % name
+            os.makedirs(test_dir)
+            with open(os.path.join(test_dir, 'messages'), 'w') as fh:
+                fh.writelines(lines * 5)
+            with open(os.path.join(test_dir, 'hosts'), 'w') as fh:
+                fh.write("192.168.1.7 nas3.myserver.com\n")
+            cleaner = SOSCleaner(quiet=True)
+            cleaner.logger = self.cleaner.logger
+            cleaner.hostname = 'myhost'
+            cleaner.domains.append('myserver.com')
+            cleaner.obfuscate_macs = False
+            cleaner._add_loopback_network()
+            cleaner._ip4_add_network('192.168.0.0/16')
+            cleaner._domains2db()
+            cleaner.workers = workers
+            cleaner.split_size = 1000
+            cleaner.mmap_threshold = 1 if workers > 1 else None
+            cleaner.dir_path = test_dir
+            files = sorted(cleaner._file_list(test_dir))
+            cleaner._clean_files(files)
+            cleaner.cleaned = [open(f, 'rb').read() for f in files]
+            cleaner.files = sorted(os.listdir(test_dir))
+            cleaners.append(cleaner)
+
+        serial, split = cleaners
+        batches = split._schedule(files)
+        tasks = [task for batch in batches for task in batch]
+        self.assertEqual(tasks[0][1], files[1])
+        self.assertEqual(tasks[-1][1], files[0])
+        self.assertTrue(len(tasks) > 20)
+        self.assertEqual(split.cleaned, serial.cleaned)
+        self.assertEqual(split.files, ['hosts', 'messages'])
+        self.assertEqual(list(split.hn_db.items()), list(serial.hn_db.items()))
+        self.assertEqual(list(split.ip_db.items()), list(serial.ip_db.items()))
+        self.assertEqual(split.sub_counts, serial.sub_counts)
+        self.assertEqual(split.prefilter_counts['lines'], serial.prefilter_counts['lines'])
+
+    def test99_pipelined_clean(self):
+        """The read/clean/write pipeline writes the same files as cleaning them one by one, and reports its stalls"""
+        from soscleaner import FilePipeline
+        cleaned = []
+        for depth in 0, 2:
+            test_dir = '/tmp/soscleaner-pipeline-%s-testdir' % depth
+            shutil.copytree(self.testdir, test_dir, ignore=shutil.ignore_patterns('*.bin'))
+            cleaner = SOSCleaner(quiet=True)
+            cleaner.logger = self.cleaner.logger
+            cleaner.hostname = 'myhost'
+            cleaner.domains.extend(['myserver.com', 'foo.com'])
+            cleaner._add_loopback_network()
+            cleaner._ip4_add_network('192.168.0.0/16')
+            cleaner._domains2db()
+            cleaner.obfuscate_macs = False
+            cleaner.pipeline_depth = depth
+            cleaner.mmap_threshold = 1024
+            files = sorted(cleaner._file_list(test_dir))
+            cleaner._clean_files(files)
+            cleaned.append([open(f, 'rb').read() if not os.path.islink(f) else None for f in files])
+            self.assertEqual([f for f in os.listdir(test_dir) if f.startswith('.soscleaner-')], [])
+        self.assertEqual(cleaned[0], cleaned[1])
+        self.assertEqual(cleaner.pipeline_stats['depth'], 2)
+        self.assertTrue(cleaner.pipeline_stats['queues']['read']['max'] <= 2)
+        self.assertTrue('clean input' in cleaner.pipeline_stats['stalls'])
+
+        pipeline = FilePipeline([], 1)
+        with self.assertRaises(OSError):
+            pipeline.open('/tmp/soscleaner-pipeline-missing/messages').close()
+            pipeline.commit('/tmp/soscleaner-pipeline-missing/messages')
+            pipeline.close()
+        self.assertEqual(pipeline.failed, '/tmp/soscleaner-pipeline-missing/messages')
+
+    def test100_file_policy(self):
+        """Files only get keywords obfuscated per false_positives and the FileConfig exclude globs, unless included"""
+        test_dir = '/tmp/soscleaner-policy-testdir'
+        os.makedirs(test_dir)
+        config = os.path.join(test_dir, 'soscleaner.conf')
+        with open(config, 'w') as fh:
+            fh.write("[FileConfig]\nexclude: var/log/audit/*, *.rpmnew\ninclude: sos_commands/rpm/package-data\n")
+        self.cleaner.config_file = config
+        self.cleaner._read_later_config_options()
+        self.assertEqual(self.cleaner.policy_excludes, ['var/log/audit/*', '*.rpmnew'])
+        self.assertTrue(self.cleaner._file_policy('/tmp/soscleaner-1/var/log/messages'))
+        self.assertFalse(self.cleaner._file_policy('/tmp/soscleaner-1/sos_commands/rpm/sha256'))
+        self.assertFalse(self.cleaner._file_policy('/tmp/soscleaner-1/var/log/audit/audit.log'))
+        self.assertFalse(self.cleaner._file_policy('etc/yum.conf.rpmnew'))
+        self.assertTrue(self.cleaner._file_policy('/tmp/soscleaner-1/sos_commands/rpm/package-data'))
+        self.assertTrue(self.cleaner._file_policy('myvar/log/audit/audit.log'))
+
+        self.cleaner.hostname = 'myhost'
+        self.cleaner._add_loopback_network()
+        line = "myhost 127.0.0.5\n"
+        self.assertEqual(self.cleaner._clean_line(line, 'var/log/audit/audit.log'), line)
+        self.assertNotEqual(self.cleaner._clean_line(line, 'var/log/audit/audit.log', True), line)
+        self.cleaner.policy_includes.append('audit.log')
+        self.assertNotEqual(self.cleaner._clean_line(line, 'var/log/audit/audit.log'), line)
+
+    def test101_stream_archive_top(self):
+        """Streaming only strips a real top-level directory, so flat archives and look-alike names keep their paths"""
+        test_dir = '/tmp/soscleaner-stream-top-testdir'
+        os.makedirs(os.path.join(test_dir, 'var', 'log'))
+        os.makedirs(os.path.join(test_dir, 'sosreport-ab'))
+        shutil.copyfile('testdata/sosreport_dir/hostname', os.path.join(test_dir, 'hostname'))
+        shutil.copyfile('testdata/sosreport_dir/var/log/messages', os.path.join(test_dir, 'var', 'log', 'messages'))
+        shutil.copyfile('testdata/sosreport_dir/hostname', os.path.join(test_dir, 'sosreport-ab', 'x'))
+        self.assertEqual(self.cleaner._archive_rel('sosreport-ab/x', 'sosreport-a'), 'sosreport-ab/x')
+        self.assertEqual(self.cleaner._archive_rel('./sosreport-a/x', 'sosreport-a'), 'x')
+        self.assertEqual(self.cleaner._archive_rel('./.hidden', ''), '.hidden')
+        self.assertEqual(self.cleaner._archive_top(['./', './.hidden', './hidden/x']), '')
+        self.assertEqual(self.cleaner._archive_top(['.', './report', './report/.x']), 'report')
+        archive = os.path.join(test_dir, 'flat.tar.gz')
+        t = tarfile.open(archive, 'w:gz')
+        for name in 'hostname', 'var', 'sosreport-ab':
+            t.add(os.path.join(test_dir, name), arcname=name)
+        t.close()
+        top = self.cleaner._stage_archive(archive, 'hostname')
+        self.assertEqual(top, '')
+        self.cleaner.hostname, self.cleaner.domainname = self.cleaner._get_hostname()
+        self.cleaner._add_loopback_network()
+        self.cleaner._domains2db()
+        self.cleaner._stream_archive(archive, None, top)
+        prefix = os.path.basename(self.cleaner.session)
+        t = tarfile.open(self.cleaner.archive_path)
+        members = dict((m.name, m) for m in t.getmembers())
+        t.close()
+        self.assertTrue(members[prefix + '/hostname'].isreg())
+        self.assertTrue(members[prefix + '/var'].isdir())
+        self.assertTrue(prefix + '/var/log/messages' in members)
+        self.assertTrue(prefix + '/sosreport-ab/x' in members)
+        self.assertFalse(prefix in members)
+
+    def test102_xz_blocks(self):
+        """xz blocks are big enough for the dictionary and the threads fit in memory"""
+        import lzma
+        import soscleaner
+        from soscleaner import BlockCompressor
+        data = b''.join(b'line %d of the test data\n' % i for i in range(100000))
+        test_dir = '/tmp/soscleaner-xz-testdir'
+        os.makedirs(test_dir)
+        name = os.path.join(test_dir, 'out.xz')
+        w = BlockCompressor(open(name, 'wb'), 'xz', level=0, threads=2, block_size=4096)
+        self.assertEqual(w.block_size, 3 * 256 * 1024)
+        for i in range(0, len(data), 1000):
+            w.write(data[i:i + 1000])
+        w.close()
+        self.assertTrue(len(data) > 2 * w.block_size)
+        self.assertEqual(lzma.decompress(open(name, 'rb').read()), data)
+        limit = soscleaner._memory_limit()
+        w = BlockCompressor(open(os.path.join(test_dir, 'big.xz'), 'wb'), 'xz', threads=100000)
+        self.assertEqual(w.block_size, 3 * 8 * 1024 * 1024)
+        self.assertTrue(w.threads * (94 + 24) * 1024 * 1024 <= max(limit, 118 * 1024 * 1024))
+        w.close()
+
+    def test103_abort_archive(self):
+        """An archive that fails part way through is removed and its compressor threads stopped"""
+        test_dir = '/tmp/soscleaner-abort-testdir'
+        os.makedirs(test_dir)
+        archive = os.path.join(test_dir, 'truncated.tar.gz')
+        t = tarfile.open(archive, 'w:gz')
+        t.add(self.testdir, arcname='sosreport-abort')
+        t.close()
+        top = self.cleaner._stage_archive(archive, 'hostname')
+        self.cleaner.hostname, self.cleaner.domainname = self.cleaner._get_hostname()
+        self.cleaner._add_loopback_network()
+        self.cleaner._domains2db()
+        with open(archive, 'rb') as fh:
+            data = fh.read()
+        with open(archive, 'wb') as fh:
+            fh.write(data[:len(data) // 2])
+        with self.assertRaises(Exception):
+            self.cleaner._stream_archive(archive, None, top)
+        self.assertFalse(os.path.exists(self.cleaner.archive_path))
+        self.assertTrue(self.cleaner.archive_writer.fileobj.closed)
+        with self.assertRaises(ValueError):
+            self.cleaner.archive_writer.pool.apply_async(len, ('',))
+
+    def test104_pipeline_write_failed(self):
+        """A writer error from an earlier file is reported against that file, not the one being cleaned"""
+        import time
+        from soscleaner import FilePipeline
+        test_dir = '/tmp/soscleaner-pipeline-failed-testdir'
+        os.makedirs(test_dir)
+        f = os.path.join(test_dir, 'hostname')
+        shutil.copyfile('testdata/sosreport_dir/hostname', f)
+        missing = '/tmp/soscleaner-pipeline-missing/messages'
+        pipeline = FilePipeline([], 1)
+        pipeline.open(missing).close()
+        pipeline.commit(missing)
+        while pipeline.error is None:
+            time.sleep(0.01)
+        with self.assertRaises(Exception) as raised:
+            self.cleaner._clean_file(f, None, pipeline)
+        self.assertTrue(str(raised.exception).endswith(missing))
+        pipeline.close()
+
+    def test105_clean_batch(self):
+        """A batch run writes an archive for each sosreport, cleaned with one set of mappings"""
+        import glob
+        import runpy
+        test_dir = '/tmp/soscleaner-batch-run-testdir'
+        os.makedirs(os.path.join(test_dir, 'out'))
+        for name in 'r1', 'r2':
+            shutil.copytree(self.testdir, os.path.join(test_dir, name))
+        with open(os.path.join(test_dir, 'r2', 'hostname'), 'w') as fh:
+            fh.write('other.myserver.com\n')
+        with open(os.path.join(test_dir, 'r2', 'var', 'log', 'messages'), 'a') as fh:
+            fh.write('ping from myhost.myserver.com 192.168.1.119\n')
+        argv = sys.argv
+        sys.argv = ['soscleaner', '-b', '-q', '-w', '2', '-o', os.path.join(test_dir, 'out'),
+                    os.path.join(test_dir, 'r1'), os.path.join(test_dir, 'r2')]
+        try:
+            with self.assertRaises(SystemExit) as done:
+                runpy.run_path('scripts/soscleaner', run_name='__main__')
+        finally:
+            sys.argv = argv
+        self.assertEqual(done.exception.code, 0)
+        cleaned = dict()
+        for n in 1, 2:
+            archives = glob.glob(os.path.join(test_dir, 'out', '*', '*-report%s.tar.gz' % n))
+            self.assertEqual(len(archives), 1)
+            self.assertTrue(os.path.isfile(archives[0] + '.md5'))
+            t = tarfile.open(archives[0])
+            prefix = os.path.basename(archives[0])[:-len('.tar.gz')]
+            for f in 'hostname', 'var/log/messages', 'var/log/secure':
+                cleaned[(n, f)] = t.extractfile('%s/%s' % (prefix, f)).read().decode('utf-8')
+            t.close()
+        ip_report = glob.glob(os.path.join(test_dir, 'out', '*', '*-ip.csv'))[0]
+        ips = dict(line.strip().split(',') for line in open(ip_report))
+        ping = cleaned[(2, 'var/log/messages')].splitlines()[-1]
+        self.assertTrue(cleaned[(1, 'hostname')].strip() in ping)
+        self.assertTrue(ips['192.168.1.119'] in ping)
+        self.assertTrue(ips['192.168.1.119'] in cleaned[(1, 'var/log/secure')])
+        self.assertNotEqual(cleaned[(1, 'hostname')], cleaned[(2, 'hostname')])
+        self.assertFalse('myhost' in ping or '192.168.1.119' in ping)
+
+    def test106_resume(self):
+        """A run stopped part way and resumed from its checkpoints ends up as an uninterrupted run"""
+        from soscleaner import CheckpointJournal
+        test_dir = '/tmp/soscleaner-resume-testdir'
+        report = os.path.join(test_dir, 'report')
+        os.makedirs(report)
+        lines = ["myhost on 127.0.0.5 link/ether aa:bb:cc:dd:ee:ff\n", "db1.myserver.com on 127.0.0.6\n",
+                 "nas.myserver.com and myhost\n", "web.foo.com 127.0.0.5 127.0.0.7\n", "db1.myserver.com is back\n"]
+        for i, line in enumerate(lines):
+            with open(os.path.join(report, 'file%s' % i), 'w') as fh:
+                fh.write(line * 3)
+
+        def _cleaner(name):
+            cleaner = SOSCleaner(quiet=True)
+            cleaner._start_logging(os.devnull)
+            cleaner.session = os.path.join(test_dir, name)
+            cleaner.report_dir = test_dir
+            cleaner.dir_path = os.path.join(test_dir, name + '-work')
+            cleaner.origin_path = report
+            cleaner.report = report
+            cleaner.hostname = 'myhost'
+            cleaner.domains.extend(['myserver.com', 'foo.com'])
+            cleaner.obfuscate_macs = True
+            cleaner.checkpoint_batch = 1
+            cleaner._add_loopback_network()
+            cleaner._domains2db()
+            if not os.path.isdir(cleaner.dir_path):
+                shutil.copytree(report, cleaner.dir_path)
+            return cleaner, sorted(cleaner._file_list(cleaner.dir_path))
+
+        whole, files = _cleaner('whole')
+        whole._start_checkpoints()
+        random.seed(106)  # MAC addresses are obfuscated with random values
+        whole._clean_files(files)
+
+        stopped, files = _cleaner('stopped')
+        stopped._start_checkpoints()
+        clean_file = stopped._clean_file
+
+        def _stop_at_third(f, *args):
+            if f.endswith('file2'):
+                with open(f, 'w') as fh:
+                    fh.write('half cleaned')
+                open(os.path.join(stopped.dir_path, '.soscleaner-torn'), 'w').close()
+                raise KeyboardInterrupt()
+            clean_file(f, *args)
+        stopped._clean_file = _stop_at_third
+        random.seed(106)
+        with self.assertRaises(KeyboardInterrupt):
+            stopped._clean_files(files)
+        with open(stopped.checkpoints.path, 'a') as fh:
+            fh.write('{"file": "file2", "db": {"hn_')
+
+        # as clean_report does, the journal is loaded before listing the files
+        resumed = _cleaner('stopped')[0]
+        resumed.resume = resumed.session
+        records = resumed._load_checkpoints()
+        self.assertEqual([r.get('file') for r in records], [None, 'file0', 'file1'])
+        self.assertFalse(os.path.exists(os.path.join(resumed.dir_path, '.soscleaner-torn')))
+        files = sorted(resumed._file_list(resumed.dir_path))
+        left = resumed._resume_checkpoints(records, files)
+        self.assertEqual([os.path.basename(f) for f in left], ['file2', 'file3', 'file4'])
+        resumed._clean_files(left)
+
+        for f in files:
+            self.assertEqual(open(f).read(), open(f.replace('stopped-work', 'whole-work')).read())
+        for name in SOSCleaner.CHECKPOINT_DBS:
+            self.assertEqual(list(getattr(resumed, name).items()), list(getattr(whole, name).items()))
+        self.assertEqual(resumed.sub_counts, whole.sub_counts)
+        self.assertEqual(resumed.prefilter_counts, whole.prefilter_counts)
+        self.assertEqual(resumed.hostname_count, whole.hostname_count)
+        self.assertEqual(len(CheckpointJournal(resumed.checkpoints.path).load()), 6)
+        self.assertFalse('myhost' in open(files[2]).read())
+
+    def test107_parallel_macs_match_serial(self):
+        """With MAC addresses obfuscated, a parallel run finds the same hostnames and IPs as a serial one"""
+        rng = random.Random(107)
+        texts = list()
+        for i in range(6):
+            lines = list()
+            for j in range(20):
+                mac = '%02x:bb:cc:dd:ee:%02x' % (rng.randint(0, 255), rng.randint(0, 255))
+                # the obfuscated MAC address runs into what follows it
+                lines.append(rng.choice(['link %s.0.0.%s web%s.myserver.com\n' % (mac, j, j),
+                                         'lladdr %s.myserver.com and 10.0.0.%s\n' % (mac, j)]))
+            texts.append(''.join(lines))
+        cleaners = list()
+        for workers in 1, 3:
+            test_dir = '/tmp/soscleaner-macs-%s-testdir' % workers
+            os.makedirs(test_dir)
+            files = list()
+            for i, text in enumerate(texts):
+                files.append(os.path.join(test_dir, 'file%s' % i))
+                with open(files[-1], 'w') as fh:
+                    fh.write(text)
+            cleaner = SOSCleaner(quiet=True)
+            cleaner.logger = self.cleaner.logger
+            cleaner.hostname = 'myhost'
+            cleaner.domains.append('myserver.com')
+            cleaner.obfuscate_macs = True
+            cleaner._add_loopback_network()
+            cleaner._ip4_add_network('10.0.0.0/8')
+            cleaner._domains2db()
+            cleaner.workers = workers
+            cleaner.dir_path = test_dir
+            random.seed(107)  # MAC addresses are obfuscated with random values
+            cleaner._clean_files(files)
+            cleaner.cleaned = [open(f).read() for f in files]
+            cleaners.append(cleaner)
+        serial, parallel = cleaners
+        self.assertEqual(parallel.cleaned, serial.cleaned)
+        self.assertEqual(list(parallel.hn_db.items()), list(serial.hn_db.items()))
+        self.assertEqual(list(parallel.ip_db.items()), list(serial.ip_db.items()))
+        self.assertEqual(list(parallel.mac_db.items()), list(serial.mac_db.items()))
+        self.assertEqual(parallel.sub_counts, serial.sub_counts)
+
+    def test108_clean_cache_rerun_and_other_host(self):
+        """A rerun, or a report from another host, reuses the files that
+        don't contain anything only that run maps"""
+        from soscleaner import CleanCache
+        test_dir = '/tmp/soscleaner-cache-testdir'
+        os.makedirs(test_dir)
+        cache = CleanCache(os.path.join(test_dir, 'cache'), 1024 * 1024)
+        files = {
+            'messages': 'myhost sshd: connect from web.myserver.com\n',
+            'lastlog': 'alice pts/0 Mon Oct 12\n',
+            'dmesg': 'kernel: eth0 link up\n',
+            'installed_rpms': 'hostname-3.23-6.el9.x86_64 otherhost-1.0-1.noarch\n',
+            'notes': 'otherhost is down\n',
+        }
+
+        def _run(hostname, user):
+            cleaner = SOSCleaner(quiet=True)
+            cleaner.logger = self.cleaner.logger
+            cleaner.hostname = hostname
+            cleaner.domains = ['myserver.com']
+            cleaner._domains2db()
+            cleaner._add_loopback_network()
+            cleaner._user2db(user)
+            cleaner.clean_cache = cache
+            cleaned = dict()
+            for name in sorted(files):
+                path = os.path.join(test_dir, name)
+                fh = open(path, 'w')
+                fh.write(files[name])
+                fh.close()
+                cleaner._clean_file(path)
+                cleaned[name] = open(path).read()
+            return cleaner, cleaned
+
+        first, cleaned = _run('myhost', 'alice')
+        self.assertEqual(dict(first.cache_counts), {'misses': 5, 'stored': 5})
+        self.assertFalse('alice' in cleaned['lastlog'])
+
+        # the hostname and the users get new obfuscated values in every run
+        rerun, recleaned = _run('myhost', 'alice')
+        self.assertEqual(dict(rerun.cache_counts), {'misses': 2, 'stored': 2, 'hits': 3})
+        self.assertNotEqual(recleaned['lastlog'], cleaned['lastlog'])
+        self.assertEqual(recleaned['notes'], files['notes'])
+
+        # notes has the other host's name in it
+        other, cleaned = _run('otherhost', 'bob')
+        self.assertEqual(dict(other.cache_counts), {'misses': 3, 'stored': 3, 'hits': 2})
+        self.assertFalse('otherhost' in cleaned['notes'])
+        self.assertEqual(cleaned['installed_rpms'], files['installed_rpms'])
+        self.assertFalse('myserver' in cleaned['messages'])